@@ -3,7 +3,9 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from .models import (
     UsuarioProfile, Moto, Orden, Medicamento,
-    Despacho, OrdenMovimiento, Ruta, Reporte, Farmacia
+    Despacho, OrdenMovimiento, Ruta, RutaOrden, Reporte, Farmacia, EstadisticaDashboard,
+    AgregadoDespacho, AgregadoMovimiento, RegistroEliminado, ProcesamientoFoto, DireccionGeocodificada,
+    PosicionRepartidor, AvanceImportacion
 )
 
 
@@ -26,6 +28,7 @@ class UsuarioProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'rol', 'telefono', 'estado_turno', 'activo']
     list_filter = ['rol', 'estado_turno', 'activo']
     search_fields = ['user__username', 'user__first_name', 'user__last_name', 'rut']
+    readonly_fields = ['posicion_lat', 'posicion_lng', 'fecha_posicion']
 
 
 @admin.register(Moto)
@@ -42,9 +45,10 @@ class MedicamentoInline(admin.TabularInline):
 
 @admin.register(Farmacia)
 class FarmaciaAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'ciudad', 'telefono', 'activa']
+    list_display = ['nombre', 'ciudad', 'telefono', 'coordenadas_lat', 'coordenadas_lng', 'activa']
     list_filter = ['activa', 'ciudad']
     search_fields = ['nombre', 'direccion', 'ciudad']
+    readonly_fields = ['fecha_geocodificacion', 'geohash']
 
 
 @admin.register(Orden)
@@ -52,6 +56,7 @@ class OrdenAdmin(admin.ModelAdmin):
     list_display = ['id', 'cliente', 'estado_actual', 'prioridad', 'farmacia_origen', 'farmacia_destino', 'responsable', 'fecha_creacion']
     list_filter = ['estado_actual', 'prioridad', 'tipo', 'fecha_creacion', 'farmacia_origen', 'farmacia_destino']
     search_fields = ['cliente', 'direccion', 'telefono_cliente']
+    readonly_fields = ['fecha_geocodificacion', 'geohash']
     inlines = [MedicamentoInline]
 
 
@@ -69,12 +74,18 @@ class OrdenMovimientoAdmin(admin.ModelAdmin):
     search_fields = ['orden__cliente']
 
 
+class RutaOrdenInline(admin.TabularInline):
+    model = RutaOrden
+    extra = 0
+    raw_id_fields = ['orden']
+
+
 @admin.register(Ruta)
 class RutaAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'zona', 'repartidor', 'activa']
-    list_filter = ['activa', 'zona']
+    list_display = ['nombre', 'zona', 'repartidor', 'activa', 'generada']
+    list_filter = ['activa', 'generada', 'zona']
     search_fields = ['nombre', 'zona']
-    filter_horizontal = ['ordenes']
+    inlines = (RutaOrdenInline,)
 
 
 @admin.register(Reporte)
@@ -83,3 +94,54 @@ class ReporteAdmin(admin.ModelAdmin):
     list_filter = ['fecha']
     readonly_fields = ['tasa_exito']
 
+
+@admin.register(EstadisticaDashboard)
+class EstadisticaDashboardAdmin(admin.ModelAdmin):
+    list_display = ['clave', 'total_ordenes', 'total_despachos', 'despachos_entregado', 'repartidores_activos', 'motos_activas', 'fecha_actualizacion']
+    search_fields = ['clave']
+    readonly_fields = ['fecha_actualizacion']
+
+
+@admin.register(AgregadoDespacho)
+class AgregadoDespachoAdmin(admin.ModelAdmin):
+    list_display = ['granularidad', 'inicio', 'repartidor', 'farmacia', 'resultado', 'estado', 'cantidad']
+    list_filter = ['granularidad', 'resultado', 'estado']
+
+
+@admin.register(AgregadoMovimiento)
+class AgregadoMovimientoAdmin(admin.ModelAdmin):
+    list_display = ['granularidad', 'inicio', 'repartidor', 'estado', 'cantidad']
+    list_filter = ['granularidad', 'estado']
+
+
+@admin.register(RegistroEliminado)
+class RegistroEliminadoAdmin(admin.ModelAdmin):
+    list_display = ['modelo', 'objeto_id', 'repartidor', 'reasignado', 'fecha']
+    list_filter = ['modelo', 'reasignado']
+
+
+@admin.register(ProcesamientoFoto)
+class ProcesamientoFotoAdmin(admin.ModelAdmin):
+    list_display = ['despacho', 'estado', 'intentos', 'proximo_intento', 'fecha_actualizacion']
+    list_filter = ['estado']
+    readonly_fields = ['error']
+
+
+@admin.register(DireccionGeocodificada)
+class DireccionGeocodificadaAdmin(admin.ModelAdmin):
+    list_display = ['direccion', 'coordenadas_lat', 'coordenadas_lng', 'proveedor', 'aciertos', 'consultas', 'fecha_consulta']
+    list_filter = ['proveedor']
+    search_fields = ['direccion']
+
+
+@admin.register(PosicionRepartidor)
+class PosicionRepartidorAdmin(admin.ModelAdmin):
+    list_display = ['repartidor', 'fecha', 'lat', 'lng', 'precision_m']
+    list_select_related = ['repartidor__user']
+    raw_id_fields = ['repartidor']
+    date_hierarchy = 'fecha'
+
+
+@admin.register(AvanceImportacion)
+class AvanceImportacionAdmin(admin.ModelAdmin):
+    list_display = ['clave', 'procesados', 'primer_dia', 'ultimo_dia', 'fecha_actualizacion']
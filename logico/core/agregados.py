@@ -0,0 +1,282 @@
+"""
+Agregados por tramo de tiempo (hora y día local) de despachos y movimientos.
+
+AgregadoDespacho cuenta despachos por repartidor, farmacia de origen de la
+orden, resultado y estado; AgregadoMovimiento cuenta movimientos de órdenes
+por estado y repartidor. Las señales de Despacho y OrdenMovimiento aplican
+incrementos atómicos (F) sobre la fila de la hora y la del día al confirmar
+la transacción (transaction.on_commit), igual que core.estadisticas con el
+dashboard: las filas no quedan bloqueadas mientras dura la transacción que
+escribe. Un despacho cambia de fila cuando cambia
+cualquiera de sus dimensiones (también al cambiar la farmacia de origen de su
+orden, ver mover_farmacia).
+
+Las consultas de un rango usan tramos diarios para los días completos y
+tramos por hora para los extremos, de modo que leen pocas filas sin perder
+precisión. Las operaciones masivas (bulk_create, QuerySet.update) no
+disparan señales: después de usarlas hay que llamar a reconstruir().
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import AgregadoDespacho, AgregadoMovimiento, Despacho, Orden, OrdenMovimiento
+
+TAMANO_BATCH = 2000
+
+
+# ---------------------------------------------------------------------------
+# Tramos
+# ---------------------------------------------------------------------------
+
+def inicio_hora(momento):
+    return timezone.localtime(momento).replace(minute=0, second=0, microsecond=0)
+
+
+def inicio_dia(momento):
+    return timezone.make_aware(datetime.combine(timezone.localdate(momento), time.min))
+
+
+INICIOS = {
+    'hora': inicio_hora,
+    'dia': inicio_dia,
+}
+
+
+def _clave(granularidad, inicio, *dimensiones):
+    partes = [granularidad, str(int(inicio.timestamp()))]
+    partes += ['' if valor is None else str(valor) for valor in dimensiones]
+    return '|'.join(partes)
+
+
+def tramos(inicio, fin):
+    """Divide [inicio, fin) en (granularidad, desde, hasta): días completos y horas en los extremos"""
+    inicio = inicio_hora(inicio)
+    if inicio_hora(fin) != fin:
+        fin = inicio_hora(fin) + timedelta(hours=1)
+    if inicio >= fin:
+        return []
+
+    primer_dia = inicio_dia(inicio)
+    if primer_dia != inicio:
+        # Medianoche siguiente (sumar 36 h evita errores en cambios de horario)
+        primer_dia = inicio_dia(primer_dia + timedelta(hours=36))
+    ultimo_dia = inicio_dia(fin)
+
+    if primer_dia >= ultimo_dia:
+        return [('hora', inicio, fin)]
+    resultado = []
+    if inicio < primer_dia:
+        resultado.append(('hora', inicio, primer_dia))
+    resultado.append(('dia', primer_dia, ultimo_dia))
+    if ultimo_dia < fin:
+        resultado.append(('hora', ultimo_dia, fin))
+    return resultado
+
+
+def _filtro_tramos(inicio, fin):
+    filtro = Q(pk__in=[])
+    for granularidad, desde, hasta in tramos(inicio, fin):
+        filtro |= Q(granularidad=granularidad, inicio__gte=desde, inicio__lt=hasta)
+    return filtro
+
+
+# ---------------------------------------------------------------------------
+# Consultas
+# ---------------------------------------------------------------------------
+
+def contar(modelo, inicio, fin, agrupar_por=(), **filtros):
+    """Suma de cantidad en [inicio, fin) agrupada por las dimensiones pedidas"""
+    consulta = modelo.objects.filter(_filtro_tramos(inicio, fin), **filtros)
+    if not agrupar_por:
+        return consulta.aggregate(cantidad=Sum('cantidad'))['cantidad'] or 0
+    return consulta.values(*agrupar_por).annotate(cantidad=Sum('cantidad')).order_by(*agrupar_por)
+
+
+def serie_despachos(inicio, fin, granularidad='dia', **filtros):
+    """Despachos totales, exitosos y fallidos por tramo de [inicio, fin)"""
+    return AgregadoDespacho.objects.filter(
+        granularidad=granularidad, inicio__gte=inicio, inicio__lt=fin, **filtros
+    ).values('inicio').annotate(
+        total=Sum('cantidad'),
+        exitosas=Sum('cantidad', filter=Q(resultado='entregado')),
+        fallidas=Sum('cantidad', filter=Q(resultado__in=['no_disponible', 'error'])),
+    ).order_by('inicio')
+
+
+# ---------------------------------------------------------------------------
+# Incrementos (desde las señales)
+# ---------------------------------------------------------------------------
+
+def _incrementar(modelo, momento, dimensiones, delta):
+    """Suma delta a las filas de la hora y del día de momento al confirmar la transacción actual"""
+    filas = []
+    for granularidad, obtener_inicio in INICIOS.items():
+        inicio = obtener_inicio(momento)
+        filas.append((_clave(granularidad, inicio, *dimensiones.values()), granularidad, inicio))
+    transaction.on_commit(lambda: _aplicar_incremento(modelo, filas, dimensiones, delta))
+
+
+def _aplicar_incremento(modelo, filas, dimensiones, delta):
+    for clave, granularidad, inicio in filas:
+        actualizadas = modelo.objects.filter(clave=clave).update(cantidad=F('cantidad') + delta)
+        if actualizadas:
+            continue
+        try:
+            with transaction.atomic():
+                modelo.objects.create(
+                    clave=clave, granularidad=granularidad, inicio=inicio, cantidad=delta, **dimensiones
+                )
+        except IntegrityError:
+            # Otra transacción creó la fila en paralelo
+            modelo.objects.filter(clave=clave).update(cantidad=F('cantidad') + delta)
+
+
+CAMPOS_DESPACHO = ('resultado', 'repartidor_id', 'estado', 'orden_id')
+
+
+def estado_despacho(despacho):
+    """Dimensiones propias del despacho (la farmacia sale de su orden), o None si hay campos diferidos"""
+    try:
+        return tuple(despacho.__dict__[campo] for campo in CAMPOS_DESPACHO)
+    except KeyError:
+        return None
+
+
+def _farmacia_de(despacho, orden_id):
+    orden = despacho._state.fields_cache.get('orden')
+    if orden is not None and orden.pk == orden_id and 'farmacia_origen_id' in orden.__dict__:
+        return orden.farmacia_origen_id
+    return Orden.objects.filter(pk=orden_id).values_list('farmacia_origen_id', flat=True).first()
+
+
+def _dimensiones_despacho(estado, farmacia_id):
+    resultado, repartidor_id, estado_despacho, _ = estado
+    return {
+        'repartidor_id': repartidor_id,
+        'farmacia_id': farmacia_id,
+        'resultado': resultado or '',
+        'estado': estado_despacho,
+    }
+
+
+def aplicar_despacho(despacho, anterior, nuevo):
+    """Mueve el despacho entre tramos: anterior y nuevo son estado_despacho() o None"""
+    farmacias = {}
+    for estado, delta in ((anterior, -1), (nuevo, 1)):
+        if estado is None:
+            continue
+        orden_id = estado[3]
+        if orden_id not in farmacias:
+            farmacias[orden_id] = _farmacia_de(despacho, orden_id)
+        _incrementar(AgregadoDespacho, despacho.fecha, _dimensiones_despacho(estado, farmacias[orden_id]), delta)
+
+
+def mover_farmacia(orden_id, anterior, nueva):
+    """Pasa los despachos de la orden de la farmacia de origen anterior a la nueva"""
+    conteos = Counter(
+        (inicio_hora(fecha), repartidor_id, resultado or '', estado)
+        for fecha, repartidor_id, resultado, estado in Despacho.objects.filter(orden_id=orden_id).values_list(
+            'fecha', 'repartidor_id', 'resultado', 'estado'
+        )
+    )
+    for (hora, repartidor_id, resultado, estado), cantidad in conteos.items():
+        for farmacia_id, delta in ((anterior, -cantidad), (nueva, cantidad)):
+            _incrementar(AgregadoDespacho, hora, {
+                'repartidor_id': repartidor_id,
+                'farmacia_id': farmacia_id,
+                'resultado': resultado,
+                'estado': estado,
+            }, delta)
+
+
+def aplicar_movimiento(movimiento, delta):
+    _incrementar(AgregadoMovimiento, movimiento.timestamp, {
+        'repartidor_id': movimiento.repartidor_id,
+        'estado': movimiento.estado,
+    }, delta)
+
+
+def aplicar_movimientos_lote(movimientos):
+    """Suma movimientos creados con bulk_create, con un incremento por tramo"""
+    conteos = Counter(
+        (inicio_hora(movimiento.timestamp), movimiento.repartidor_id, movimiento.estado)
+        for movimiento in movimientos
+    )
+    for (hora, repartidor_id, estado), cantidad in conteos.items():
+        _incrementar(AgregadoMovimiento, hora, {'repartidor_id': repartidor_id, 'estado': estado}, cantidad)
+
+
+# ---------------------------------------------------------------------------
+# Reconstrucción
+# ---------------------------------------------------------------------------
+
+def _reconstruir_modelo(agregado, consulta, campo_fecha, dimensiones):
+    """Cuenta por hora UTC en la BD y asigna cada hora a sus tramos con inicio_hora/inicio_dia.
+
+    Así las claves coinciden con las de las señales: TruncHour en la zona
+    local juntaría las dos horas que se repiten al atrasar el reloj.
+    """
+    filas = consulta.annotate(tramo=TruncHour(campo_fecha, tzinfo=dt_timezone.utc)).values(
+        'tramo', *dimensiones.values()
+    ).annotate(total=Count('id')).order_by('tramo')
+
+    lote = []
+    # Las filas vienen ordenadas: cada tramo se acumula hasta que empieza el siguiente
+    actuales = dict.fromkeys(INICIOS)
+    conteos = {granularidad: Counter() for granularidad in INICIOS}
+
+    def cerrar(granularidad):
+        inicio = actuales[granularidad]
+        for valores, cantidad in conteos[granularidad].items():
+            valores = dict(zip(dimensiones, valores))
+            lote.append(agregado(
+                clave=_clave(granularidad, inicio, *valores.values()),
+                granularidad=granularidad,
+                inicio=inicio,
+                cantidad=cantidad,
+                **valores
+            ))
+        conteos[granularidad].clear()
+
+    for fila in filas.iterator(chunk_size=TAMANO_BATCH):
+        valores = tuple(
+            (fila[origen] or '') if campo == 'resultado' else fila[origen]
+            for campo, origen in dimensiones.items()
+        )
+        for granularidad, obtener_inicio in INICIOS.items():
+            inicio = obtener_inicio(fila['tramo'])
+            # Se compara el instante: en la hora repetida la hora local es la misma
+            if actuales[granularidad] is None or inicio.timestamp() != actuales[granularidad].timestamp():
+                if actuales[granularidad] is not None:
+                    cerrar(granularidad)
+                actuales[granularidad] = inicio
+            conteos[granularidad][valores] += fila['total']
+        if len(lote) >= TAMANO_BATCH:
+            agregado.objects.bulk_create(lote)
+            lote = []
+    for granularidad in INICIOS:
+        if actuales[granularidad] is not None:
+            cerrar(granularidad)
+    agregado.objects.bulk_create(lote)
+
+
+def reconstruir():
+    """Recalcula todos los agregados desde Despacho y OrdenMovimiento"""
+    with transaction.atomic():
+        AgregadoDespacho.objects.all().delete()
+        AgregadoMovimiento.objects.all().delete()
+        _reconstruir_modelo(AgregadoDespacho, Despacho.objects.all(), 'fecha', {
+            'repartidor_id': 'repartidor_id',
+            'farmacia_id': 'orden__farmacia_origen_id',
+            'resultado': 'resultado',
+            'estado': 'estado',
+        })
+        _reconstruir_modelo(AgregadoMovimiento, OrdenMovimiento.objects.all(), 'timestamp', {
+            'repartidor_id': 'repartidor_id',
+            'estado': 'estado',
+        })
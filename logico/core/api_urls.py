@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .api_views import (
     UsuarioViewSet, MotoViewSet, OrdenViewSet, MedicamentoViewSet,
-    DespachoViewSet, MovimientoViewSet, RutaViewSet, ReporteViewSet, FarmaciaViewSet
+    DespachoViewSet, MovimientoViewSet, RutaViewSet, ReporteViewSet, FarmaciaViewSet,
+    SincronizacionViewSet, OperacionesViewSet, PosicionViewSet
 )
 
 router = DefaultRouter()
@@ -15,6 +16,9 @@ router.register(r'movimientos', MovimientoViewSet, basename='movimiento')
 router.register(r'rutas', RutaViewSet, basename='ruta')
 router.register(r'reportes', ReporteViewSet, basename='reporte')
 router.register(r'farmacias', FarmaciaViewSet, basename='farmacia')
+router.register(r'sync', SincronizacionViewSet, basename='sync')
+router.register(r'operaciones', OperacionesViewSet, basename='operacion')
+router.register(r'posiciones', PosicionViewSet, basename='posicion')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,14 +1,20 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Q
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from .models import (
     UsuarioProfile, Moto, Orden, Medicamento, 
     Despacho, OrdenMovimiento, Ruta, Reporte, Farmacia
 )
+from . import asignacion, condicional, espacial, exportacion, ingesta, operaciones, posiciones, rutas, sincronizacion, zonas
+from .busqueda import BusquedaFilter
+from .espacial import CercaniaFilter
+from .paginacion import OrdenCursorPagination, DespachoCursorPagination, MovimientoCursorPagination
 from .serializers import (
     UsuarioProfileSerializer, MotoSerializer, OrdenSerializer,
     MedicamentoSerializer, DespachoSerializer, OrdenMovimientoSerializer,
@@ -16,7 +22,89 @@ from .serializers import (
 )
 
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class RelacionesViewSetMixin:
+    """Serializa solo los campos pedidos y precarga lo que necesitan.
+    
+    En las lecturas acepta ?fields=a,b (campos a incluir) y ?expand=c (campos
+    anidados a agregar); los listados usan la representación compacta del
+    serializer (campos_lista) y el detalle la completa. El queryset lee solo
+    esas columnas y hace solo las uniones y precargas que usan (ver
+    serializers.RelacionesMixin). Las escrituras usan siempre el serializer
+    completo.
+    """
+    
+    def campos_pedidos(self):
+        if not hasattr(self, '_campos_pedidos'):
+            serializer_class = self.get_serializer_class()
+            self._campos_pedidos = None
+            if self.request.method in SAFE_METHODS and hasattr(serializer_class, 'campos_pedidos'):
+                es_lista = self.action == 'list' or getattr(self, 'detail', None) is False
+                self._campos_pedidos = serializer_class.campos_pedidos(self.request.query_params, es_lista)
+        return self._campos_pedidos
+    
+    def columnas_orden(self, queryset):
+        """Columnas del orden del listado y de la paginación, que se leen de cada fila"""
+        ordenes = list(queryset.query.order_by) + list(queryset.model._meta.ordering)
+        for ordering in (getattr(self, 'ordering', None), getattr(self.paginator, 'ordering', None)):
+            if ordering:
+                ordenes += [ordering] if isinstance(ordering, str) else list(ordering)
+        return {campo.lstrip('-') for campo in ordenes if isinstance(campo, str)}
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['campos'] = self.campos_pedidos()
+        return context
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'preparar_queryset'):
+            queryset = serializer_class.preparar_queryset(
+                queryset, self.campos_pedidos(), columnas_extra=self.columnas_orden(queryset)
+            )
+        return queryset
+
+
+class GetCondicionalMixin:
+    """ETag en list y retrieve (ver core.condicional).
+    
+    Si el cliente envía If-None-Match con la versión vigente del recurso se
+    responde 304 antes de consultar el listado.
+    """
+    recurso_condicional = None
+    
+    def respuesta_condicional(self, request, handler, *args, **kwargs):
+        etag = quote_etag(condicional.etag(self.recurso_condicional, request))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            # Por usuario y siempre revalidado
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_condicional(request, super().list, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_condicional(request, super().retrieve, *args, **kwargs)
+
+
+class ExportacionMixin:
+    """Agrega GET .../exportar/?desde=&hasta=&formato=csv|jsonl&gzip=1 (ver core.exportacion)"""
+    tipo_exportacion = None
+    
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Exportar en streaming las filas de un rango de fechas"""
+        try:
+            return exportacion.respuesta_exportacion(self.tipo_exportacion, request.profile, request.query_params)
+        except exportacion.ExportacionInvalida as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UsuarioViewSet(RelacionesViewSetMixin, viewsets.ModelViewSet):
     queryset = UsuarioProfile.objects.all()
     serializer_class = UsuarioProfileSerializer
     permission_classes = [IsAuthenticated]
@@ -26,23 +114,16 @@ class UsuarioViewSet(viewsets.ModelViewSet):
     ordering_fields = ['fecha_creacion', 'user__username']
     
     def get_queryset(self):
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=self.request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = self.request.profile
         if user_profile.rol == 'repartidor':
             return UsuarioProfile.objects.filter(pk=user_profile.pk)
         return UsuarioProfile.objects.all()
 
 
-class MotoViewSet(viewsets.ModelViewSet):
+class MotoViewSet(GetCondicionalMixin, RelacionesViewSetMixin, viewsets.ModelViewSet):
     queryset = Moto.objects.all()
     serializer_class = MotoSerializer
+    recurso_condicional = 'motos'
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['estado', 'activa', 'marca']
@@ -53,15 +134,7 @@ class MotoViewSet(viewsets.ModelViewSet):
     def asignar(self, request, pk=None):
         """Asignar moto a repartidor - Solo coordinador o admin"""
         moto = self.get_object()
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = request.profile
         
         # Solo coordinador o admin pueden asignar motos
         if user_profile.rol == 'repartidor':
@@ -73,7 +146,7 @@ class MotoViewSet(viewsets.ModelViewSet):
             return Response({'error': 'repartidor_id es requerido'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            repartidor = UsuarioProfile.objects.get(pk=repartidor_id, rol='repartidor')
+            repartidor = UsuarioProfile.objects.select_related('user', 'moto').get(pk=repartidor_id, rol='repartidor')
         except UsuarioProfile.DoesNotExist:
             return Response({'error': 'Repartidor no encontrado'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -106,15 +179,7 @@ class MotoViewSet(viewsets.ModelViewSet):
     def desasignar(self, request, pk=None):
         """Desasignar moto de repartidor - Solo coordinador o admin"""
         moto = self.get_object()
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = request.profile
         
         # Solo coordinador o admin pueden desasignar motos
         if user_profile.rol == 'repartidor':
@@ -137,15 +202,7 @@ class MotoViewSet(viewsets.ModelViewSet):
     def mantenimiento(self, request, pk=None):
         """Marcar moto en mantenimiento - Solo coordinador o admin"""
         moto = self.get_object()
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = request.profile
         
         # Solo coordinador o admin pueden marcar motos en mantenimiento
         if user_profile.rol == 'repartidor':
@@ -160,42 +217,115 @@ class MotoViewSet(viewsets.ModelViewSet):
         return Response({'message': f'Moto {moto.patente} en mantenimiento'})
 
 
-class OrdenViewSet(viewsets.ModelViewSet):
+class OrdenViewSet(GetCondicionalMixin, RelacionesViewSetMixin, ExportacionMixin, viewsets.ModelViewSet):
     queryset = Orden.objects.all()
     serializer_class = OrdenSerializer
+    recurso_condicional = 'ordenes'
+    tipo_exportacion = 'ordenes'
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BusquedaFilter, OrderingFilter, CercaniaFilter]
     filterset_fields = ['estado_actual', 'prioridad', 'tipo', 'responsable']
     search_fields = ['cliente', 'direccion', 'telefono_cliente']
     ordering_fields = ['fecha_creacion', 'prioridad']
+    ordering = ['-fecha_creacion', '-id']
+    pagination_class = OrdenCursorPagination
     
     def get_queryset(self):
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=self.request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = self.request.profile
         if user_profile.rol == 'repartidor':
             return Orden.objects.filter(responsable=user_profile)
         return Orden.objects.all()
     
+    @action(detail=False, methods=['get'])
+    def pendientes_redespacho(self, request):
+        """Órdenes cuyo último despacho falló y esperan re-despacho"""
+        queryset = self.filter_queryset(self.get_queryset().pendientes_redespacho())
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """Crear varias órdenes con sus medicamentos en una sola transacción - Solo coordinador o admin"""
+        user_profile = request.profile
+        
+        if user_profile.rol == 'repartidor':
+            return Response({'error': 'No tienes permisos para cargar órdenes en lote'}, status=status.HTTP_403_FORBIDDEN)
+        
+        datos = request.data.get('ordenes') if isinstance(request.data, dict) else request.data
+        resultados = ingesta.crear_ordenes_lote(datos)
+        
+        creadas = sum(1 for resultado in resultados if 'id' in resultado)
+        if creadas == len(resultados):
+            codigo = status.HTTP_201_CREATED
+        elif creadas:
+            codigo = status.HTTP_207_MULTI_STATUS
+        else:
+            codigo = status.HTTP_400_BAD_REQUEST
+        
+        return Response({
+            'creadas': creadas,
+            'con_errores': len(resultados) - creadas,
+            'resultados': resultados,
+        }, status=codigo)
+    
+    @action(detail=False, methods=['post'])
+    def asignar_automaticamente(self, request):
+        """Asignar las órdenes sin responsable a los repartidores disponibles - Solo coordinador o admin"""
+        if request.profile.rol == 'repartidor':
+            return Response({'error': 'No tienes permisos para asignar repartidores'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            limite = int(request.data.get('limite', asignacion.LIMITE))
+            maximo = int(request.data.get('maximo_por_repartidor', asignacion.MAXIMO_POR_REPARTIDOR))
+        except (TypeError, ValueError):
+            return Response({'error': 'limite y maximo_por_repartidor deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limite <= 1000 or maximo < 1:
+            return Response({'error': 'limite debe estar entre 1 y 1000 y maximo_por_repartidor ser positivo'}, status=status.HTTP_400_BAD_REQUEST)
+        simular = str(request.data.get('simular', '')).lower() in ('1', 'true', 'si', 'sí')
+        
+        return Response(asignacion.asignar(limite, maximo, simular))
+    
+    @action(detail=False, methods=['get'])
+    def cercanas(self, request):
+        """Órdenes abiertas sin responsable cerca de la posición de un repartidor - Solo coordinador o admin
+        
+        ?repartidor= (obligatorio), radio_km (por defecto 5) y cantidad (las más cercanas, a lo sumo espacial.MAXIMO_CERCANOS).
+        """
+        if request.profile.rol == 'repartidor':
+            return Response({'error': 'No tienes permisos para ver órdenes sin asignar'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            repartidor_id = int(request.query_params['repartidor'])
+            radio = float(request.query_params.get('radio_km', asignacion.RADIO_CERCANAS_KM))
+            cantidad = request.query_params.get('cantidad')
+            cantidad = int(cantidad) if cantidad not in (None, '') else None
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'repartidor y cantidad deben ser enteros y radio_km un número'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < radio <= espacial.RADIO_MAXIMO_KM or (cantidad is not None and not 1 <= cantidad <= espacial.MAXIMO_CERCANOS):
+            return Response(
+                {'error': f'radio_km debe estar entre 0 y {espacial.RADIO_MAXIMO_KM} y cantidad entre 1 y {espacial.MAXIMO_CERCANOS}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        repartidor = UsuarioProfile.objects.filter(pk=repartidor_id, rol='repartidor').first()
+        if repartidor is None:
+            return Response({'error': 'Repartidor no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        
+        cercanas = asignacion.ordenes_cercanas(repartidor, radio, cantidad or espacial.MAXIMO_CERCANOS)
+        ordenes = OrdenSerializer.preparar_queryset(Orden.objects.all(), self.campos_pedidos())
+        serializer = self.get_serializer(espacial.anotar_distancias(ordenes, cercanas), many=True)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['post'])
     def cambiar_estado(self, request, pk=None):
         """Cambiar estado de orden"""
         orden = self.get_object()
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = request.profile
         
         nuevo_estado = request.data.get('estado')
         descripcion = request.data.get('descripcion', '')
@@ -212,7 +342,7 @@ class OrdenViewSet(viewsets.ModelViewSet):
             orden=orden,
             estado=nuevo_estado,
             descripcion=descripcion or f'Estado cambiado de {estado_anterior} a {nuevo_estado}',
-            repartidor=UsuarioProfile.objects.filter(user=request.user).first(),
+            repartidor=user_profile,
         )
         
         return Response({'message': f'Estado cambiado a {nuevo_estado}'})
@@ -221,15 +351,7 @@ class OrdenViewSet(viewsets.ModelViewSet):
     def asignar_repartidor(self, request, pk=None):
         """Asignar repartidor a orden - Solo coordinador o admin"""
         orden = self.get_object()
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = request.profile
         
         # Solo coordinador o admin pueden asignar repartidores
         if user_profile.rol == 'repartidor':
@@ -267,37 +389,51 @@ class OrdenViewSet(viewsets.ModelViewSet):
         return Response({'message': f'Repartidor {repartidor.user.get_full_name()} asignado'})
 
 
-class MedicamentoViewSet(viewsets.ModelViewSet):
+class MedicamentoViewSet(RelacionesViewSetMixin, viewsets.ModelViewSet):
     queryset = Medicamento.objects.all()
     serializer_class = MedicamentoSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, BusquedaFilter]
     filterset_fields = ['orden']
     search_fields = ['nombre', 'codigo']
 
 
-class DespachoViewSet(viewsets.ModelViewSet):
+class DespachoViewSet(GetCondicionalMixin, RelacionesViewSetMixin, ExportacionMixin, viewsets.ModelViewSet):
     queryset = Despacho.objects.all()
     serializer_class = DespachoSerializer
+    recurso_condicional = 'despachos'
+    tipo_exportacion = 'despachos'
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter, CercaniaFilter]
     filterset_fields = ['orden', 'estado', 'resultado', 'repartidor']
     ordering_fields = ['fecha', 'numero_despacho']
+    ordering = ['-fecha', '-id']
+    pagination_class = DespachoCursorPagination
     
     def get_queryset(self):
-        user_profile, _ = UsuarioProfile.objects.get_or_create(
-            user=self.request.user,
-            defaults={
-                'telefono': '',
-                'rol': 'repartidor',
-                'estado_turno': 'disponible',
-                'activo': True,
-            }
-        )
+        user_profile = self.request.profile
         if user_profile.rol == 'repartidor':
             return Despacho.objects.filter(repartidor=user_profile)
         return Despacho.objects.all()
     
+    @action(detail=False, methods=['get'])
+    def ultimos(self, request):
+        """Último intento de cada orden, con total_intentos (mismos filtros que el listado)"""
+        queryset = self.get_queryset()
+        if request.profile.rol == 'repartidor':
+            queryset = queryset.ultimos_por_orden_filtrados()
+        else:
+            queryset = queryset.ultimos_por_orden()
+        queryset = self.filter_queryset(queryset.con_total_intentos())
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['post'])
     def registrar_resultado(self, request, pk=None):
         """Registrar resultado de despacho"""
@@ -341,21 +477,24 @@ class DespachoViewSet(viewsets.ModelViewSet):
         return Response({'message': f'Resultado registrado: {resultado}'})
 
 
-class MovimientoViewSet(viewsets.ReadOnlyModelViewSet):
+class MovimientoViewSet(RelacionesViewSetMixin, ExportacionMixin, viewsets.ReadOnlyModelViewSet):
     queryset = OrdenMovimiento.objects.all()
     serializer_class = OrdenMovimientoSerializer
+    tipo_exportacion = 'movimientos'
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['orden', 'estado', 'repartidor']
     ordering_fields = ['timestamp']
+    ordering = ['-timestamp', '-id']
+    pagination_class = MovimientoCursorPagination
 
 
-class RutaViewSet(viewsets.ModelViewSet):
+class RutaViewSet(RelacionesViewSetMixin, viewsets.ModelViewSet):
     queryset = Ruta.objects.all()
     serializer_class = RutaSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['activa', 'zona', 'repartidor']
+    filterset_fields = ['activa', 'generada', 'zona', 'repartidor']
     search_fields = ['nombre', 'zona']
     ordering_fields = ['fecha_creacion', 'nombre']
     
@@ -367,11 +506,45 @@ class RutaViewSet(viewsets.ModelViewSet):
         if url:
             return Response({'url': url})
         return Response({'error': 'La ruta no tiene órdenes'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['post'])
+    def optimizar(self, request, pk=None):
+        """Recalcular el orden de visita de las paradas (opcional: origen_lat y origen_lng)"""
+        ruta = self.get_object()
+        origen = None
+        lat, lng = request.data.get('origen_lat'), request.data.get('origen_lng')
+        if lat not in (None, '') or lng not in (None, ''):
+            try:
+                origen = (float(lat), float(lng))
+            except (TypeError, ValueError):
+                return Response({'error': 'origen_lat y origen_lng deben ser números'}, status=status.HTTP_400_BAD_REQUEST)
+            if not (-90 <= origen[0] <= 90 and -180 <= origen[1] <= 180):
+                return Response({'error': 'Coordenadas de origen fuera de rango'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(rutas.optimizar(ruta, origen))
+    
+    @action(detail=False, methods=['post'])
+    def generar(self, request):
+        """Agrupar las órdenes pendientes en zonas y crear o actualizar sus rutas - Solo coordinador o admin"""
+        if request.profile.rol == 'repartidor':
+            return Response({'error': 'No tienes permisos para generar rutas'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            tamano = int(request.data.get('tamano', zonas.TAMANO_ZONA))
+            cantidad = request.data.get('zonas')
+            cantidad = int(cantidad) if cantidad not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({'error': 'tamano y zonas deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+        if tamano < 1 or (cantidad is not None and cantidad < 1):
+            return Response({'error': 'tamano y zonas deben ser positivos'}, status=status.HTTP_400_BAD_REQUEST)
+        optimizar = str(request.data.get('optimizar', 'true')).lower() not in ('0', 'false', 'no')
+        
+        return Response(zonas.generar(tamano, cantidad, optimizar))
 
 
-class ReporteViewSet(viewsets.ModelViewSet):
+class ReporteViewSet(RelacionesViewSetMixin, ExportacionMixin, viewsets.ModelViewSet):
     queryset = Reporte.objects.all()
     serializer_class = ReporteSerializer
+    tipo_exportacion = 'reportes'
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['fecha']
@@ -399,12 +572,102 @@ class ReporteViewSet(viewsets.ModelViewSet):
         return response
 
 
-class FarmaciaViewSet(viewsets.ModelViewSet):
+class FarmaciaViewSet(GetCondicionalMixin, RelacionesViewSetMixin, viewsets.ModelViewSet):
     queryset = Farmacia.objects.filter(activa=True)
     serializer_class = FarmaciaSerializer
+    recurso_condicional = 'farmacias'
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter, CercaniaFilter]
     filterset_fields = ['activa', 'ciudad']
     search_fields = ['nombre', 'direccion', 'ciudad']
     ordering_fields = ['nombre', 'ciudad']
 
+
+
+class SincronizacionViewSet(viewsets.ViewSet):
+    """Cambios desde el último cursor para los dispositivos (ver core.sincronizacion).
+    
+    GET /api/sync/?cursor=&limite= devuelve ordenes, despachos, medicamentos,
+    movimientos, eliminados, cursor y hay_mas; sin cursor, todo el alcance.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def list(self, request):
+        try:
+            limite = int(request.query_params.get('limite', sincronizacion.LIMITE_POR_DEFECTO))
+        except ValueError:
+            return Response({'error': 'limite debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+        limite = max(1, min(limite, sincronizacion.LIMITE_MAXIMO))
+        try:
+            datos = sincronizacion.cambios(
+                request.profile, request.query_params.get('cursor'), limite, request=request
+            )
+        except sincronizacion.SincronizacionInvalida as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response(datos)
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+
+
+class OperacionesViewSet(viewsets.ViewSet):
+    """Varias operaciones de la API en una petición y una transacción (ver core.operaciones).
+    
+    POST /api/operaciones/ con {"operaciones": [{"metodo", "url", "datos", "archivos"}, ...]}
+    devuelve el status y los datos de cada una; si alguna falla no se aplica ninguna.
+    """
+    permission_classes = [IsAuthenticated]
+    operaciones_en_lote = False
+    
+    def create(self, request):
+        try:
+            resultados, fallida = operaciones.ejecutar(request, operaciones.leer_operaciones(request.data))
+        except operaciones.OperacionInvalida as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        if fallida is not None:
+            return Response(
+                {'fallida': fallida, 'resultados': resultados}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'resultados': resultados})
+
+
+class PosicionViewSet(viewsets.ViewSet):
+    """Posiciones GPS de los repartidores (ver core.posiciones).
+    
+    POST /api/posiciones/ con {"posiciones": [{"lat", "lng", "fecha", "precision"}, ...]}
+    (solo repartidores) agrega al historial las válidas y devuelve registradas y errores.
+    GET /api/posiciones/ devuelve la última posición conocida de los repartidores en
+    turno (al repartidor, solo la suya).
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def create(self, request):
+        if request.profile.rol != 'repartidor':
+            return Response({'error': 'Solo los repartidores envían posiciones'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            validas, errores = posiciones.leer_lote(request.data)
+        except posiciones.PosicionesInvalidas as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        if not validas:
+            return Response({'registradas': 0, 'errores': errores}, status=status.HTTP_400_BAD_REQUEST)
+        registradas = posiciones.registrar(request.profile.pk, validas)
+        return Response({'registradas': registradas, 'errores': errores}, status=status.HTTP_201_CREATED)
+    
+    def list(self, request):
+        if request.profile.rol == 'repartidor':
+            ultima = posiciones.ultimas_posiciones([request.profile.pk]).get(request.profile.pk)
+            repartidores = [(request.profile, ultima)]
+        else:
+            repartidores = posiciones.en_turno()
+        response = Response({'posiciones': [
+            {
+                'repartidor': repartidor.pk,
+                'nombre': repartidor.user.get_full_name() or repartidor.user.username,
+                'estado_turno': repartidor.estado_turno,
+                'lat': ultima[0] if ultima else None,
+                'lng': ultima[1] if ultima else None,
+                'fecha': ultima[2] if ultima else None,
+            }
+            for repartidor, ultima in repartidores
+        ]})
+        patch_cache_control(response, private=True, no_store=True)
+        return response
@@ -0,0 +1,199 @@
+"""
+Asignación automática de órdenes a repartidores.
+
+Toma las órdenes abiertas sin responsable y los repartidores disponibles
+(activos, en turno disponible y con moto) y reparte en lote: las órdenes se
+recorren por prioridad (alta primero) y antigüedad, y cada una va al
+repartidor de menor costo, que suma la distancia desde su posición actual y
+PESO_CARGA_KM por cada orden abierta que ya tiene. Un repartidor con
+maximo_por_repartidor órdenes abiertas no recibe más. Tras cada asignación
+la posición del repartidor pasa a ser la de la orden, de modo que las
+siguientes tienden a agruparse en su zona.
+
+La posición de un repartidor es la última conocida (ver core.posiciones: la
+envía su dispositivo o la toma de sus despachos) si no tiene más de
+VIGENCIA_POSICION; sin posición (o si la orden no tiene
+coordenadas, ver core.geocodificacion) la distancia cuenta como
+DISTANCIA_SIN_POSICION_KM (o 0) y decide la carga.
+
+Todo se escribe en una transacción: un UPDATE por repartidor, los
+movimientos con bulk_create y, como no hay señales, los deltas de
+estadísticas y agregados, las versiones de la API y la sincronización de
+los dispositivos. En PostgreSQL las órdenes se bloquean al leerlas (SKIP
+LOCKED), así que dos ejecuciones simultáneas no asignan la misma orden.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils import timezone
+
+from . import agregados, condicional, espacial, estadisticas, posiciones as posiciones_gps, sincronizacion
+from .models import Orden, OrdenMovimiento, UsuarioProfile
+from .rutas import matriz_distancias
+
+LIMITE = 200
+MAXIMO_POR_REPARTIDOR = 8
+PESO_CARGA_KM = 2.0
+DISTANCIA_SIN_POSICION_KM = 10.0
+VIGENCIA_POSICION = timedelta(hours=4)
+RADIO_CERCANAS_KM = 5.0
+RANGO_PRIORIDAD = {'alta': 0, 'media': 1, 'baja': 2}
+
+
+def repartidores_disponibles():
+    return UsuarioProfile.objects.filter(
+        rol='repartidor', activo=True, estado_turno='disponible',
+        moto__isnull=False, user__is_superuser=False,
+    ).select_related('user').order_by('id')
+
+
+def posiciones(repartidores):
+    """{repartidor_id: (lat, lng)} de la última posición conocida dentro de VIGENCIA_POSICION"""
+    desde = timezone.now() - VIGENCIA_POSICION
+    return {
+        repartidor_id: (lat, lng)
+        for repartidor_id, (lat, lng, fecha) in posiciones_gps.ultimas_posiciones(
+            repartidor.pk for repartidor in repartidores
+        ).items()
+        if fecha >= desde
+    }
+
+
+def ordenes_cercanas(repartidor, radio_km=RADIO_CERCANAS_KM, cantidad=None):
+    """[(orden_id, km)] de las órdenes abiertas sin responsable cerca del repartidor ([] sin posición).
+
+    Con cantidad, las cantidad más cercanas dentro de radio_km (ver core.espacial).
+    """
+    posicion = posiciones([repartidor]).get(repartidor.pk)
+    if posicion is None:
+        return []
+    ordenes = Orden.objects.abiertas().filter(responsable__isnull=True)
+    if cantidad is None:
+        return espacial.en_radio(ordenes, *posicion, radio_km)
+    return espacial.mas_cercanos(ordenes, *posicion, cantidad, radio_maximo_km=radio_km)
+
+
+def carga(repartidores):
+    """{repartidor_id: órdenes abiertas de las que es responsable}"""
+    return dict(
+        Orden.objects.abiertas().filter(responsable__in=repartidores)
+        .order_by().values_list('responsable').annotate(total=Count('id'))
+    )
+
+
+def ordenes_sin_asignar(limite, bloquear=False):
+    rango = Case(
+        *[When(prioridad=prioridad, then=Value(valor)) for prioridad, valor in RANGO_PRIORIDAD.items()],
+        default=Value(len(RANGO_PRIORIDAD)),
+        output_field=IntegerField(),
+    )
+    ordenes = Orden.objects.abiertas().filter(responsable__isnull=True).annotate(
+        rango_prioridad=rango
+    ).order_by('rango_prioridad', 'fecha_creacion', 'id').only(
+        'id', 'estado_actual', 'prioridad', 'responsable', 'coordenadas_lat', 'coordenadas_lng'
+    )
+    if bloquear:
+        # of: la unión con el último despacho es LEFT JOIN y no se puede bloquear
+        ordenes = ordenes.select_for_update(skip_locked=True, of=('self',))
+    return list(ordenes[:limite])
+
+
+def calcular(ordenes, repartidores, cargas, ubicaciones, maximo_por_repartidor=MAXIMO_POR_REPARTIDOR):
+    """[(orden, repartidor, distancia_km o None)] en el orden en que se asignaron"""
+    if not ordenes or not repartidores:
+        return []
+    carga_actual = np.array([cargas.get(repartidor.pk, 0) for repartidor in repartidores], dtype=float)
+    puntos = np.array([
+        (float(orden.coordenadas_lat), float(orden.coordenadas_lng))
+        if orden.coordenadas_lat is not None and orden.coordenadas_lng is not None else (np.nan, np.nan)
+        for orden in ordenes
+    ])
+    ubicadas = ~np.isnan(puntos[:, 0])
+    posicion = np.array([ubicaciones.get(repartidor.pk, (np.nan, np.nan)) for repartidor in repartidores], dtype=float)
+
+    # distancias[i, j]: de la posición del repartidor j a la orden i
+    distancias = np.full((len(ordenes), len(repartidores)), DISTANCIA_SIN_POSICION_KM)
+    distancias[~ubicadas] = 0.0
+
+    def actualizar(columna):
+        if ubicadas.any() and not np.isnan(posicion[columna, 0]):
+            distancias[ubicadas, columna] = matriz_distancias(puntos[ubicadas], posicion[columna])[:, 0]
+
+    for columna in range(len(repartidores)):
+        actualizar(columna)
+
+    asignaciones = []
+    for fila, orden in enumerate(ordenes):
+        costos = distancias[fila] + PESO_CARGA_KM * carga_actual
+        costos[carga_actual >= maximo_por_repartidor] = np.inf
+        columna = int(np.argmin(costos))
+        if np.isinf(costos[columna]):
+            break  # todos completos
+        conocida = ubicadas[fila] and not np.isnan(posicion[columna, 0])
+        asignaciones.append((orden, repartidores[columna], float(distancias[fila, columna]) if conocida else None))
+        carga_actual[columna] += 1
+        if ubicadas[fila]:
+            posicion[columna] = puntos[fila]
+            actualizar(columna)
+    return asignaciones
+
+
+def _guardar(asignaciones):
+    ahora = timezone.now()
+    por_repartidor = defaultdict(list)
+    for orden, repartidor, _ in asignaciones:
+        por_repartidor[repartidor.pk].append(orden.pk)
+    for repartidor_id, ordenes in por_repartidor.items():
+        Orden.objects.filter(pk__in=ordenes).update(responsable_id=repartidor_id, fecha_actualizacion=ahora)
+
+    movimientos = [
+        OrdenMovimiento(
+            orden_id=orden.pk,
+            estado=orden.estado_actual,
+            descripcion=f'Repartidor asignado automáticamente: {repartidor.user.get_full_name()}',
+            repartidor=repartidor,
+        )
+        for orden, repartidor, _ in asignaciones
+    ]
+    OrdenMovimiento.objects.bulk_create(movimientos)
+
+    deltas = defaultdict(Counter)
+    for orden, repartidor, _ in asignaciones:
+        cambio = estadisticas.calcular_deltas(
+            Orden, (orden.estado_actual, None), (orden.estado_actual, repartidor.pk)
+        )
+        for repartidor_id, campos in cambio.items():
+            deltas[repartidor_id].update(campos)
+    estadisticas.aplicar_deltas(deltas)
+    agregados.aplicar_movimientos_lote(movimientos)
+    condicional.incrementar(*condicional.recursos_de(Orden))
+    sincronizacion.registrar_asignaciones({orden.pk: repartidor.pk for orden, repartidor, _ in asignaciones})
+
+
+def asignar(limite=LIMITE, maximo_por_repartidor=MAXIMO_POR_REPARTIDOR, simular=False):
+    """Asigna hasta limite órdenes sin responsable; con simular solo calcula. Devuelve un resumen"""
+    with transaction.atomic():
+        ordenes = ordenes_sin_asignar(limite, bloquear=not simular)
+        repartidores = list(repartidores_disponibles()) if ordenes else []
+        asignaciones = calcular(
+            ordenes, repartidores, carga(repartidores), posiciones(repartidores), maximo_por_repartidor
+        ) if repartidores else []
+        if asignaciones and not simular:
+            _guardar(asignaciones)
+
+    return {
+        'simulacion': simular,
+        'asignadas': len(asignaciones),
+        'sin_asignar': len(ordenes) - len(asignaciones),
+        'asignaciones': [
+            {
+                'orden': orden.pk,
+                'repartidor': repartidor.pk,
+                'distancia_km': None if distancia is None else round(distancia, 3),
+            }
+            for orden, repartidor, distancia in asignaciones
+        ],
+    }
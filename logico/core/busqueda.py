@@ -0,0 +1,147 @@
+"""
+Búsqueda de órdenes y medicamentos.
+
+En PostgreSQL las columnas de texto tienen índices GIN de trigramas
+(pg_trgm, migración 0008) sobre UPPER(columna), que es la expresión que
+genera icontains, de modo que el filtro usa el índice en vez de recorrer la
+tabla; los resultados se ordenan por similitud de trigramas. En otros
+motores (SQLite en desarrollo) se usa el mismo filtro icontains y un puntaje
+fijo por tipo de coincidencia.
+
+Los teléfonos se buscan por prefijo sobre Orden.telefono_normalizado (solo
+dígitos, sin código de país), que tiene un índice B-tree.
+
+El puntaje queda anotado como entero en CAMPO_RANGO para poder paginar por
+keyset sobre él.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+from rest_framework.filters import SearchFilter
+
+CAMPO_RANGO = 'rango'
+RANGO_MAXIMO = 1000
+CODIGO_PAIS = '56'
+LARGO_TELEFONO = 9
+MINIMO_DIGITOS_TELEFONO = 3
+
+
+def normalizar_telefono(telefono):
+    """Deja solo los dígitos del teléfono, sin el código de país"""
+    telefono = (telefono or '').strip()
+    digitos = re.sub(r'\D', '', telefono)
+    con_codigo = len(digitos) > LARGO_TELEFONO or telefono.startswith('+')
+    if con_codigo and digitos.startswith(CODIGO_PAIS):
+        digitos = digitos[len(CODIGO_PAIS):]
+    return digitos
+
+
+def _termino_telefono(termino):
+    """Prefijo de teléfono si el término parece un número, si no None"""
+    if re.search(r'[^\d\s+()\-.]', termino):
+        return None
+    digitos = normalizar_telefono(termino)
+    return digitos if len(digitos) >= MINIMO_DIGITOS_TELEFONO else None
+
+
+def _usa_trigramas(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def _similitud(*expresiones):
+    similitud = expresiones[0] if len(expresiones) == 1 else Greatest(*expresiones)
+    return Cast(similitud * RANGO_MAXIMO, IntegerField())
+
+
+def buscar_ordenes(queryset, termino):
+    """Filtra órdenes por cliente, dirección o teléfono y anota el rango"""
+    termino = termino.strip()
+    if not termino:
+        return queryset
+
+    filtro = Q(cliente__icontains=termino) | Q(direccion__icontains=termino)
+    telefono = _termino_telefono(termino)
+    if telefono:
+        filtro |= Q(telefono_normalizado__startswith=telefono)
+
+    if _usa_trigramas(queryset):
+        from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+        rango = _similitud(
+            TrigramSimilarity('cliente', termino),
+            TrigramWordSimilarity(termino, 'direccion'),
+        )
+    else:
+        rango = Case(
+            When(cliente__iexact=termino, then=Value(RANGO_MAXIMO)),
+            When(cliente__istartswith=termino, then=Value(800)),
+            When(cliente__icontains=termino, then=Value(600)),
+            When(direccion__icontains=termino, then=Value(400)),
+            default=Value(0),
+        )
+
+    if telefono:
+        rango = Case(
+            When(telefono_normalizado__startswith=telefono, then=Value(RANGO_MAXIMO)),
+            default=rango,
+        )
+
+    return queryset.filter(filtro).annotate(**{CAMPO_RANGO: rango})
+
+
+def buscar_medicamentos(queryset, termino):
+    """Filtra medicamentos por nombre o código y anota el rango"""
+    termino = termino.strip()
+    if not termino:
+        return queryset
+
+    filtro = Q(nombre__icontains=termino) | Q(codigo__icontains=termino)
+
+    if _usa_trigramas(queryset):
+        from django.contrib.postgres.search import TrigramSimilarity
+        rango = Case(
+            When(codigo__iexact=termino, then=Value(RANGO_MAXIMO)),
+            default=_similitud(
+                TrigramSimilarity('nombre', termino),
+                TrigramSimilarity('codigo', termino),
+            ),
+        )
+    else:
+        rango = Case(
+            When(codigo__iexact=termino, then=Value(RANGO_MAXIMO)),
+            When(codigo__istartswith=termino, then=Value(800)),
+            When(nombre__istartswith=termino, then=Value(700)),
+            When(nombre__icontains=termino, then=Value(500)),
+            default=Value(400),
+        )
+
+    return queryset.filter(filtro).annotate(**{CAMPO_RANGO: rango})
+
+
+BUSCADORES = {
+    'core.Orden': buscar_ordenes,
+    'core.Medicamento': buscar_medicamentos,
+}
+
+
+def buscar(queryset, termino):
+    """Aplica el buscador del modelo del queryset, ordenado por relevancia"""
+    buscador = BUSCADORES[queryset.model._meta.label]
+    resultado = buscador(queryset, termino)
+    if resultado is queryset:
+        return queryset
+    return resultado.order_by(f'-{CAMPO_RANGO}', *queryset.model._meta.ordering, '-id')
+
+
+class BusquedaFilter(SearchFilter):
+    """Reemplaza el SearchFilter de DRF por el buscador indexado del modelo.
+
+    Los modelos sin buscador registrado siguen usando search_fields.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if queryset.model._meta.label not in BUSCADORES:
+            return super().filter_queryset(request, queryset, view)
+        termino = request.query_params.get(self.search_param, '')
+        return buscar(queryset, termino.replace('\x00', ''))
@@ -0,0 +1,82 @@
+"""
+GET condicional (ETag) para los recursos de la API.
+
+Cada recurso tiene una fila en VersionRecurso con un contador que las señales
+incrementan al guardar o eliminar cualquier modelo que aparezca en su
+representación (por ejemplo, un despacho cambia total_despachos de su orden
+y el nombre de un repartidor aparece en órdenes, despachos y motos). Validar
+una petición cuesta leer esa fila: si el cliente ya tiene la versión vigente
+se responde 304 sin consultar el listado ni ejecutar el serializer.
+
+El contador se incrementa al confirmar la transacción que originó el cambio
+(transaction.on_commit), en una sentencia propia: el bloqueo de la fila dura
+un UPDATE y no toda la transacción de quien escribe.
+
+No se envía Last-Modified: su precisión de un segundo daría 304 con datos
+viejos a quien consultó en el mismo segundo de un cambio. La versión del
+ETag es exacta.
+
+Las operaciones masivas (bulk_create, QuerySet.update) no disparan señales:
+quien las use debe llamar a incrementar().
+"""
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VersionRecurso
+
+# Recurso -> modelos que aparecen en su representación
+DEPENDENCIAS = {
+    # auth.User: los nombres de responsables y repartidores salen del usuario
+    'ordenes': ('core.Orden', 'core.Medicamento', 'core.Despacho', 'core.Farmacia', 'core.UsuarioProfile', 'auth.User'),
+    'despachos': ('core.Despacho', 'core.Orden', 'core.UsuarioProfile', 'auth.User'),
+    'motos': ('core.Moto', 'core.UsuarioProfile', 'auth.User'),
+    'farmacias': ('core.Farmacia',),
+}
+
+
+def recursos_de(modelo):
+    """Recursos cuya representación incluye el modelo"""
+    etiqueta = modelo._meta.label
+    return [recurso for recurso, modelos in DEPENDENCIAS.items() if etiqueta in modelos]
+
+
+def incrementar(*recursos):
+    """Incrementa la versión de los recursos al confirmar la transacción actual"""
+    if recursos:
+        transaction.on_commit(lambda: _incrementar(recursos))
+
+
+def _incrementar(recursos):
+    ahora = timezone.now()
+    for recurso in recursos:
+        actualizadas = VersionRecurso.objects.filter(clave=recurso).update(
+            version=F('version') + 1, fecha_actualizacion=ahora
+        )
+        if actualizadas:
+            continue
+        try:
+            with transaction.atomic():
+                VersionRecurso.objects.create(clave=recurso, version=1)
+        except IntegrityError:
+            # Otra transacción creó la fila en paralelo
+            VersionRecurso.objects.filter(clave=recurso).update(
+                version=F('version') + 1, fecha_actualizacion=ahora
+            )
+
+
+def etag(recurso, request):
+    """ETag de la respuesta a request sobre el recurso.
+    
+    Distingue además al usuario (los repartidores ven solo lo suyo), la URL
+    con sus parámetros, el formato y el día (dias_sin_mantenimiento cambia
+    sin que nada se guarde).
+    """
+    version = VersionRecurso.objects.filter(clave=recurso).values_list('version', flat=True).first() or 0
+    partes = [
+        recurso, str(version), str(timezone.localdate()), str(request.user.pk),
+        request.get_full_path(), getattr(request, 'accepted_media_type', '') or '',
+    ]
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
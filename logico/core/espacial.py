@@ -0,0 +1,363 @@
+"""
+Consultas de proximidad sobre órdenes, despachos y farmacias.
+
+Orden, Despacho y Farmacia guardan el geohash de sus coordenadas (columna
+geohash, indexada, PRECISION_GEOHASH caracteres, unos 5 m). Cada prefijo de
+un geohash es una celda que lo contiene, así que los puntos a menos de r km
+de otro están en su celda del largo cuyo lado mide al menos r o en una de
+sus 8 vecinas: una búsqueda por radio es un filtro geohash__startswith sobre
+esos 9 prefijos (usa el índice) y luego la distancia exacta (haversine) de
+los pocos candidatos. Los más cercanos se buscan con radios crecientes.
+
+Las farmacias activas, pocas y que casi no cambian, se consultan además en
+memoria: IndiceEspacial las reparte en una grilla de celdas de
+TAMANO_CELDA_KM y recorre solo las celdas alrededor del punto. El índice se
+reconstruye cuando cambia la versión del recurso 'farmacias' (ver
+core.condicional), que las señales incrementan al guardar o eliminar una y
+geocodificar_pendientes al geocodificar en lote, también en otros procesos.
+
+Las operaciones masivas deben llamar a asignar_geohash (las señales lo
+hacen al guardar).
+"""
+import math
+
+import numpy as np
+from django.db.models import Case, FloatField, Q, Value, When
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Farmacia, VersionRecurso
+from .rutas import matriz_distancias
+
+PRECISION_GEOHASH = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+KM_POR_GRADO_LAT = 110.57
+KM_POR_GRADO_LNG = 111.32
+RADIO_INICIAL_KM = 1.0
+RADIO_MAXIMO_KM = 50.0
+TAMANO_CELDA_KM = 2.0
+CANTIDAD_CERCANOS = 10
+MAXIMO_CERCANOS = 100
+CAMPO_DISTANCIA = 'distancia_km'
+
+_indices = {}
+
+
+# ---------------------------------------------------------------------------
+# Geohash
+# ---------------------------------------------------------------------------
+
+def codificar(lat, lng, precision=PRECISION_GEOHASH):
+    """Geohash de (lat, lng), '' sin coordenadas"""
+    if lat is None or lng is None:
+        return ''
+    lat, lng = float(lat), float(lng)
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    caracteres = []
+    bits = valor = 0
+    par = True  # los bits alternan longitud, latitud
+    while len(caracteres) < precision:
+        rango, coordenada = (rango_lng, lng) if par else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            caracteres.append(BASE32[valor])
+            bits = valor = 0
+    return ''.join(caracteres)
+
+
+def tamano_celda(precision):
+    """(alto, ancho) en grados de una celda de geohash de ese largo"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def prefijos_radio(lat, lng, radio_km):
+    """Prefijos de geohash que cubren el círculo; [] si el radio es mayor que una celda de un carácter"""
+    # El ancho en km de las celdas se mide en el paralelo más alejado del ecuador que toca el círculo
+    paralelo = min(abs(lat) + radio_km / KM_POR_GRADO_LAT, 89.9)
+    coseno = math.cos(math.radians(paralelo))
+    precision = PRECISION_GEOHASH
+    while precision:
+        alto, ancho = tamano_celda(precision)
+        if alto * KM_POR_GRADO_LAT >= radio_km and ancho * KM_POR_GRADO_LNG * coseno >= radio_km:
+            break
+        precision -= 1
+    if not precision:
+        return []
+    prefijos = set()
+    for fila in (-1, 0, 1):
+        vecina_lat = lat + fila * alto
+        if not -90 <= vecina_lat <= 90:
+            continue
+        for columna in (-1, 0, 1):
+            vecina_lng = (lng + columna * ancho + 180) % 360 - 180
+            prefijos.add(codificar(vecina_lat, vecina_lng, precision))
+    return sorted(prefijos)
+
+
+def asignar_geohash(instance):
+    instance.geohash = codificar(instance.coordenadas_lat, instance.coordenadas_lng)
+
+
+# ---------------------------------------------------------------------------
+# Consultas sobre la base de datos
+# ---------------------------------------------------------------------------
+
+def _distancias(filas, lat, lng):
+    """[(pk, km)] de filas (pk, lat, lng), de la más cercana a la más lejana"""
+    if not filas:
+        return []
+    ids = [fila[0] for fila in filas]
+    coordenadas = np.array([(float(fila[1]), float(fila[2])) for fila in filas])
+    distancias = matriz_distancias(coordenadas, (lat, lng))[:, 0]
+    orden = np.argsort(distancias, kind='stable')
+    return [(ids[i], float(distancias[i])) for i in orden]
+
+
+def en_radio(queryset, lat, lng, radio_km):
+    """[(pk, km)] de las filas del queryset a lo sumo a radio_km de (lat, lng), por distancia"""
+    lat, lng = float(lat), float(lng)
+    if queryset.model is Farmacia:
+        return _visibles(queryset, indice_farmacias().en_radio(lat, lng, radio_km))
+    prefijos = prefijos_radio(lat, lng, radio_km)
+    candidatas = queryset.exclude(geohash='')
+    if prefijos:
+        filtro = Q()
+        for prefijo in prefijos:
+            filtro |= Q(geohash__startswith=prefijo)
+        candidatas = candidatas.filter(filtro)
+    filas = list(candidatas.order_by().values_list('pk', 'coordenadas_lat', 'coordenadas_lng'))
+    return [(pk, km) for pk, km in _distancias(filas, lat, lng) if km <= radio_km]
+
+
+def mas_cercanos(queryset, lat, lng, cantidad=CANTIDAD_CERCANOS, radio_maximo_km=RADIO_MAXIMO_KM):
+    """[(pk, km)] de las cantidad filas del queryset más cercanas a (lat, lng), hasta radio_maximo_km"""
+    lat, lng = float(lat), float(lng)
+    if queryset.model is Farmacia:
+        indice = indice_farmacias()
+        buscadas = cantidad
+        while True:
+            candidatas = indice.mas_cercanos(lat, lng, buscadas, radio_maximo_km)
+            encontradas = _visibles(queryset, candidatas)
+            # Si el queryset filtra farmacias del índice se buscan más candidatas
+            if len(encontradas) >= cantidad or len(candidatas) < buscadas:
+                return encontradas[:cantidad]
+            buscadas *= 4
+    radio_maximo_km = radio_maximo_km or RADIO_MAXIMO_KM
+    radio = min(RADIO_INICIAL_KM, radio_maximo_km)
+    while True:
+        encontradas = en_radio(queryset, lat, lng, radio)
+        if len(encontradas) >= cantidad or radio >= radio_maximo_km:
+            return encontradas[:cantidad]
+        radio = min(radio * 4, radio_maximo_km)
+
+
+def _visibles(queryset, candidatas):
+    """Las candidatas (pk, km) que están en el queryset"""
+    if not candidatas:
+        return []
+    visibles = set(queryset.filter(pk__in=[pk for pk, _ in candidatas]).values_list('pk', flat=True))
+    return [(pk, km) for pk, km in candidatas if pk in visibles]
+
+
+# ---------------------------------------------------------------------------
+# Índice en memoria
+# ---------------------------------------------------------------------------
+
+class IndiceEspacial:
+    """Grilla en memoria de puntos (pk, lat, lng) para búsquedas por radio y de los más cercanos"""
+
+    def __init__(self, filas, tamano_celda_km=TAMANO_CELDA_KM):
+        self.ids = np.array([fila[0] for fila in filas])
+        self.coordenadas = np.array([(float(fila[1]), float(fila[2])) for fila in filas]).reshape(-1, 2)
+        self.tamano_celda_km = tamano_celda_km
+        self.alto = tamano_celda_km / KM_POR_GRADO_LAT
+        # Con el paralelo más alejado del ecuador ninguna celda mide menos de tamano_celda_km de ancho
+        self.latitud_maxima = float(np.abs(self.coordenadas[:, 0]).max()) if len(filas) else 0.0
+        self.ancho = tamano_celda_km / (KM_POR_GRADO_LNG * math.cos(math.radians(min(self.latitud_maxima, 89.9))))
+
+        celdas = self._celda(self.coordenadas[:, 0], self.coordenadas[:, 1])
+        orden = np.lexsort((celdas[:, 1], celdas[:, 0]))
+        self.ids, self.coordenadas, celdas = self.ids[orden], self.coordenadas[orden], celdas[orden]
+        # {(fila, columna): (desde, hasta)} sobre los arreglos ordenados por celda
+        self.celdas = {}
+        if len(celdas):
+            cortes = np.flatnonzero(np.any(celdas[1:] != celdas[:-1], axis=1)) + 1
+            for desde, hasta in zip([0] + cortes.tolist(), cortes.tolist() + [len(celdas)]):
+                self.celdas[tuple(celdas[desde].tolist())] = (desde, hasta)
+            self.minimo, self.maximo = celdas.min(axis=0).tolist(), celdas.max(axis=0).tolist()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _celda(self, lat, lng):
+        return np.column_stack((np.floor(np.asarray(lat) / self.alto), np.floor(np.asarray(lng) / self.ancho))).astype(int)
+
+    def _vecindad(self, lat, lng, anillos):
+        """(índices de los puntos en las celdas a lo sumo a anillos de la del punto, si abarcan toda la grilla)"""
+        fila, columna = self._celda([lat], [lng])[0].tolist()
+        anillos_lng = anillos
+        if abs(lat) > self.latitud_maxima:
+            # Más allá de los puntos las celdas son más angostas: más columnas para la misma distancia
+            ancho_km = self.ancho * KM_POR_GRADO_LNG * math.cos(math.radians(min(abs(lat), 89.9)))
+            anillos_lng = math.ceil(anillos * self.tamano_celda_km / ancho_km)
+        filas = (max(fila - anillos, self.minimo[0]), min(fila + anillos, self.maximo[0]))
+        columnas = (max(columna - anillos_lng, self.minimo[1]), min(columna + anillos_lng, self.maximo[1]))
+        completa = (fila - anillos <= self.minimo[0] and fila + anillos >= self.maximo[0]
+                    and columna - anillos_lng <= self.minimo[1] and columna + anillos_lng >= self.maximo[1])
+        if completa:
+            return np.arange(len(self)), True
+        if filas[0] > filas[1] or columnas[0] > columnas[1]:
+            return np.empty(0, dtype=int), False
+        if (filas[1] - filas[0] + 1) * (columnas[1] - columnas[0] + 1) > len(self.celdas):
+            tramos = [
+                tramo for (f, c), tramo in self.celdas.items()
+                if filas[0] <= f <= filas[1] and columnas[0] <= c <= columnas[1]
+            ]
+        else:
+            tramos = [
+                self.celdas[(f, c)]
+                for f in range(filas[0], filas[1] + 1)
+                for c in range(columnas[0], columnas[1] + 1)
+                if (f, c) in self.celdas
+            ]
+        if not tramos:
+            return np.empty(0, dtype=int), False
+        return np.concatenate([np.arange(desde, hasta) for desde, hasta in tramos]), False
+
+    def _resultado(self, indices, lat, lng):
+        if not len(indices):
+            return []
+        distancias = matriz_distancias(self.coordenadas[indices], (lat, lng))[:, 0]
+        orden = np.argsort(distancias, kind='stable')
+        return list(zip(self.ids[indices][orden].tolist(), distancias[orden].tolist()))
+
+    def en_radio(self, lat, lng, radio_km):
+        """[(pk, km)] a lo sumo a radio_km, por distancia"""
+        if not len(self):
+            return []
+        lat, lng = float(lat), float(lng)
+        indices, _ = self._vecindad(lat, lng, math.ceil(radio_km / self.tamano_celda_km))
+        return [(pk, km) for pk, km in self._resultado(indices, lat, lng) if km <= radio_km]
+
+    def mas_cercanos(self, lat, lng, cantidad=CANTIDAD_CERCANOS, radio_maximo_km=None):
+        """[(pk, km)] de los cantidad puntos más cercanos (hasta radio_maximo_km)"""
+        if not len(self):
+            return []
+        lat, lng = float(lat), float(lng)
+        anillos = 1
+        while True:
+            indices, completa = self._vecindad(lat, lng, anillos)
+            cubierto_km = anillos * self.tamano_celda_km
+            resultado = self._resultado(indices, lat, lng)
+            if radio_maximo_km is not None:
+                resultado = [(pk, km) for pk, km in resultado if km <= radio_maximo_km]
+            # Solo son los más cercanos si están dentro de la distancia ya recorrida
+            seguros = [(pk, km) for pk, km in resultado if km <= cubierto_km]
+            if len(seguros) >= cantidad:
+                return seguros[:cantidad]
+            if completa or (radio_maximo_km is not None and cubierto_km >= radio_maximo_km):
+                return resultado[:cantidad]
+            anillos *= 2
+
+
+def indice_farmacias():
+    """IndiceEspacial de las farmacias activas con coordenadas, reconstruido si cambiaron"""
+    version = VersionRecurso.objects.filter(clave='farmacias').values_list('version', flat=True).first() or 0
+    guardado = _indices.get('farmacias')
+    if guardado is None or guardado[0] != version:
+        filas = list(Farmacia.objects.filter(
+            activa=True, coordenadas_lat__isnull=False, coordenadas_lng__isnull=False
+        ).order_by('id').values_list('id', 'coordenadas_lat', 'coordenadas_lng'))
+        guardado = (version, IndiceEspacial(filas))
+        _indices['farmacias'] = guardado
+    return guardado[1]
+
+
+def farmacias_cercanas(lat, lng, cantidad=CANTIDAD_CERCANOS, excluir=()):
+    """Farmacias activas más cercanas a (lat, lng), con su distancia en distancia_km"""
+    queryset = Farmacia.objects.filter(activa=True).exclude(pk__in=excluir)
+    cercanas = dict(mas_cercanos(queryset, lat, lng, cantidad, radio_maximo_km=None))
+    farmacias = sorted(queryset.filter(pk__in=cercanas), key=lambda farmacia: cercanas[farmacia.pk])
+    for farmacia in farmacias:
+        farmacia.distancia_km = round(cercanas[farmacia.pk], 3)
+    return farmacias
+
+
+def distancias_farmacias(lat, lng):
+    """{farmacia_id: km} de todas las farmacias activas con coordenadas"""
+    indice = indice_farmacias()
+    return dict(indice.mas_cercanos(lat, lng, len(indice)))
+
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+
+def anotar_distancias(queryset, cercanas, ordenar=True):
+    """Solo las filas de cercanas [(pk, km)], con distancia_km y (con ordenar) de la más cercana a la más lejana"""
+    if not cercanas:
+        return queryset.none()
+    distancia = Case(
+        *[When(pk=pk, then=Value(round(km, 3))) for pk, km in cercanas],
+        output_field=FloatField(),
+    )
+    queryset = queryset.filter(pk__in=[pk for pk, _ in cercanas]).annotate(**{CAMPO_DISTANCIA: distancia})
+    return queryset.order_by(CAMPO_DISTANCIA, 'pk') if ordenar else queryset
+
+
+def leer_punto(valor):
+    """(lat, lng) de 'lat,lng'; ValueError si no es válido"""
+    try:
+        lat, lng = (float(parte) for parte in valor.split(','))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError('debe tener la forma lat,lng')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('coordenadas fuera de rango')
+    return lat, lng
+
+
+class CercaniaFilter(BaseFilterBackend):
+    """?near=lat,lng con las cantidad más cercanas (por defecto 10) o, con radio_km, las que están
+    dentro del radio (a lo sumo cantidad, por defecto MAXIMO_CERCANOS).
+
+    Anota distancia_km y, sin ?ordering=, ordena por distancia (las paginaciones por
+    cursor de core.paginacion respetan ese orden).
+    """
+    parametro = 'near'
+
+    def filter_queryset(self, request, queryset, view):
+        valor = request.query_params.get(self.parametro)
+        if not valor:
+            return queryset
+        try:
+            lat, lng = leer_punto(valor)
+        except ValueError as error:
+            raise ValidationError({self.parametro: str(error)})
+        radio = request.query_params.get('radio_km')
+        if radio not in (None, ''):
+            try:
+                radio = float(radio)
+            except ValueError:
+                radio = None
+            if radio is None or not 0 < radio <= RADIO_MAXIMO_KM:
+                raise ValidationError({'radio_km': f'debe ser un número mayor que 0 y hasta {RADIO_MAXIMO_KM}'})
+        else:
+            radio = None
+        try:
+            cantidad = int(request.query_params.get('cantidad', CANTIDAD_CERCANOS if radio is None else MAXIMO_CERCANOS))
+        except ValueError:
+            cantidad = 0
+        if not 1 <= cantidad <= MAXIMO_CERCANOS:
+            raise ValidationError({'cantidad': f'debe ser un entero entre 1 y {MAXIMO_CERCANOS}'})
+
+        cercanas = mas_cercanos(queryset, lat, lng, cantidad, radio_maximo_km=radio or RADIO_MAXIMO_KM)
+        return anotar_distancias(queryset, cercanas, ordenar=not request.query_params.get('ordering'))
@@ -0,0 +1,293 @@
+"""
+Estadísticas precalculadas del dashboard.
+
+Se mantiene una fila global y una fila por repartidor en EstadisticaDashboard.
+Las señales de Orden, Despacho, UsuarioProfile y Moto aplican incrementos
+atómicos (F) sobre esas filas, de modo que el dashboard lee una fila en vez
+de contar las tablas completas. Los incrementos se aplican al confirmar la
+transacción que los origina (transaction.on_commit), cada uno en su propia
+sentencia: el bloqueo de la fila global dura un UPDATE y no toda la
+transacción de quien escribe, así que las escrituras concurrentes no se
+serializan en ella. Si el proceso muere entre el commit y el incremento, el
+contador queda desfasado hasta el próximo reconstruir_estadisticas().
+
+Las operaciones masivas (QuerySet.update, bulk_create) no disparan señales:
+quien las use debe llamar a aplicar_deltas() o a reconstruir_estadisticas().
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import agregados
+from .models import Despacho, EstadisticaDashboard, Moto, Orden, UsuarioProfile
+
+CLAVE_GLOBAL = 'global'
+CACHE_ENTREGAS_POR_DIA = 'dashboard:entregas_por_dia'
+CACHE_ENTREGAS_POR_DIA_TTL = 300
+
+
+def clave_repartidor(repartidor_id):
+    return f'repartidor:{repartidor_id}'
+
+
+def campo_estado_orden(estado):
+    return f'ordenes_{estado}'
+
+
+def campo_resultado_despacho(resultado):
+    return f'despachos_{resultado or "sin_resultado"}'
+
+
+# ---------------------------------------------------------------------------
+# Estado previo de cada instancia (para calcular deltas en post_save)
+# ---------------------------------------------------------------------------
+
+def _valores(instance, campos):
+    """Lee campos ya cargados sin disparar consultas por campos diferidos"""
+    try:
+        return tuple(instance.__dict__[campo] for campo in campos)
+    except KeyError:
+        return None
+
+
+def estado_orden(orden):
+    return _valores(orden, ('estado_actual', 'responsable_id'))
+
+
+def estado_despacho(despacho):
+    return _valores(despacho, ('resultado', 'repartidor_id'))
+
+
+def estado_perfil(perfil):
+    valores = _valores(perfil, ('rol', 'activo', 'estado_turno'))
+    if valores is None:
+        return None
+    rol, activo, estado_turno = valores
+    return rol == 'repartidor' and activo and estado_turno == 'disponible'
+
+
+def estado_moto(moto):
+    valores = _valores(moto, ('activa', 'estado'))
+    if valores is None:
+        return None
+    activa, estado = valores
+    return activa and estado == 'disponible'
+
+
+FUNCIONES_ESTADO = {
+    Orden: estado_orden,
+    Despacho: estado_despacho,
+    UsuarioProfile: estado_perfil,
+    Moto: estado_moto,
+}
+
+
+# ---------------------------------------------------------------------------
+# Deltas
+# ---------------------------------------------------------------------------
+
+def _sumar_orden(deltas, estado, signo):
+    estado_actual, responsable_id = estado
+    for repartidor_id in {None, responsable_id}:
+        deltas[repartidor_id]['total_ordenes'] += signo
+        deltas[repartidor_id][campo_estado_orden(estado_actual)] += signo
+
+
+def _sumar_despacho(deltas, estado, signo):
+    resultado, repartidor_id_despacho = estado
+    for repartidor_id in {None, repartidor_id_despacho}:
+        deltas[repartidor_id]['total_despachos'] += signo
+        deltas[repartidor_id][campo_resultado_despacho(resultado)] += signo
+
+
+def _sumar_perfil(deltas, activo, signo):
+    if activo:
+        deltas[None]['repartidores_activos'] += signo
+
+
+def _sumar_moto(deltas, activa, signo):
+    if activa:
+        deltas[None]['motos_activas'] += signo
+
+
+SUMADORES = {
+    Orden: _sumar_orden,
+    Despacho: _sumar_despacho,
+    UsuarioProfile: _sumar_perfil,
+    Moto: _sumar_moto,
+}
+
+
+def calcular_deltas(modelo, anterior=None, nuevo=None):
+    """Deltas por repartidor (None = fila global) entre dos estados de una instancia"""
+    deltas = defaultdict(Counter)
+    sumar = SUMADORES[modelo]
+    if anterior is not None:
+        sumar(deltas, anterior, -1)
+    if nuevo is not None:
+        sumar(deltas, nuevo, 1)
+    return deltas
+
+
+def calcular_deltas_lote(modelo, instancias, signo=1):
+    """Deltas de crear (signo=1) o eliminar (signo=-1) varias instancias sin señales"""
+    deltas = defaultdict(Counter)
+    sumar = SUMADORES[modelo]
+    obtener_estado = FUNCIONES_ESTADO[modelo]
+    for instancia in instancias:
+        sumar(deltas, obtener_estado(instancia), signo)
+    return deltas
+
+
+def aplicar_deltas(deltas):
+    """Aplica incrementos atómicos sobre las filas afectadas al confirmar la transacción actual"""
+    deltas = {
+        repartidor_id: {campo: delta for campo, delta in campos.items() if delta}
+        for repartidor_id, campos in deltas.items()
+    }
+    if any(deltas.values()):
+        transaction.on_commit(lambda: _aplicar_deltas(deltas))
+
+
+def _aplicar_deltas(deltas):
+    for repartidor_id, campos in deltas.items():
+        if not campos:
+            continue
+        clave = clave_repartidor(repartidor_id) if repartidor_id else CLAVE_GLOBAL
+        actualizadas = EstadisticaDashboard.objects.filter(clave=clave).update(
+            fecha_actualizacion=timezone.now(),
+            **{campo: F(campo) + delta for campo, delta in campos.items()}
+        )
+        if not actualizadas:
+            # Primera vez que se toca esta fila: se calcula completa desde la BD,
+            # que ya incluye el cambio que originó el delta.
+            _crear_fila(repartidor_id)
+
+
+def _crear_fila(repartidor_id):
+    fila = calcular_fila(repartidor_id)
+    try:
+        with transaction.atomic():
+            fila.save()
+    except IntegrityError:
+        # Otra transacción la creó en paralelo; su cálculo ya incluye este cambio
+        pass
+    return fila
+
+
+# ---------------------------------------------------------------------------
+# Cálculo completo
+# ---------------------------------------------------------------------------
+
+def _conteos_ordenes():
+    conteos = {'total_ordenes': Count('id')}
+    for estado, _ in Orden.ESTADO_CHOICES:
+        conteos[campo_estado_orden(estado)] = Count('id', filter=Q(estado_actual=estado))
+    return conteos
+
+
+def _conteos_despachos():
+    conteos = {'total_despachos': Count('id')}
+    for resultado, _ in Despacho.RESULTADO_CHOICES:
+        conteos[campo_resultado_despacho(resultado)] = Count('id', filter=Q(resultado=resultado))
+    conteos[campo_resultado_despacho(None)] = Count('id', filter=Q(resultado__isnull=True))
+    return conteos
+
+
+def calcular_fila(repartidor_id=None):
+    """Calcula desde cero la fila global o la de un repartidor (sin guardarla)"""
+    ordenes = Orden.objects.all()
+    despachos = Despacho.objects.all()
+    if repartidor_id:
+        ordenes = ordenes.filter(responsable_id=repartidor_id)
+        despachos = despachos.filter(repartidor_id=repartidor_id)
+
+    fila = EstadisticaDashboard(
+        clave=clave_repartidor(repartidor_id) if repartidor_id else CLAVE_GLOBAL,
+        repartidor_id=repartidor_id,
+    )
+    valores = ordenes.aggregate(**_conteos_ordenes())
+    valores.update(despachos.aggregate(**_conteos_despachos()))
+    if not repartidor_id:
+        valores['repartidores_activos'] = UsuarioProfile.objects.filter(
+            rol='repartidor', activo=True, estado_turno='disponible'
+        ).count()
+        valores['motos_activas'] = Moto.objects.filter(activa=True, estado='disponible').count()
+    for campo, valor in valores.items():
+        setattr(fila, campo, valor)
+    return fila
+
+
+def reconstruir_estadisticas():
+    """Recalcula todas las filas con consultas agrupadas y las reemplaza"""
+    filas = {None: calcular_fila(None)}
+
+    por_responsable = Orden.objects.filter(responsable__isnull=False).values('responsable').annotate(
+        **_conteos_ordenes()
+    ).order_by()
+    for item in por_responsable:
+        repartidor_id = item.pop('responsable')
+        fila = filas.setdefault(repartidor_id, EstadisticaDashboard(
+            clave=clave_repartidor(repartidor_id), repartidor_id=repartidor_id
+        ))
+        for campo, valor in item.items():
+            setattr(fila, campo, valor)
+
+    por_repartidor = Despacho.objects.filter(repartidor__isnull=False).values('repartidor').annotate(
+        **_conteos_despachos()
+    ).order_by()
+    for item in por_repartidor:
+        repartidor_id = item.pop('repartidor')
+        fila = filas.setdefault(repartidor_id, EstadisticaDashboard(
+            clave=clave_repartidor(repartidor_id), repartidor_id=repartidor_id
+        ))
+        for campo, valor in item.items():
+            setattr(fila, campo, valor)
+
+    with transaction.atomic():
+        EstadisticaDashboard.objects.all().delete()
+        EstadisticaDashboard.objects.bulk_create(filas.values())
+    cache.delete(CACHE_ENTREGAS_POR_DIA)
+    return len(filas)
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def obtener_estadisticas(user_profile):
+    """Devuelve (fila_del_rol, fila_global) con una sola consulta"""
+    claves = [CLAVE_GLOBAL]
+    if user_profile.rol == 'repartidor':
+        claves.append(clave_repartidor(user_profile.pk))
+    filas = {fila.clave: fila for fila in EstadisticaDashboard.objects.filter(clave__in=claves)}
+
+    for clave in claves:
+        if clave not in filas:
+            filas[clave] = _crear_fila(user_profile.pk if clave != CLAVE_GLOBAL else None)
+
+    return filas[claves[-1]], filas[CLAVE_GLOBAL]
+
+
+def entregas_por_dia(dias=7):
+    """Entregas totales y exitosas por día, cacheadas hasta el próximo cambio"""
+    datos = cache.get(CACHE_ENTREGAS_POR_DIA)
+    if datos is None:
+        fecha_inicio = timezone.localdate() - timedelta(days=dias)
+        inicio = timezone.make_aware(datetime.combine(fecha_inicio, time.min))
+        # Tramos diarios precalculados en vez de agrupar los despachos
+        consulta = agregados.serie_despachos(inicio, timezone.now() + timedelta(days=1))
+        datos = [
+            {
+                'day': str(timezone.localdate(item['inicio'])),
+                'total': item['total'],
+                'exitosas': item['exitosas'] or 0,
+            }
+            for item in consulta
+        ]
+        cache.set(CACHE_ENTREGAS_POR_DIA, datos, CACHE_ENTREGAS_POR_DIA_TTL)
+    return datos
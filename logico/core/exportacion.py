@@ -0,0 +1,216 @@
+"""
+Exportación en streaming de despachos, órdenes, movimientos y reportes.
+
+Las filas se leen con values_list().iterator(chunk_size=...) (cursor del lado
+del servidor en PostgreSQL) y se escriben en una StreamingHttpResponse a
+medida que llegan, sin instanciar modelos ni armar el archivo en memoria.
+Formatos CSV y JSONL, opcionalmente comprimidos con gzip.
+"""
+import csv
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import PermissionDenied
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Despacho, Orden, OrdenMovimiento, Reporte
+
+TAMANO_CHUNK = 2000
+FILAS_POR_ESCRITURA = 500
+FORMATOS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# (nombre de columna, lookup) por tipo de exportación
+EXPORTACIONES = {
+    'despachos': {
+        'modelo': Despacho,
+        'campo_fecha': 'fecha',
+        'campo_repartidor': 'repartidor',
+        'columnas': [
+            ('id', 'id'),
+            ('orden', 'orden_id'),
+            ('cliente', 'orden__cliente'),
+            ('numero_despacho', 'numero_despacho'),
+            ('repartidor', 'repartidor__user__username'),
+            ('estado', 'estado'),
+            ('resultado', 'resultado'),
+            ('observaciones', 'observaciones'),
+            ('latitud', 'coordenadas_lat'),
+            ('longitud', 'coordenadas_lng'),
+            ('fecha', 'fecha'),
+        ],
+    },
+    'ordenes': {
+        'modelo': Orden,
+        'campo_fecha': 'fecha_creacion',
+        'campo_repartidor': 'responsable',
+        'columnas': [
+            ('id', 'id'),
+            ('cliente', 'cliente'),
+            ('direccion', 'direccion'),
+            ('telefono_cliente', 'telefono_cliente'),
+            ('prioridad', 'prioridad'),
+            ('tipo', 'tipo'),
+            ('estado', 'estado_actual'),
+            ('farmacia_origen', 'farmacia_origen__nombre'),
+            ('farmacia_destino', 'farmacia_destino__nombre'),
+            ('responsable', 'responsable__user__username'),
+            ('total_despachos', 'total_despachos'),
+            ('fecha_creacion', 'fecha_creacion'),
+            ('fecha_actualizacion', 'fecha_actualizacion'),
+        ],
+    },
+    'movimientos': {
+        'modelo': OrdenMovimiento,
+        'campo_fecha': 'timestamp',
+        'campo_repartidor': 'repartidor',
+        'columnas': [
+            ('id', 'id'),
+            ('orden', 'orden_id'),
+            ('estado', 'estado'),
+            ('descripcion', 'descripcion'),
+            ('repartidor', 'repartidor__user__username'),
+            ('despacho', 'despacho_id'),
+            ('timestamp', 'timestamp'),
+        ],
+    },
+    'reportes': {
+        'modelo': Reporte,
+        'campo_fecha': 'fecha',
+        'campo_repartidor': None,
+        'columnas': [
+            ('fecha', 'fecha'),
+            ('entregas_totales', 'entregas_totales'),
+            ('entregas_exitosas', 'entregas_exitosas'),
+            ('entregas_fallidas', 'entregas_fallidas'),
+            ('tiempo_promedio', 'tiempo_promedio'),
+            ('ingresos_dia', 'ingresos_dia'),
+            ('observaciones', 'observaciones'),
+        ],
+    },
+}
+
+
+class ExportacionInvalida(ValueError):
+    pass
+
+
+def rango_fechas(desde, hasta):
+    """Convierte desde/hasta (AAAA-MM-DD, inclusivos) en fechas validadas"""
+    try:
+        hasta = parse_date(hasta) if hasta else timezone.localdate()
+        desde = parse_date(desde) if desde else hasta and hasta - timedelta(days=30)
+    except (ValueError, OverflowError):
+        # Bien formada pero imposible (2024-02-30) o fuera del calendario
+        raise ExportacionInvalida('Fecha inválida')
+    if desde is None or hasta is None:
+        raise ExportacionInvalida('Las fechas deben tener el formato AAAA-MM-DD')
+    if desde > hasta:
+        raise ExportacionInvalida('La fecha desde no puede ser posterior a hasta')
+    return desde, hasta
+
+
+def consulta(tipo, user_profile, desde, hasta):
+    """values_list ordenado por fecha con los filtros de rango y rol"""
+    exportacion = EXPORTACIONES[tipo]
+    modelo = exportacion['modelo']
+    campo_fecha = exportacion['campo_fecha']
+
+    if modelo._meta.get_field(campo_fecha).get_internal_type() == 'DateField':
+        filtros = {f'{campo_fecha}__gte': desde, f'{campo_fecha}__lte': hasta}
+    else:
+        # Rango sobre la columna para usar el índice de fecha
+        inicio = timezone.make_aware(datetime.combine(desde, time.min))
+        fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+        filtros = {f'{campo_fecha}__gte': inicio, f'{campo_fecha}__lt': fin}
+
+    queryset = modelo.objects.filter(**filtros)
+    if user_profile.rol == 'repartidor':
+        if not exportacion['campo_repartidor']:
+            raise PermissionDenied('No tienes permisos para exportar este tipo de datos')
+        queryset = queryset.filter(**{exportacion['campo_repartidor']: user_profile})
+
+    lookups = [lookup for _, lookup in exportacion['columnas']]
+    return queryset.order_by(campo_fecha, 'pk').values_list(*lookups)
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    if isinstance(valor, (date, Decimal)):
+        return str(valor)
+    return valor
+
+
+def _agrupar(filas):
+    """Agrupa filas para escribir bloques en vez de una línea por yield"""
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= FILAS_POR_ESCRITURA:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+class _Linea:
+    """Destino de csv.writer que devuelve la línea escrita"""
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(columnas, filas):
+    writer = csv.writer(_Linea())
+    yield writer.writerow(columnas)
+    for bloque in _agrupar(filas):
+        yield ''.join(writer.writerow([_valor(valor) for valor in fila]) for fila in bloque)
+
+
+def generar_jsonl(columnas, filas):
+    for bloque in _agrupar(filas):
+        yield ''.join(
+            json.dumps(dict(zip(columnas, map(_valor, fila))), ensure_ascii=False) + '\n'
+            for fila in bloque
+        )
+
+
+def comprimir(partes):
+    """Comprime el flujo con gzip a medida que se genera"""
+    compresor = zlib.compressobj(wbits=31)
+    for parte in partes:
+        datos = compresor.compress(parte.encode('utf-8'))
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def respuesta_exportacion(tipo, user_profile, parametros):
+    """StreamingHttpResponse para ?desde=&hasta=&formato=csv|jsonl&gzip=1"""
+    if tipo not in EXPORTACIONES:
+        raise ExportacionInvalida(f'Tipo de exportación inválido: {tipo}')
+    formato = parametros.get('formato', 'csv')
+    if formato not in FORMATOS:
+        raise ExportacionInvalida(f'Formato inválido: {formato}')
+    desde, hasta = rango_fechas(parametros.get('desde'), parametros.get('hasta'))
+
+    columnas = [nombre for nombre, _ in EXPORTACIONES[tipo]['columnas']]
+    filas = consulta(tipo, user_profile, desde, hasta).iterator(chunk_size=TAMANO_CHUNK)
+    generador = generar_csv if formato == 'csv' else generar_jsonl
+    contenido = generador(columnas, filas)
+
+    nombre_archivo = f'{tipo}_{desde}_{hasta}.{formato}'
+    if parametros.get('gzip') in ('1', 'true'):
+        response = StreamingHttpResponse(comprimir(contenido), content_type='application/gzip')
+        nombre_archivo += '.gz'
+    else:
+        response = StreamingHttpResponse(contenido, content_type=f'{FORMATOS[formato]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
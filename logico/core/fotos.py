@@ -0,0 +1,169 @@
+"""
+Procesamiento en segundo plano de las fotos de entrega.
+
+Al guardar un Despacho con una foto nueva (registrar_resultado, formulario,
+API o admin) la señal solo encola un ProcesamientoFoto en la misma
+transacción: la petición guarda el archivo tal como llegó y responde. El
+worker (python manage.py procesar_fotos) toma los trabajos pendientes y, con
+Pillow, corrige la orientación según EXIF, reduce la foto a
+TAMANO_MAXIMO px, la recomprime en JPEG sin metadatos (EXIF con GPS, modelo
+del teléfono, etc.) y genera foto_miniatura de TAMANO_MINIATURA px.
+
+Un trabajo fallido se reintenta con espera exponencial hasta MAXIMO_INTENTOS
+y queda en estado error; uno que quedó "procesando" por más de
+TIEMPO_BLOQUEO (worker caído) se vuelve a tomar. Para las fotos existentes
+sin miniatura está encolar_fotos.
+"""
+import io
+import os
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import condicional
+from .models import Despacho, ProcesamientoFoto
+
+TAMANO_MAXIMO = 1600
+TAMANO_MINIATURA = 320
+CALIDAD = 82
+CALIDAD_MINIATURA = 75
+MAXIMO_INTENTOS = 5
+ESPERA_REINTENTO = timedelta(seconds=30)
+TIEMPO_BLOQUEO = timedelta(minutes=10)
+
+
+def encolar(despacho):
+    """Agrega (o reinicia) el trabajo de la foto del despacho"""
+    actualizados = ProcesamientoFoto.objects.filter(
+        despacho=despacho, estado__in=['pendiente', 'error']
+    ).update(estado='pendiente', intentos=0, proximo_intento=timezone.now(), error='')
+    if not actualizados:
+        ProcesamientoFoto.objects.create(despacho=despacho)
+
+
+# ---------------------------------------------------------------------------
+# Imagen
+# ---------------------------------------------------------------------------
+
+def _jpeg(imagen, calidad):
+    salida = io.BytesIO()
+    # Sin exif=: Pillow no copia los metadatos del original
+    imagen.save(salida, 'JPEG', quality=calidad, optimize=True, progressive=True)
+    return salida.getvalue()
+
+
+def procesar_imagen(archivo):
+    """(foto, miniatura) en JPEG a partir de un archivo de imagen abierto"""
+    with Image.open(archivo) as original:
+        imagen = ImageOps.exif_transpose(original)
+        if imagen.mode in ('RGBA', 'LA', 'P'):
+            imagen = imagen.convert('RGBA')
+            fondo = Image.new('RGB', imagen.size, 'white')
+            fondo.paste(imagen, mask=imagen.getchannel('A'))
+            imagen = fondo
+        elif imagen.mode != 'RGB':
+            imagen = imagen.convert('RGB')
+
+        foto = imagen.copy()
+        foto.thumbnail((TAMANO_MAXIMO, TAMANO_MAXIMO), Image.LANCZOS)
+        miniatura = foto.copy()
+        miniatura.thumbnail((TAMANO_MINIATURA, TAMANO_MINIATURA), Image.LANCZOS)
+        return _jpeg(foto, CALIDAD), _jpeg(miniatura, CALIDAD_MINIATURA)
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+def tomar_trabajos(cantidad):
+    """Marca como procesando hasta cantidad trabajos vencidos y los devuelve.
+
+    En PostgreSQL los trabajos tomados por otro worker se saltan (SKIP LOCKED).
+    """
+    ahora = timezone.now()
+    disponibles = Q(estado='pendiente', proximo_intento__lte=ahora) | Q(
+        estado='procesando', fecha_actualizacion__lt=ahora - TIEMPO_BLOQUEO
+    )
+    with transaction.atomic():
+        ids = list(
+            ProcesamientoFoto.objects.select_for_update(skip_locked=True)
+            .filter(disponibles).order_by('proximo_intento', 'id')
+            .values_list('id', flat=True)[:cantidad]
+        )
+        ProcesamientoFoto.objects.filter(pk__in=ids).update(
+            estado='procesando', intentos=F('intentos') + 1, fecha_actualizacion=ahora
+        )
+    return list(ProcesamientoFoto.objects.filter(pk__in=ids).select_related('despacho').order_by('proximo_intento', 'id'))
+
+
+def _reemplazar(despacho, foto, miniatura):
+    campo = despacho.foto_entrega
+    anterior = campo.name
+    anterior_miniatura = despacho.foto_miniatura.name if despacho.foto_miniatura else None
+    nombre = os.path.splitext(os.path.basename(anterior))[0] + '.jpg'
+
+    campo.save(nombre, ContentFile(foto), save=False)
+    despacho.foto_miniatura.save(nombre, ContentFile(miniatura), save=False)
+    # Sin save(): las señales del despacho no deben volver a encolar la foto
+    actualizados = Despacho.objects.filter(pk=despacho.pk, foto_entrega=anterior).update(
+        foto_entrega=campo.name,
+        foto_miniatura=despacho.foto_miniatura.name,
+        fecha_actualizacion=timezone.now(),
+    )
+    if not actualizados:
+        # La foto cambió mientras se procesaba: la nueva tiene su propio trabajo
+        campo.storage.delete(campo.name)
+        despacho.foto_miniatura.storage.delete(despacho.foto_miniatura.name)
+        return
+    for nombre_anterior in (anterior, anterior_miniatura):
+        if nombre_anterior and nombre_anterior not in (campo.name, despacho.foto_miniatura.name):
+            campo.storage.delete(nombre_anterior)
+    condicional.incrementar('despachos')
+
+
+def procesar(trabajo):
+    """Procesa un trabajo tomado; devuelve True si terminó bien"""
+    despacho = trabajo.despacho
+    try:
+        if despacho.foto_entrega:
+            with despacho.foto_entrega.open('rb') as archivo:
+                foto, miniatura = procesar_imagen(archivo)
+            _reemplazar(despacho, foto, miniatura)
+    except Exception as error:
+        agotado = trabajo.intentos >= MAXIMO_INTENTOS
+        ProcesamientoFoto.objects.filter(pk=trabajo.pk).update(
+            estado='error' if agotado else 'pendiente',
+            proximo_intento=timezone.now() + ESPERA_REINTENTO * 2 ** (trabajo.intentos - 1),
+            error=f'{type(error).__name__}: {error}',
+            fecha_actualizacion=timezone.now(),
+        )
+        return False
+    ProcesamientoFoto.objects.filter(pk=trabajo.pk).update(
+        estado='listo', error='', fecha_actualizacion=timezone.now()
+    )
+    return True
+
+
+def procesar_pendientes(cantidad=20):
+    """Toma y procesa un lote de trabajos; devuelve (procesados, fallidos)"""
+    procesados = fallidos = 0
+    for trabajo in tomar_trabajos(cantidad):
+        if procesar(trabajo):
+            procesados += 1
+        else:
+            fallidos += 1
+    return procesados, fallidos
+
+
+def encolar_existentes():
+    """Encola las fotos de entrega que aún no tienen miniatura; devuelve cuántas"""
+    despachos = Despacho.objects.exclude(foto_entrega='').exclude(foto_entrega__isnull=True).filter(
+        Q(foto_miniatura='') | Q(foto_miniatura__isnull=True)
+    ).exclude(procesamientos_foto__estado__in=['pendiente', 'procesando'])
+    trabajos = [ProcesamientoFoto(despacho_id=pk) for pk in despachos.values_list('pk', flat=True).iterator()]
+    ProcesamientoFoto.objects.bulk_create(trabajos, batch_size=1000)
+    return len(trabajos)
@@ -0,0 +1,337 @@
+"""
+Geocodificación de las direcciones de órdenes y farmacias.
+
+Las direcciones se normalizan (minúsculas, sin tildes ni puntuación,
+abreviaturas expandidas, sin departamento u oficina y con la ciudad) y se
+resuelven a coordenadas con el proveedor configurado en
+settings.GEOCODIFICACION_PROVEEDOR. Cada resultado, también "no encontrada",
+queda en DireccionGeocodificada: la misma dirección normalizada no vuelve a
+consultarse al proveedor (las no encontradas se reintentan pasados
+GEOCODIFICACION_REINTENTO_DIAS días). aciertos y consultas en esa tabla dan
+la tasa de aciertos de la caché (metricas()).
+
+Al crear una orden o farmacia, o cambiar su dirección, las señales solo
+buscan la dirección en la caché, sin consultar al proveedor: si no está, la
+fila queda pendiente (fecha_geocodificacion None) y la resuelve en lote
+python manage.py geocodificar. Las coordenadas escritas a mano (API, admin)
+se respetan. La carga masiva (bulk_create) también deja las filas
+pendientes.
+
+Un proveedor es una clase con nombre y geocodificar(direcciones), que recibe
+direcciones normalizadas y devuelve {direccion: (lat, lng) o None}; puede
+devolver solo una parte (las demás siguen pendientes) o lanzar
+ProveedorNoDisponible. Se incluyen ProveedorArchivo (CSV local, para
+desarrollo y pruebas) y ProveedorNominatim (OpenStreetMap).
+"""
+import csv
+import json
+import os
+import re
+import time
+import unicodedata
+from datetime import timedelta
+from decimal import Decimal
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import condicional, espacial
+from .models import DireccionGeocodificada, Farmacia, Orden
+
+LARGO_MAXIMO = 300
+TAMANO_BLOQUE = 500
+PRECISION = Decimal('0.000001')
+
+ABREVIATURAS = {
+    'av': 'avenida',
+    'avda': 'avenida',
+    'ave': 'avenida',
+    'pje': 'pasaje',
+    'psje': 'pasaje',
+    'cll': 'calle',
+    'gral': 'general',
+    'pdte': 'presidente',
+    'sta': 'santa',
+    'sto': 'santo',
+}
+# Seguidas de su número o letra: no cambian la ubicación del edificio
+UNIDADES = {'depto', 'dpto', 'dep', 'departamento', 'of', 'oficina', 'piso', 'local', 'torre', 'block'}
+
+
+class ProveedorNoDisponible(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Normalización
+# ---------------------------------------------------------------------------
+
+def normalizar(direccion, ciudad=None):
+    """Clave de la caché para la dirección ('' si no tiene contenido)"""
+    texto = unicodedata.normalize('NFKD', direccion or '')
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter)).lower()
+    # "N° 123", "#123", "No. 123" -> "123"
+    texto = re.sub(r'(?:\bn[°ºo]\.?|#)\s*(?=\d)', ' ', texto)
+    palabras = re.sub(r'[^\w\s]', ' ', texto).split()
+
+    normalizadas = []
+    saltar = False
+    for palabra in palabras:
+        if saltar:
+            saltar = False
+            continue
+        if palabra in UNIDADES:
+            saltar = True
+            continue
+        normalizadas.append(ABREVIATURAS.get(palabra, palabra))
+
+    if ciudad:
+        palabras_ciudad = normalizar(ciudad).split()
+        if palabras_ciudad and palabras_ciudad != normalizadas[-len(palabras_ciudad):]:
+            normalizadas += palabras_ciudad
+    return ' '.join(normalizadas)[:LARGO_MAXIMO]
+
+
+def ciudad_por_defecto():
+    return getattr(settings, 'GEOCODIFICACION_CIUDAD', 'Santiago')
+
+
+def direccion_de(instance):
+    """Dirección normalizada de una orden o farmacia"""
+    if isinstance(instance, Farmacia):
+        return normalizar(instance.direccion, instance.ciudad)
+    return normalizar(instance.direccion, ciudad_por_defecto())
+
+
+def _coordenadas(lat, lng):
+    return Decimal(str(lat)).quantize(PRECISION), Decimal(str(lng)).quantize(PRECISION)
+
+
+# ---------------------------------------------------------------------------
+# Proveedores
+# ---------------------------------------------------------------------------
+
+class ProveedorArchivo:
+    """Coordenadas desde un CSV local (columnas direccion, lat, lng y opcionalmente ciudad)"""
+    nombre = 'archivo'
+    _tablas = {}
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or getattr(settings, 'GEOCODIFICACION_ARCHIVO', None)
+
+    def tabla(self):
+        try:
+            modificado = os.path.getmtime(self.ruta)
+        except (OSError, TypeError):
+            raise ProveedorNoDisponible(f'No existe el archivo de geocodificación {self.ruta}')
+        guardada = self._tablas.get(self.ruta)
+        if guardada is None or guardada[0] != modificado:
+            tabla = {}
+            with open(self.ruta, encoding='utf-8', newline='') as entrada:
+                for fila in csv.DictReader(entrada):
+                    try:
+                        coordenadas = (float(fila['lat']), float(fila['lng']))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    tabla[normalizar(fila.get('direccion'), fila.get('ciudad') or ciudad_por_defecto())] = coordenadas
+            guardada = self._tablas[self.ruta] = (modificado, tabla)
+        return guardada[1]
+
+    def geocodificar(self, direcciones):
+        tabla = self.tabla()
+        return {direccion: tabla.get(direccion) for direccion in direcciones}
+
+
+class ProveedorNominatim:
+    """API de búsqueda de Nominatim (OpenStreetMap): una consulta por segundo como máximo"""
+    nombre = 'nominatim'
+    INTERVALO = 1.0
+    TIEMPO_ESPERA = 10
+
+    def __init__(self):
+        self.url = getattr(settings, 'GEOCODIFICACION_URL', 'https://nominatim.openstreetmap.org/search')
+        self.pais = getattr(settings, 'GEOCODIFICACION_PAIS', 'cl')
+        self.agente = getattr(settings, 'GEOCODIFICACION_USER_AGENT', 'logico')
+        self.ultima = 0.0
+
+    def consultar(self, direccion):
+        espera = self.ultima + self.INTERVALO - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+        self.ultima = time.monotonic()
+        parametros = urlencode({'q': direccion, 'format': 'jsonv2', 'limit': 1, 'countrycodes': self.pais})
+        peticion = Request(f'{self.url}?{parametros}', headers={'User-Agent': self.agente})
+        with urlopen(peticion, timeout=self.TIEMPO_ESPERA) as respuesta:
+            resultados = json.load(respuesta)
+        return (float(resultados[0]['lat']), float(resultados[0]['lon'])) if resultados else None
+
+    def geocodificar(self, direcciones):
+        resultados = {}
+        for direccion in direcciones:
+            try:
+                resultados[direccion] = self.consultar(direccion)
+            except (URLError, OSError, ValueError, KeyError) as error:
+                if not resultados:
+                    raise ProveedorNoDisponible(str(error))
+                # Lo resuelto hasta aquí se guarda; el resto sigue pendiente
+                break
+        return resultados
+
+
+def proveedor():
+    ruta = getattr(settings, 'GEOCODIFICACION_PROVEEDOR', 'core.geocodificacion.ProveedorArchivo')
+    return import_string(ruta)()
+
+
+# ---------------------------------------------------------------------------
+# Caché
+# ---------------------------------------------------------------------------
+
+def reintento():
+    return timedelta(days=getattr(settings, 'GEOCODIFICACION_REINTENTO_DIAS', 7))
+
+
+def _bloques(elementos, tamano=TAMANO_BLOQUE):
+    elementos = list(elementos)
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+
+def resolver(direcciones, consultar_proveedor=True):
+    """{direccion normalizada: (lat, lng) o None si el proveedor no la encontró}.
+
+    Con consultar_proveedor=False solo se usa la caché y las direcciones que
+    no están en ella no aparecen en el resultado.
+    """
+    direcciones = {direccion for direccion in direcciones if direccion}
+    resultados = {}
+    vencidas = set()
+    aciertos = []
+    limite = timezone.now() - reintento()
+    for bloque in _bloques(sorted(direcciones)):
+        entradas = DireccionGeocodificada.objects.filter(direccion__in=bloque).values_list(
+            'id', 'direccion', 'coordenadas_lat', 'coordenadas_lng', 'fecha_consulta'
+        )
+        for pk, direccion, lat, lng, fecha_consulta in entradas:
+            if lat is None and fecha_consulta < limite and consultar_proveedor:
+                vencidas.add(direccion)
+                continue
+            resultados[direccion] = None if lat is None else (lat, lng)
+            aciertos.append(pk)
+    for bloque in _bloques(aciertos):
+        DireccionGeocodificada.objects.filter(pk__in=bloque).update(aciertos=F('aciertos') + 1)
+
+    faltantes = direcciones - set(resultados)
+    if faltantes and consultar_proveedor:
+        resultados.update(_consultar(sorted(faltantes), vencidas))
+    return resultados
+
+
+def _consultar(direcciones, vencidas):
+    """Consulta al proveedor y guarda lo que devuelva en la caché"""
+    actual = proveedor()
+    ahora = timezone.now()
+    respuestas = {
+        direccion: None if coordenadas is None else _coordenadas(*coordenadas)
+        for direccion, coordenadas in actual.geocodificar(direcciones).items()
+        if direccion in direcciones
+    }
+    nuevas = [
+        DireccionGeocodificada(
+            direccion=direccion,
+            coordenadas_lat=coordenadas[0] if coordenadas else None,
+            coordenadas_lng=coordenadas[1] if coordenadas else None,
+            proveedor=actual.nombre,
+            fecha_consulta=ahora,
+        )
+        for direccion, coordenadas in respuestas.items() if direccion not in vencidas
+    ]
+    # Otro proceso pudo guardar la misma dirección mientras tanto
+    DireccionGeocodificada.objects.bulk_create(nuevas, batch_size=TAMANO_BLOQUE, ignore_conflicts=True)
+    for direccion in vencidas & respuestas.keys():
+        coordenadas = respuestas[direccion]
+        DireccionGeocodificada.objects.filter(direccion=direccion).update(
+            coordenadas_lat=coordenadas[0] if coordenadas else None,
+            coordenadas_lng=coordenadas[1] if coordenadas else None,
+            proveedor=actual.nombre,
+            fecha_consulta=ahora,
+            consultas=F('consultas') + 1,
+        )
+    return respuestas
+
+
+def metricas():
+    """Tamaño de la caché y tasa de aciertos (resoluciones sin consultar al proveedor)"""
+    totales = DireccionGeocodificada.objects.aggregate(
+        direcciones=Count('id'),
+        encontradas=Count('coordenadas_lat'),
+        aciertos=Coalesce(Sum('aciertos'), 0),
+        consultas=Coalesce(Sum('consultas'), 0),
+    )
+    resoluciones = totales['aciertos'] + totales['consultas']
+    totales['tasa_aciertos'] = round(100 * totales['aciertos'] / resoluciones, 1) if resoluciones else 0.0
+    return totales
+
+
+# ---------------------------------------------------------------------------
+# Órdenes y farmacias
+# ---------------------------------------------------------------------------
+
+def aplicar(instance, coordenadas):
+    instance.coordenadas_lat, instance.coordenadas_lng = coordenadas or (None, None)
+    instance.fecha_geocodificacion = timezone.now()
+    espacial.asignar_geohash(instance)
+
+
+def desde_cache(instance):
+    """Coordenadas de la dirección (nueva) de la instancia, si están en la caché; si no, queda pendiente"""
+    direccion = direccion_de(instance)
+    resultados = resolver([direccion], consultar_proveedor=False) if direccion else {direccion: None}
+    if direccion in resultados:
+        aplicar(instance, resultados[direccion])
+    else:
+        instance.coordenadas_lat = instance.coordenadas_lng = None
+        instance.fecha_geocodificacion = None
+
+
+def geocodificar_pendientes(modelo, cantidad=TAMANO_BLOQUE, reintentar=False):
+    """Geocodifica hasta cantidad filas pendientes de modelo; devuelve (encontradas, sin_resultado).
+
+    Con reintentar también se vuelven a intentar las que quedaron sin
+    resultado hace más de GEOCODIFICACION_REINTENTO_DIAS días.
+    """
+    pendientes = Q(fecha_geocodificacion__isnull=True)
+    if reintentar:
+        pendientes |= Q(coordenadas_lat__isnull=True, fecha_geocodificacion__lt=timezone.now() - reintento())
+    columnas = ['id', 'direccion'] + (['ciudad'] if modelo is Farmacia else [])
+    filas = list(modelo.objects.filter(pendientes).order_by('id').only(*columnas)[:cantidad])
+    if not filas:
+        return 0, 0
+
+    direcciones = {fila.pk: direccion_de(fila) for fila in filas}
+    resultados = resolver(direcciones.values())
+    resueltas = []
+    for fila in filas:
+        direccion = direcciones[fila.pk]
+        if direccion and direccion not in resultados:
+            continue  # el proveedor no respondió por ella: sigue pendiente
+        aplicar(fila, resultados.get(direccion))
+        resueltas.append(fila)
+
+    campos = ['coordenadas_lat', 'coordenadas_lng', 'fecha_geocodificacion', 'geohash']
+    if modelo is Orden:
+        # Los dispositivos reciben las coordenadas en la siguiente sincronización
+        for fila in resueltas:
+            fila.fecha_actualizacion = fila.fecha_geocodificacion
+        campos.append('fecha_actualizacion')
+    modelo.objects.bulk_update(resueltas, campos, batch_size=TAMANO_BLOQUE)
+    if resueltas:
+        condicional.incrementar(*condicional.recursos_de(modelo))
+    encontradas = sum(1 for fila in resueltas if fila.coordenadas_lat is not None)
+    return encontradas, len(resueltas) - encontradas
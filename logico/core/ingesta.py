@@ -0,0 +1,129 @@
+"""
+Carga masiva de órdenes.
+
+Valida todo el lote en una pasada (las FK con una consulta por tabla) y
+escribe órdenes, medicamentos y movimientos iniciales con bulk_create en una
+sola transacción. bulk_create no llama a Orden.save ni dispara señales, por
+lo que aquí se aplican Orden.preparar_guardado, los deltas de estadísticas,
+los agregados de movimientos y la versión del recurso ordenes (ver
+core.condicional).
+"""
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import agregados, condicional, estadisticas
+from .models import Farmacia, Medicamento, Orden, OrdenMovimiento, UsuarioProfile
+from .serializers import OrdenLoteSerializer
+
+TAMANO_MAXIMO_LOTE = 5000
+TAMANO_BATCH = 1000
+
+
+def _ids(items, campo):
+    return {item[campo] for item in items if item.get(campo) is not None}
+
+
+def _validar_referencias(item, farmacias, repartidores):
+    errores = {}
+    for campo in ('farmacia_origen', 'farmacia_destino'):
+        if item.get(campo) is not None and item[campo] not in farmacias:
+            errores[campo] = ['Farmacia no encontrada.']
+    if item.get('responsable') is not None and item['responsable'] not in repartidores:
+        errores['responsable'] = ['Repartidor no encontrado.']
+    return errores
+
+
+def _construir_orden(item):
+    orden = Orden(
+        farmacia_origen_id=item.pop('farmacia_origen', None),
+        farmacia_destino_id=item.pop('farmacia_destino', None),
+        responsable_id=item.pop('responsable', None),
+        **item
+    )
+    orden.preparar_guardado()
+    return orden
+
+
+def validar_lote(datos):
+    """Devuelve una lista alineada con datos: (orden, medicamentos) o dict de errores"""
+    if not isinstance(datos, list):
+        raise ValidationError({'ordenes': ['Se esperaba una lista de órdenes.']})
+    if len(datos) > TAMANO_MAXIMO_LOTE:
+        raise ValidationError({'ordenes': [f'Máximo {TAMANO_MAXIMO_LOTE} órdenes por lote.']})
+
+    # Primera pasada: validación de campos, sin consultas
+    serializer = OrdenLoteSerializer()
+    validados = []
+    errores = {}
+    for indice, item in enumerate(datos):
+        try:
+            validados.append(serializer.run_validation(item))
+        except ValidationError as error:
+            validados.append(None)
+            errores[indice] = error.detail
+
+    # Referencias: una consulta por tabla para todo el lote
+    items = [item for item in validados if item is not None]
+    farmacias = set(Farmacia.objects.filter(
+        pk__in=_ids(items, 'farmacia_origen') | _ids(items, 'farmacia_destino')
+    ).values_list('pk', flat=True))
+    repartidores = set(UsuarioProfile.objects.filter(
+        pk__in=_ids(items, 'responsable'), rol='repartidor'
+    ).values_list('pk', flat=True))
+
+    resultado = []
+    for indice, item in enumerate(validados):
+        if item is None:
+            resultado.append(errores[indice])
+            continue
+        errores_referencias = _validar_referencias(item, farmacias, repartidores)
+        if errores_referencias:
+            resultado.append(errores_referencias)
+            continue
+        medicamentos = item.pop('medicamentos', [])
+        try:
+            orden = _construir_orden(item)
+        except ValueError as error:
+            resultado.append({'farmacia_destino': [str(error)]})
+            continue
+        resultado.append((orden, medicamentos))
+    return resultado
+
+
+def crear_ordenes_lote(datos):
+    """Crea las órdenes válidas del lote y devuelve el resultado de cada una.
+
+    Cada resultado es {'indice', 'id'} si se creó o {'indice', 'errores'}.
+    """
+    validados = validar_lote(datos)
+    ordenes = [item[0] for item in validados if isinstance(item, tuple)]
+
+    with transaction.atomic():
+        Orden.objects.bulk_create(ordenes, batch_size=TAMANO_BATCH)
+
+        medicamentos = []
+        movimientos = []
+        for item in validados:
+            if not isinstance(item, tuple):
+                continue
+            orden, datos_medicamentos = item
+            medicamentos.extend(Medicamento(orden=orden, **datos) for datos in datos_medicamentos)
+            movimientos.append(OrdenMovimiento(
+                orden=orden,
+                estado=orden.estado_actual,
+                descripcion='Orden creada',
+            ))
+        Medicamento.objects.bulk_create(medicamentos, batch_size=TAMANO_BATCH)
+        OrdenMovimiento.objects.bulk_create(movimientos, batch_size=TAMANO_BATCH)
+
+        estadisticas.aplicar_deltas(estadisticas.calcular_deltas_lote(Orden, ordenes))
+        agregados.aplicar_movimientos_lote(movimientos)
+        condicional.incrementar('ordenes')
+
+    resultados = []
+    for indice, item in enumerate(validados):
+        if isinstance(item, tuple):
+            resultados.append({'indice': indice, 'id': item[0].pk})
+        else:
+            resultados.append({'indice': indice, 'errores': item})
+    return resultados
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.asignacion import LIMITE, MAXIMO_POR_REPARTIDOR, asignar
+
+
+class Command(BaseCommand):
+    help = 'Asigna automáticamente las órdenes sin responsable a los repartidores disponibles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=LIMITE, help='Órdenes por ronda')
+        parser.add_argument('--maximo', type=int, default=MAXIMO_POR_REPARTIDOR, help='Órdenes abiertas por repartidor')
+        parser.add_argument('--simular', action='store_true', help='Mostrar la asignación sin guardarla')
+        parser.add_argument('--continuo', action='store_true', help='Repetir periódicamente')
+        parser.add_argument('--espera', type=float, default=60, help='Segundos entre rondas (--continuo)')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            resumen = asignar(options['limite'], options['maximo'], options['simular'])
+            total += resumen['asignadas']
+            if options['simular'] or options['verbosity'] > 1:
+                for asignacion in resumen['asignaciones']:
+                    distancia = asignacion['distancia_km']
+                    self.stdout.write(
+                        f'  Orden #{asignacion["orden"]} -> repartidor #{asignacion["repartidor"]}'
+                        + (f' ({distancia} km)' if distancia is not None else '')
+                    )
+            if resumen['asignadas'] or resumen['sin_asignar']:
+                self.stdout.write(f'  {resumen["asignadas"]} asignadas, {resumen["sin_asignar"]} sin repartidor disponible')
+            if not options['continuo'] or options['simular']:
+                break
+            if resumen['asignadas'] and resumen['asignadas'] + resumen['sin_asignar'] >= options['limite']:
+                continue  # quedan más órdenes
+            close_old_connections()
+            time.sleep(options['espera'])
+
+        accion = 'se asignarían' if options['simular'] else 'asignadas'
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} órdenes {accion}'))
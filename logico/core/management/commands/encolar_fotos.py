@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.fotos import encolar_existentes
+
+
+class Command(BaseCommand):
+    help = 'Encola las fotos de entrega existentes que aún no tienen miniatura'
+
+    def handle(self, *args, **options):
+        encoladas = encolar_existentes()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {encoladas} fotos encoladas (procesar con: python manage.py procesar_fotos)'
+        ))
@@ -0,0 +1,90 @@
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from core.busqueda import buscar
+from core.models import Despacho, Orden, OrdenMovimiento, UsuarioProfile
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas frecuentes y verifica que usen índices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='Usar EXPLAIN ANALYZE (PostgreSQL)')
+        parser.add_argument('--sin-seqscan', action='store_true',
+                            help='Desactivar seq scans (PostgreSQL) para comprobar que el índice es utilizable en tablas pequeñas')
+        parser.add_argument('--detalle', action='store_true', help='Mostrar el plan completo')
+
+    def consultas(self):
+        """Consultas de las vistas y viewsets, con valores de ejemplo tomados de la BD"""
+        repartidor = UsuarioProfile.objects.filter(rol='repartidor').first()
+        orden = Orden.objects.first()
+        if repartidor is None or orden is None:
+            return None
+        inicio_dia = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        
+        return [
+            ('orden_list (repartidor + estado)',
+             Orden.objects.filter(responsable=repartidor, estado_actual='despacho').order_by('-fecha_creacion')[:50]),
+            ('orden_list / OrdenViewSet (keyset)',
+             Orden.objects.order_by('-fecha_creacion', '-id')[:50]),
+            ('Orden.pendientes_redespacho',
+             Orden.objects.pendientes_redespacho()[:50]),
+            ('Despacho.save (último número de la orden)',
+             Despacho.objects.filter(orden=orden).order_by('-numero_despacho')[:1]),
+            ('DespachoViewSet (repartidor + resultado)',
+             Despacho.objects.filter(repartidor=repartidor, resultado='entregado')),
+            ('Despachos en curso de una orden',
+             Despacho.objects.filter(orden=orden, resultado__isnull=True)),
+            ('Despachos del día (reporte / gráfico)',
+             Despacho.objects.filter(fecha__gte=inicio_dia, fecha__lt=inicio_dia + timedelta(days=1))),
+            ('orden_detail (movimientos de la orden)',
+             OrdenMovimiento.objects.filter(orden=orden).order_by('-timestamp')),
+            ('MovimientoViewSet (keyset)',
+             OrdenMovimiento.objects.order_by('-timestamp', '-id')[:50]),
+            ('Búsqueda de órdenes por teléfono',
+             buscar(Orden.objects.all(), orden.telefono_normalizado[:5])),
+            ('Búsqueda de órdenes por cliente',
+             buscar(Orden.objects.all(), orden.cliente)),
+            ('Repartidores disponibles',
+             UsuarioProfile.objects.filter(rol='repartidor', activo=True, estado_turno='disponible')),
+        ]
+
+    def usa_indice(self, plan):
+        if connection.vendor == 'postgresql':
+            return 'Index' in plan
+        if connection.vendor == 'sqlite':
+            return 'USING INDEX' in plan or 'USING COVERING INDEX' in plan or 'USING INTEGER PRIMARY KEY' in plan
+        return 'index' in plan.lower()
+
+    def handle(self, *args, **options):
+        consultas = self.consultas()
+        if consultas is None:
+            self.stdout.write(self.style.WARNING('No hay datos: ejecute primero seed_data'))
+            return
+        
+        explain_opciones = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_opciones['analyze'] = True
+        
+        sin_indice = 0
+        with transaction.atomic():
+            if options['sin_seqscan'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            
+            for nombre, queryset in consultas:
+                plan = queryset.explain(**explain_opciones)
+                if self.usa_indice(plan):
+                    self.stdout.write(self.style.SUCCESS(f'✓ {nombre}'))
+                else:
+                    sin_indice += 1
+                    self.stdout.write(self.style.WARNING(f'⚠ {nombre}: no usa índice'))
+                if options['detalle'] or not self.usa_indice(plan):
+                    for linea in plan.splitlines():
+                        self.stdout.write(f'    {linea}')
+        
+        if sin_indice:
+            self.stdout.write(self.style.WARNING(f'\n{sin_indice} de {len(consultas)} consultas sin índice'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'\n✓ Las {len(consultas)} consultas usan índices'))
@@ -1,47 +1,51 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from django.db.models import Count, Q
-from datetime import timedelta
-from core.models import Despacho, Reporte
+from django.utils.dateparse import parse_date
+from core.models import Reporte
+from core.reportes import regenerar_rango
 
 
 class Command(BaseCommand):
-    help = 'Genera reporte diario automático'
+    help = 'Genera (o recalcula) el reporte diario; con --desde/--hasta rellena un rango'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Día a generar (AAAA-MM-DD), por defecto hoy')
+        parser.add_argument('--desde', help='Inicio del rango a rellenar (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fin del rango a rellenar (AAAA-MM-DD), por defecto hoy')
+        parser.add_argument('--workers', type=int, default=1, help='Hilos para calcular el rango en paralelo')
+        parser.add_argument('--dias-por-tramo', type=int, default=7, help='Días que calcula cada hilo por vez')
+
+    def fecha(self, valor, nombre):
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise CommandError(f'{nombre} debe tener el formato AAAA-MM-DD')
+        return fecha
 
     def handle(self, *args, **options):
-        fecha = timezone.now().date()
-        
-        # Verificar si ya existe un reporte para hoy
-        if Reporte.objects.filter(fecha=fecha).exists():
-            self.stdout.write(self.style.WARNING(f'Ya existe un reporte para la fecha {fecha}'))
-            return
+        hoy = timezone.localdate()
+        if options['desde']:
+            desde = self.fecha(options['desde'], '--desde')
+            hasta = self.fecha(options['hasta'], '--hasta') if options['hasta'] else hoy
+        else:
+            desde = hasta = self.fecha(options['fecha'], '--fecha') if options['fecha'] else hoy
+        if desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
         
-        # Obtener despachos del día
-        despachos_dia = Despacho.objects.filter(fecha__date=fecha)
+        # Recalcular es idempotente: si el reporte ya existe se sobrescriben sus valores
+        creados = regenerar_rango(desde, hasta, workers=options['workers'], dias_por_tramo=options['dias_por_tramo'])
         
-        entregas_totales = despachos_dia.count()
-        entregas_exitosas = despachos_dia.filter(resultado='entregado').count()
-        entregas_fallidas = despachos_dia.filter(
-            Q(resultado='no_disponible') | Q(resultado='error')
-        ).count()
-        
-        # Calcular tiempo promedio (simplificado)
-        tiempo_promedio = timedelta(minutes=30)  # Valor por defecto
-        
-        # Crear reporte
-        reporte = Reporte.objects.create(
-            fecha=fecha,
-            entregas_totales=entregas_totales,
-            entregas_exitosas=entregas_exitosas,
-            entregas_fallidas=entregas_fallidas,
-            tiempo_promedio=tiempo_promedio,
-            ingresos_dia=0,  # Se puede calcular según lógica de negocio
-            observaciones=f'Reporte automático generado el {timezone.now().strftime("%Y-%m-%d %H:%M:%S")}',
-        )
+        if desde != hasta:
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Reportes del {desde} al {hasta} recalculados ({creados} nuevos)'
+            ))
+            return
         
-        self.stdout.write(self.style.SUCCESS(f'✓ Reporte creado para {fecha}'))
-        self.stdout.write(self.style.SUCCESS(f'  Entregas totales: {entregas_totales}'))
-        self.stdout.write(self.style.SUCCESS(f'  Entregas exitosas: {entregas_exitosas}'))
-        self.stdout.write(self.style.SUCCESS(f'  Entregas fallidas: {entregas_fallidas}'))
+        reporte = Reporte.objects.get(fecha=desde)
+        accion = 'creado' if creados else 'actualizado'
+        self.stdout.write(self.style.SUCCESS(f'✓ Reporte {accion} para {desde}'))
+        self.stdout.write(self.style.SUCCESS(f'  Entregas totales: {reporte.entregas_totales}'))
+        self.stdout.write(self.style.SUCCESS(f'  Entregas exitosas: {reporte.entregas_exitosas}'))
+        self.stdout.write(self.style.SUCCESS(f'  Entregas fallidas: {reporte.entregas_fallidas}'))
         self.stdout.write(self.style.SUCCESS(f'  Tasa de éxito: {reporte.tasa_exito:.2f}%'))
-
+        self.stdout.write(self.style.SUCCESS(f'  Tiempo promedio: {reporte.tiempo_promedio or "sin datos"}'))
+        self.stdout.write(self.style.SUCCESS(f'  Ingresos: {reporte.ingresos_dia}'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.zonas import TAMANO_ZONA, generar
+
+
+class Command(BaseCommand):
+    help = 'Agrupa las órdenes pendientes en zonas y crea o actualiza una ruta por zona'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano', type=int, default=TAMANO_ZONA, help='Órdenes por zona')
+        parser.add_argument('--zonas', type=int, help='Cantidad de zonas (en lugar de --tamano)')
+        parser.add_argument('--sin-optimizar', action='store_true', help='No secuenciar las paradas')
+
+    def handle(self, *args, **options):
+        if options['tamano'] < 1 or (options['zonas'] is not None and options['zonas'] < 1):
+            raise CommandError('--tamano y --zonas deben ser positivos')
+        resumen = generar(options['tamano'], options['zonas'], not options['sin_optimizar'])
+        if options['verbosity'] > 1:
+            for ruta in resumen['rutas']:
+                distancia = ruta['distancia_km']
+                self.stdout.write(
+                    f'  {ruta["zona"]} (ruta #{ruta["id"]}): {ruta["ordenes"]} órdenes'
+                    + (f', {distancia} km' if distancia is not None else '')
+                )
+        if resumen['sin_coordenadas']:
+            self.stdout.write(f'  {resumen["sin_coordenadas"]} órdenes sin coordenadas quedaron fuera (ver geocodificar)')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {resumen["ordenes"]} órdenes en {len(resumen["rutas"])} zonas: '
+            f'{resumen["rutas_creadas"]} rutas creadas, {resumen["rutas_actualizadas"]} actualizadas, '
+            f'{resumen["rutas_desactivadas"]} desactivadas'
+        ))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.geocodificacion import ProveedorNoDisponible, geocodificar_pendientes, metricas
+from core.models import Farmacia, Orden
+
+
+class Command(BaseCommand):
+    help = 'Geocodifica las direcciones pendientes de órdenes y farmacias (usando la caché de direcciones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Filas por consulta')
+        parser.add_argument('--reintentar', action='store_true', help='Reintentar también las que no se encontraron')
+        parser.add_argument('--continuo', action='store_true', help='Seguir esperando direcciones nuevas')
+        parser.add_argument('--espera', type=float, default=60, help='Segundos entre rondas sin pendientes (--continuo)')
+
+    def handle(self, *args, **options):
+        encontradas = sin_resultado = 0
+        reintentar = options['reintentar']
+        while True:
+            ronda = 0
+            for modelo in (Farmacia, Orden):
+                while True:
+                    try:
+                        con, sin = geocodificar_pendientes(modelo, options['lote'], reintentar)
+                    except ProveedorNoDisponible as error:
+                        if not options['continuo']:
+                            raise CommandError(f'Proveedor de geocodificación no disponible: {error}')
+                        self.stderr.write(f'Proveedor de geocodificación no disponible: {error}')
+                        con = sin = 0
+                    if not con and not sin:
+                        break
+                    ronda += con + sin
+                    encontradas += con
+                    sin_resultado += sin
+                    self.stdout.write(f'  {modelo._meta.verbose_name_plural}: {con} geocodificadas, {sin} sin resultado')
+            # Las no encontradas solo se reintentan en la primera ronda
+            reintentar = False
+            if not options['continuo']:
+                break
+            if not ronda:
+                close_old_connections()
+                time.sleep(options['espera'])
+
+        cache = metricas()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {encontradas} direcciones geocodificadas, {sin_resultado} sin resultado; '
+            f'caché: {cache["direcciones"]} direcciones, tasa de aciertos {cache["tasa_aciertos"]}%'
+        ))
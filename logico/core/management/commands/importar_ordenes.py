@@ -0,0 +1,285 @@
+import csv
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import agregados, condicional
+from core.estadisticas import reconstruir_estadisticas
+from core.reportes import regenerar_rango
+from core.models import AvanceImportacion, Despacho, Farmacia, Medicamento, Orden, OrdenMovimiento, UsuarioProfile
+
+
+class RegistroInvalido(Exception):
+    pass
+
+
+@contextmanager
+def fechas_historicas(*campos):
+    """Desactiva auto_now/auto_now_add para conservar las fechas del archivo"""
+    originales = [(campo, campo.auto_now, campo.auto_now_add) for campo in campos]
+    for campo in campos:
+        campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in originales:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Importa órdenes históricas (con medicamentos y despachos) desde un archivo CSV o JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo .csv o .jsonl (opcionalmente .gz)')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Por defecto se deduce de la extensión')
+        parser.add_argument('--lote', type=int, default=1000, help='Órdenes por transacción')
+        parser.add_argument('--checkpoint', help='Clave del avance guardado en la BD (por defecto la ruta absoluta del archivo)')
+        parser.add_argument('--reiniciar', action='store_true', help='Ignorar el checkpoint existente')
+
+    # ---------------------------------------------------------------- lectura
+
+    def abrir(self, archivo):
+        if archivo.endswith('.gz'):
+            return gzip.open(archivo, 'rt', encoding='utf-8', newline='')
+        return open(archivo, encoding='utf-8', newline='')
+
+    def registros(self, archivo, formato):
+        """Genera los registros del archivo uno a uno, sin cargarlo en memoria.
+
+        En CSV cada fila es una orden y las columnas medicamentos y despachos
+        contienen listas JSON; en JSONL cada línea es una orden con las listas
+        anidadas.
+        """
+        with self.abrir(archivo) as entrada:
+            if formato == 'csv':
+                for fila in csv.DictReader(entrada):
+                    for campo in ('medicamentos', 'despachos'):
+                        try:
+                            fila[campo] = json.loads(fila.get(campo) or '[]')
+                        except ValueError:
+                            fila[campo] = None
+                    yield fila
+            else:
+                for linea in entrada:
+                    if not linea.strip():
+                        continue
+                    try:
+                        yield json.loads(linea)
+                    except ValueError:
+                        yield None
+
+    # ------------------------------------------------------------ conversión
+
+    def fecha(self, valor, por_defecto):
+        if not valor:
+            return por_defecto
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            raise RegistroInvalido(f'Fecha inválida: {valor}')
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        return fecha
+
+    def entero(self, valor, por_defecto, campo):
+        if valor in (None, ''):
+            return por_defecto
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            raise RegistroInvalido(f'{campo} inválido: {valor}')
+
+    def opcion(self, valor, opciones, por_defecto, campo):
+        if not valor:
+            return por_defecto
+        if valor not in opciones:
+            raise RegistroInvalido(f'{campo} inválido: {valor}')
+        return valor
+
+    def buscar(self, tabla, clave, descripcion):
+        if not clave:
+            return None
+        try:
+            return tabla[clave.strip().lower()]
+        except KeyError:
+            raise RegistroInvalido(f'{descripcion} no encontrado: {clave}')
+
+    def construir(self, registro):
+        """Convierte un registro en (orden, medicamentos, despachos) sin guardar"""
+        if not isinstance(registro, dict):
+            raise RegistroInvalido('Registro ilegible')
+        for campo in ('cliente', 'direccion', 'telefono_cliente'):
+            if not registro.get(campo):
+                raise RegistroInvalido(f'Falta {campo}')
+        if not isinstance(registro.get('medicamentos'), list) or not isinstance(registro.get('despachos'), list):
+            raise RegistroInvalido('medicamentos y despachos deben ser listas')
+
+        fecha_creacion = self.fecha(registro.get('fecha_creacion'), self.ahora)
+        orden = Orden(
+            cliente=registro['cliente'],
+            direccion=registro['direccion'],
+            telefono_cliente=registro['telefono_cliente'],
+            descripcion=registro.get('descripcion') or '',
+            prioridad=self.opcion(registro.get('prioridad'), self.prioridades, 'media', 'prioridad'),
+            tipo=self.opcion(registro.get('tipo'), self.tipos, 'normal', 'tipo'),
+            estado_actual=self.opcion(registro.get('estado_actual'), self.estados_orden, 'retiro_receta', 'estado_actual'),
+            farmacia_origen_id=self.buscar(self.farmacias, registro.get('farmacia_origen'), 'Farmacia'),
+            farmacia_destino_id=self.buscar(self.farmacias, registro.get('farmacia_destino'), 'Farmacia'),
+            responsable_id=self.buscar(self.repartidores, registro.get('responsable'), 'Repartidor'),
+            # fecha_actualizacion queda en la de la importación: la sincronización de los
+            # dispositivos lee los cambios por esa columna y no vería una fecha histórica
+            fecha_creacion=fecha_creacion,
+        )
+        try:
+            orden.preparar_guardado()
+        except ValueError as error:
+            raise RegistroInvalido(str(error))
+
+        if not all(isinstance(datos, dict) for datos in registro['medicamentos'] + registro['despachos']):
+            raise RegistroInvalido('medicamentos y despachos deben contener objetos')
+
+        medicamentos = []
+        for datos in registro['medicamentos']:
+            cantidad = self.entero(datos.get('cantidad'), 0, 'cantidad')
+            if not datos.get('codigo') or not datos.get('nombre') or cantidad < 1:
+                raise RegistroInvalido(f'Medicamento inválido: {datos}')
+            medicamentos.append(Medicamento(
+                codigo=datos['codigo'],
+                nombre=datos['nombre'],
+                cantidad=cantidad,
+                observaciones=datos.get('observaciones') or '',
+            ))
+
+        despachos = []
+        for numero, datos in enumerate(registro['despachos'], start=1):
+            despachos.append(Despacho(
+                numero_despacho=self.entero(datos.get('numero_despacho'), numero, 'numero_despacho'),
+                repartidor_id=self.buscar(self.repartidores, datos.get('repartidor'), 'Repartidor'),
+                estado=self.opcion(datos.get('estado'), self.estados_despacho, 'despacho', 'estado'),
+                resultado=self.opcion(datos.get('resultado'), self.resultados, None, 'resultado'),
+                observaciones=datos.get('observaciones') or '',
+                fecha=self.fecha(datos.get('fecha'), fecha_creacion),
+            ))
+        if len({despacho.numero_despacho for despacho in despachos}) != len(despachos):
+            raise RegistroInvalido('numero_despacho repetido')
+
+        return orden, medicamentos, despachos
+
+    # ------------------------------------------------------------- escritura
+
+    def guardar_lote(self, lote, procesados):
+        """Guarda el lote y el avance en la misma transacción"""
+        with transaction.atomic():
+            Orden.objects.bulk_create([orden for orden, _, _ in lote])
+
+            medicamentos = []
+            despachos = []
+            movimientos = []
+            for orden, medicamentos_orden, despachos_orden in lote:
+                for medicamento in medicamentos_orden:
+                    medicamento.orden = orden
+                    medicamentos.append(medicamento)
+                for despacho in despachos_orden:
+                    despacho.orden = orden
+                    despachos.append(despacho)
+                movimientos.append(OrdenMovimiento(
+                    orden=orden,
+                    estado=orden.estado_actual,
+                    descripcion='Orden importada',
+                    timestamp=orden.fecha_creacion,
+                ))
+            Medicamento.objects.bulk_create(medicamentos)
+            Despacho.objects.bulk_create(despachos)
+            for despacho in despachos:
+                dia = timezone.localdate(despacho.fecha)
+                self.avance.primer_dia = min(self.avance.primer_dia or dia, dia)
+                self.avance.ultimo_dia = max(self.avance.ultimo_dia or dia, dia)
+            OrdenMovimiento.objects.bulk_create(movimientos)
+
+            # bulk_create no pasa por Despacho.save: se recalculan los punteros
+            if despachos:
+                Orden.objects.filter(
+                    pk__in={despacho.orden_id for despacho in despachos}
+                ).sincronizar_despachos()
+            condicional.incrementar('ordenes', 'despachos')
+
+            self.avance.procesados = procesados
+            self.avance.save()
+
+    def handle(self, *args, **options):
+        archivo = options['archivo']
+        if not os.path.exists(archivo):
+            raise CommandError(f'No existe el archivo {archivo}')
+        nombre = archivo[:-3] if archivo.endswith('.gz') else archivo
+        formato = options['formato'] or ('csv' if nombre.endswith('.csv') else 'jsonl')
+        tamano_lote = options['lote']
+        clave = options['checkpoint'] or os.path.abspath(archivo)
+
+        if options['reiniciar']:
+            AvanceImportacion.objects.filter(clave=clave).delete()
+        self.avance, _ = AvanceImportacion.objects.get_or_create(clave=clave)
+        procesados = self.avance.procesados
+        if procesados:
+            self.stdout.write(f'Reanudando desde el registro {procesados}')
+
+        # Tablas de búsqueda en memoria (farmacias y repartidores son pocos)
+        self.farmacias = {
+            nombre.strip().lower(): pk for pk, nombre in Farmacia.objects.values_list('pk', 'nombre')
+        }
+        self.repartidores = {
+            username.lower(): pk
+            for pk, username in UsuarioProfile.objects.filter(rol='repartidor').values_list('pk', 'user__username')
+        }
+        self.prioridades = dict(Orden.PRIORIDAD_CHOICES)
+        self.tipos = dict(Orden.TIPO_CHOICES)
+        self.estados_orden = dict(Orden.ESTADO_CHOICES)
+        self.estados_despacho = dict(Despacho.ESTADO_CHOICES)
+        self.resultados = dict(Despacho.RESULTADO_CHOICES)
+        self.ahora = timezone.now()
+
+        registros = islice(self.registros(archivo, formato), procesados, None)
+        importadas = invalidos = 0
+        lote = []
+        numero = procesados
+
+        with fechas_historicas(
+            Orden._meta.get_field('fecha_creacion'),
+            Despacho._meta.get_field('fecha'),
+            OrdenMovimiento._meta.get_field('timestamp'),
+        ):
+            for numero, registro in enumerate(registros, start=procesados + 1):
+                try:
+                    lote.append(self.construir(registro))
+                except RegistroInvalido as error:
+                    invalidos += 1
+                    self.stderr.write(f'Registro {numero}: {error}')
+
+                if numero - procesados >= tamano_lote:
+                    self.guardar_lote(lote, numero)
+                    importadas += len(lote)
+                    procesados = numero
+                    self.stdout.write(f'  {procesados} registros procesados')
+                    lote = []
+
+            if numero > procesados:
+                self.guardar_lote(lote, numero)
+                importadas += len(lote)
+
+        # Las estadísticas del dashboard, los agregados y los reportes diarios no se actualizan con bulk_create.
+        # Los reportes cubren los días de todo el archivo, también los de ejecuciones anteriores.
+        reconstruir_estadisticas()
+        agregados.reconstruir()
+        if self.avance.primer_dia:
+            regenerar_rango(self.avance.primer_dia, self.avance.ultimo_dia)
+        # El avance se borra al final: si algo falla antes, reanudar solo rehace la reconstrucción
+        self.avance.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {importadas} órdenes importadas, {invalidos} registros inválidos'
+        ))
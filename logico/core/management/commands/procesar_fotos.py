@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.fotos import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Worker de fotos de entrega: redimensiona, quita EXIF, recomprime y genera miniaturas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=20, help='Trabajos que se toman por vez')
+        parser.add_argument('--continuo', action='store_true', help='Seguir esperando trabajos nuevos')
+        parser.add_argument('--espera', type=float, default=5, help='Segundos entre consultas sin trabajos (--continuo)')
+
+    def handle(self, *args, **options):
+        total_procesados = total_fallidos = 0
+        while True:
+            procesados, fallidos = procesar_pendientes(options['lote'])
+            total_procesados += procesados
+            total_fallidos += fallidos
+            if procesados or fallidos:
+                self.stdout.write(f'  {procesados} fotos procesadas, {fallidos} con error')
+                continue
+            if not options['continuo']:
+                break
+            close_old_connections()
+            time.sleep(options['espera'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {total_procesados} fotos procesadas, {total_fallidos} con error (se reintentan)'
+        ))
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.sincronizacion import purgar, retencion
+
+
+class Command(BaseCommand):
+    help = 'Elimina las lápidas de sincronización más antiguas que la retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Por defecto settings.SINCRONIZACION_RETENCION_DIAS')
+
+    def handle(self, *args, **options):
+        dias = options['dias']
+        limite = timezone.now() - (timedelta(days=dias) if dias is not None else retencion())
+        eliminadas = purgar(limite)
+        self.stdout.write(self.style.SUCCESS(f'✓ {eliminadas} lápidas anteriores a {limite:%Y-%m-%d %H:%M} eliminadas'))
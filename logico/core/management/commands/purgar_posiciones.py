@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.posiciones import TAMANO_PURGA, purgar, retencion
+
+
+class Command(BaseCommand):
+    help = 'Elimina del historial las posiciones de repartidores más antiguas que la retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Por defecto settings.POSICIONES_RETENCION_DIAS')
+        parser.add_argument('--lote', type=int, default=TAMANO_PURGA, help='Filas eliminadas por sentencia')
+
+    def handle(self, *args, **options):
+        dias = options['dias']
+        limite = timezone.now() - (timedelta(days=dias) if dias is not None else retencion())
+        eliminadas = purgar(limite, max(1, options['lote']))
+        self.stdout.write(self.style.SUCCESS(f'✓ {eliminadas} posiciones anteriores a {limite:%Y-%m-%d %H:%M} eliminadas'))
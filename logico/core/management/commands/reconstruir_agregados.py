@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from core.agregados import reconstruir
+from core.models import AgregadoDespacho, AgregadoMovimiento
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los agregados por hora y día de despachos y movimientos'
+
+    def handle(self, *args, **options):
+        reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Agregados reconstruidos ({AgregadoDespacho.objects.count()} de despachos, '
+            f'{AgregadoMovimiento.objects.count()} de movimientos)'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.estadisticas import reconstruir_estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas precalculadas del dashboard'
+
+    def handle(self, *args, **options):
+        filas = reconstruir_estadisticas()
+        self.stdout.write(self.style.SUCCESS(f'✓ Estadísticas reconstruidas ({filas} filas)'))
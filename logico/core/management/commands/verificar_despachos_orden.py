@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+from core.models import Despacho, Orden
+
+
+class Command(BaseCommand):
+    help = 'Verifica (y opcionalmente repara) Orden.ultimo_despacho y Orden.total_despachos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparar', action='store_true', help='Corregir las órdenes inconsistentes')
+        parser.add_argument('--lote', type=int, default=1000, help='Órdenes por UPDATE al reparar')
+
+    def handle(self, *args, **options):
+        # Valores esperados por orden calculados en una sola consulta agrupada
+        esperados = {
+            item['orden']: item
+            for item in Despacho.objects.values('orden').annotate(
+                total=Count('id'), max_numero=Max('numero_despacho')
+            ).order_by()
+        }
+        
+        inconsistentes = []
+        ordenes = Orden.objects.values_list(
+            'id', 'total_despachos', 'ultimo_despacho__numero_despacho'
+        ).order_by().iterator(chunk_size=2000)
+        for orden_id, total, ultimo_numero in ordenes:
+            esperado = esperados.get(orden_id, {'total': 0, 'max_numero': None})
+            if total != esperado['total'] or ultimo_numero != esperado['max_numero']:
+                inconsistentes.append(orden_id)
+        
+        if not inconsistentes:
+            self.stdout.write(self.style.SUCCESS('✓ Todas las órdenes son consistentes'))
+            return
+        
+        self.stdout.write(self.style.WARNING(f'{len(inconsistentes)} órdenes inconsistentes'))
+        if not options['reparar']:
+            self.stdout.write('Ejecute con --reparar para corregirlas')
+            return
+        
+        lote = options['lote']
+        reparadas = 0
+        for inicio in range(0, len(inconsistentes), lote):
+            reparadas += Orden.objects.filter(pk__in=inconsistentes[inicio:inicio + lote]).sincronizar_despachos()
+        self.stdout.write(self.style.SUCCESS(f'✓ {reparadas} órdenes reparadas'))
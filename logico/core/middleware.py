@@ -0,0 +1,82 @@
+"""
+Resolución del UsuarioProfile del usuario autenticado una sola vez por request.
+
+UsuarioProfileMiddleware expone request.profile como objeto perezoso: se
+resuelve la primera vez que una vista lo usa (después de la autenticación de
+DRF, por lo que también funciona con TokenAuthentication). La fila del
+perfil y la de su moto se guardan en caché por usuario con un TTL corto y se
+invalidan desde las señales de UsuarioProfile y Moto.
+
+La invalidación solo llega a los demás procesos si la caché es compartida
+(REDIS_URL en settings); con la caché local por defecto, un cambio de rol
+puede tardar hasta PERFIL_CACHE_TTL segundos en verse en otro proceso.
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject
+
+from .models import Moto, UsuarioProfile
+
+PERFIL_CACHE_TTL = 60
+
+PERFIL_DEFAULTS = {
+    'telefono': '',
+    'rol': 'repartidor',
+    'estado_turno': 'disponible',
+    'activo': True,
+}
+
+
+# La última posición no se guarda: cambia a cada momento y se lee de core.posiciones
+CAMPOS_PERFIL = [
+    field.attname for field in UsuarioProfile._meta.concrete_fields
+    if field.name not in UsuarioProfile.CAMPOS_POSICION
+]
+CAMPOS_MOTO = [field.attname for field in Moto._meta.concrete_fields]
+
+
+def clave_cache_perfil(user_id):
+    return f'perfil:{user_id}'
+
+
+def invalidar_perfil(user_id):
+    cache.delete(clave_cache_perfil(user_id))
+
+
+def obtener_perfil(user):
+    """Perfil del usuario con su moto (lo crea con valores por defecto si no existe).
+
+    Con la caché caliente no consulta la BD: arma las instancias con los
+    valores guardados (la última posición queda diferida).
+    """
+    if user is None or not user.is_authenticated:
+        return None
+
+    datos = cache.get(clave_cache_perfil(user.pk))
+    if datos is not None:
+        valores_perfil, valores_moto = datos
+        perfil = UsuarioProfile.from_db(DEFAULT_DB_ALIAS, CAMPOS_PERFIL, valores_perfil)
+        perfil.moto = Moto.from_db(DEFAULT_DB_ALIAS, CAMPOS_MOTO, valores_moto) if valores_moto else None
+    else:
+        perfil, _ = UsuarioProfile.objects.select_related('user', 'moto').get_or_create(
+            user=user, defaults=PERFIL_DEFAULTS
+        )
+        valores_moto = [getattr(perfil.moto, campo) for campo in CAMPOS_MOTO] if perfil.moto else None
+        cache.set(
+            clave_cache_perfil(user.pk),
+            ([getattr(perfil, campo) for campo in CAMPOS_PERFIL], valores_moto),
+            PERFIL_CACHE_TTL,
+        )
+    perfil.user = user
+    return perfil
+
+
+class UsuarioProfileMiddleware:
+    """Agrega request.profile (perezoso) a cada request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: obtener_perfil(request.user))
+        return self.get_response(request)
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_farmacia_orden_farmacia_destino_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaDashboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=30, unique=True)),
+                ('total_ordenes', models.IntegerField(default=0)),
+                ('ordenes_retiro_receta', models.IntegerField(default=0)),
+                ('ordenes_traslado', models.IntegerField(default=0)),
+                ('ordenes_despacho', models.IntegerField(default=0)),
+                ('ordenes_re_despacho', models.IntegerField(default=0)),
+                ('total_despachos', models.IntegerField(default=0)),
+                ('despachos_entregado', models.IntegerField(default=0)),
+                ('despachos_no_disponible', models.IntegerField(default=0)),
+                ('despachos_error', models.IntegerField(default=0)),
+                ('despachos_sin_resultado', models.IntegerField(default=0)),
+                ('repartidores_activos', models.IntegerField(default=0)),
+                ('motos_activas', models.IntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('repartidor', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadistica_dashboard', to='core.usuarioprofile')),
+            ],
+            options={
+                'verbose_name': 'Estadística de Dashboard',
+                'verbose_name_plural': 'Estadísticas de Dashboard',
+                'ordering': ['clave'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def poblar_despachos_orden(apps, schema_editor):
+    Orden = apps.get_model('core', 'Orden')
+    Despacho = apps.get_model('core', 'Despacho')
+    despachos = Despacho.objects.filter(orden=OuterRef('pk'))
+    Orden.objects.update(
+        ultimo_despacho=Subquery(despachos.order_by('-numero_despacho').values('pk')[:1]),
+        total_despachos=Coalesce(
+            Subquery(despachos.order_by().values('orden').annotate(total=Count('id')).values('total')),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_estadisticadashboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orden',
+            name='total_despachos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='ultimo_despacho',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.despacho'),
+        ),
+        migrations.RunPython(poblar_despachos_orden, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_orden_ultimo_despacho_total_despachos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['-fecha', '-id'], name='despacho_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='orden_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmovimiento',
+            index=models.Index(fields=['-timestamp', '-id'], name='movimiento_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_indices_keyset'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['repartidor', 'resultado'], name='despacho_repartidor_res_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(condition=models.Q(('resultado__isnull', True)), fields=['orden'], name='despacho_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['responsable', 'estado_actual', '-fecha_creacion'], name='orden_resp_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmovimiento',
+            index=models.Index(fields=['orden', '-timestamp'], name='movimiento_orden_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuarioprofile',
+            index=models.Index(condition=models.Q(('activo', True), ('rol', 'repartidor')), fields=['estado_turno'], name='perfil_repartidor_activo_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:37
+
+import re
+
+from django.db import migrations, models
+
+# Copia de core.busqueda.normalizar_telefono al escribir esta migración: los
+# cambios posteriores de la función no deben alterar lo que hace.
+CODIGO_PAIS = '56'
+LARGO_TELEFONO = 9
+
+
+def normalizar_telefono(telefono):
+    telefono = (telefono or '').strip()
+    digitos = re.sub(r'\D', '', telefono)
+    con_codigo = len(digitos) > LARGO_TELEFONO or telefono.startswith('+')
+    if con_codigo and digitos.startswith(CODIGO_PAIS):
+        digitos = digitos[len(CODIGO_PAIS):]
+    return digitos
+
+
+# Índices GIN de trigramas sobre la expresión que genera icontains en
+# PostgreSQL (UPPER(columna::text) LIKE UPPER(%s)); solo se crean en ese motor.
+INDICES_TRIGRAMAS = [
+    ('orden_cliente_trgm_idx', 'core_orden', 'cliente'),
+    ('orden_direccion_trgm_idx', 'core_orden', 'direccion'),
+    ('medicamento_nombre_trgm_idx', 'core_medicamento', 'nombre'),
+    ('medicamento_codigo_trgm_idx', 'core_medicamento', 'codigo'),
+]
+
+
+def poblar_telefono_normalizado(apps, schema_editor):
+    Orden = apps.get_model('core', 'Orden')
+    lote = []
+    for orden in Orden.objects.only('id', 'telefono_cliente').iterator(chunk_size=2000):
+        orden.telefono_normalizado = normalizar_telefono(orden.telefono_cliente)
+        lote.append(orden)
+        if len(lote) >= 2000:
+            Orden.objects.bulk_update(lote, ['telefono_normalizado'])
+            lote = []
+    if lote:
+        Orden.objects.bulk_update(lote, ['telefono_normalizado'])
+
+
+def crear_indices_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for nombre, tabla, columna in INDICES_TRIGRAMAS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} '
+            f'USING gin (UPPER({columna}::text) gin_trgm_ops)'
+        )
+
+
+def eliminar_indices_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, _, _ in INDICES_TRIGRAMAS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orden',
+            name='telefono_normalizado',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(poblar_telefono_normalizado, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_trigramas, eliminar_indices_trigramas),
+    ]
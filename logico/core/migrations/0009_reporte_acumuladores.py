@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:44
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='entregas_medidas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='tiempo_entrega_total',
+            field=models.DurationField(default=datetime.timedelta(0), editable=False),
+        ),
+    ]
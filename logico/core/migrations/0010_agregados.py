@@ -0,0 +1,107 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:47
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+import django.db.models.deletion
+
+# Copia de la reconstrucción de core.agregados al escribir esta migración:
+# los cambios posteriores del módulo no deben alterar lo que hace.
+TRUNCADORES = {
+    'hora': TruncHour,
+    'dia': TruncDay,
+}
+TAMANO_BATCH = 2000
+
+
+def _clave(granularidad, inicio, *dimensiones):
+    partes = [granularidad, str(int(inicio.timestamp()))]
+    partes += ['' if valor is None else str(valor) for valor in dimensiones]
+    return '|'.join(partes)
+
+
+def _reconstruir_modelo(agregado, consulta, campo_fecha, dimensiones):
+    lote = []
+    for granularidad, truncar in TRUNCADORES.items():
+        filas = consulta.annotate(tramo=truncar(campo_fecha)).values('tramo', *dimensiones.values()).annotate(
+            total=Count('id')
+        ).order_by()
+        for fila in filas.iterator(chunk_size=TAMANO_BATCH):
+            valores = {campo: fila[origen] for campo, origen in dimensiones.items()}
+            if 'resultado' in valores:
+                valores['resultado'] = valores['resultado'] or ''
+            lote.append(agregado(
+                clave=_clave(granularidad, fila['tramo'], *valores.values()),
+                granularidad=granularidad,
+                inicio=fila['tramo'],
+                cantidad=fila['total'],
+                **valores
+            ))
+            if len(lote) >= TAMANO_BATCH:
+                agregado.objects.bulk_create(lote)
+                lote = []
+    agregado.objects.bulk_create(lote)
+
+
+def poblar_agregados(apps, schema_editor):
+    Despacho = apps.get_model('core', 'Despacho')
+    OrdenMovimiento = apps.get_model('core', 'OrdenMovimiento')
+    _reconstruir_modelo(apps.get_model('core', 'AgregadoDespacho'), Despacho.objects.all(), 'fecha', {
+        'repartidor_id': 'repartidor_id',
+        'farmacia_id': 'orden__farmacia_origen_id',
+        'resultado': 'resultado',
+        'estado': 'estado',
+    })
+    _reconstruir_modelo(apps.get_model('core', 'AgregadoMovimiento'), OrdenMovimiento.objects.all(), 'timestamp', {
+        'repartidor_id': 'repartidor_id',
+        'estado': 'estado',
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_reporte_acumuladores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgregadoMovimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('granularidad', models.CharField(choices=[('hora', 'Hora'), ('dia', 'Día')], max_length=4)),
+                ('inicio', models.DateTimeField()),
+                ('estado', models.CharField(max_length=20)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('repartidor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.usuarioprofile')),
+            ],
+            options={
+                'verbose_name': 'Agregado de Movimientos',
+                'verbose_name_plural': 'Agregados de Movimientos',
+                'ordering': ['granularidad', 'inicio'],
+                'indexes': [models.Index(fields=['granularidad', 'inicio'], name='agregado_movimiento_inicio_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgregadoDespacho',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('granularidad', models.CharField(choices=[('hora', 'Hora'), ('dia', 'Día')], max_length=4)),
+                ('inicio', models.DateTimeField()),
+                ('resultado', models.CharField(blank=True, max_length=20)),
+                ('estado', models.CharField(max_length=20)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('farmacia', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.farmacia')),
+                ('repartidor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.usuarioprofile')),
+            ],
+            options={
+                'verbose_name': 'Agregado de Despachos',
+                'verbose_name_plural': 'Agregados de Despachos',
+                'ordering': ['granularidad', 'inicio'],
+                'indexes': [models.Index(fields=['granularidad', 'inicio'], name='agregado_despacho_inicio_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import OuterRef, Subquery
+
+
+def poblar_fecha_actualizacion(apps, schema_editor):
+    """Las filas existentes toman su fecha de creación (o la de su orden)"""
+    Orden = apps.get_model('core', 'Orden')
+    apps.get_model('core', 'Despacho').objects.update(fecha_actualizacion=models.F('fecha'))
+    apps.get_model('core', 'OrdenMovimiento').objects.update(fecha_actualizacion=models.F('timestamp'))
+    apps.get_model('core', 'Medicamento').objects.update(fecha_actualizacion=Subquery(
+        Orden.objects.filter(pk=OuterRef('orden_id')).values('fecha_actualizacion')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_version_recurso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroEliminado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('orden', 'Orden'), ('despacho', 'Despacho'), ('medicamento', 'Medicamento'), ('movimiento', 'Movimiento')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('reasignado', models.BooleanField(default=False)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Registro Eliminado',
+                'verbose_name_plural': 'Registros Eliminados',
+                'ordering': ['fecha', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='despacho',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='medicamento',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ordenmovimiento',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(poblar_fecha_actualizacion, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['fecha_actualizacion', 'id'], name='despacho_actualizacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despacho',
+            index=models.Index(fields=['repartidor', 'fecha_actualizacion', 'id'], name='despacho_rep_actualizacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['fecha_actualizacion', 'id'], name='medicamento_actualizacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['fecha_actualizacion', 'id'], name='orden_actualizacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['responsable', 'fecha_actualizacion', 'id'], name='orden_resp_actualizacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmovimiento',
+            index=models.Index(fields=['fecha_actualizacion', 'id'], name='movimiento_actualizacion_idx'),
+        ),
+        migrations.AddField(
+            model_name='registroeliminado',
+            name='repartidor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.usuarioprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='registroeliminado',
+            index=models.Index(fields=['fecha', 'id'], name='eliminado_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroeliminado',
+            index=models.Index(fields=['repartidor', 'fecha', 'id'], name='eliminado_rep_fecha_idx'),
+        ),
+    ]
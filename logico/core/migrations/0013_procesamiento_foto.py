@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_sincronizacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despacho',
+            name='foto_miniatura',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='fotos_entregas/miniaturas/'),
+        ),
+        migrations.CreateModel(
+            name='ProcesamientoFoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('listo', 'Listo'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('despacho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='procesamientos_foto', to='core.despacho')),
+            ],
+            options={
+                'verbose_name': 'Procesamiento de Foto',
+                'verbose_name_plural': 'Procesamientos de Fotos',
+                'ordering': ['proximo_intento', 'id'],
+                'indexes': [models.Index(condition=models.Q(('estado__in', ['pendiente', 'procesando'])), fields=['proximo_intento', 'id'], name='foto_pendiente_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_procesamiento_foto'),
+    ]
+
+    operations = [
+        # La tabla intermedia ya existe (core_ruta_ordenes): solo cambia el estado
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RutaOrden',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('orden', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paradas', to='core.orden')),
+                        ('ruta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paradas', to='core.ruta')),
+                    ],
+                    options={
+                        'verbose_name': 'Parada de Ruta',
+                        'verbose_name_plural': 'Paradas de Ruta',
+                        'db_table': 'core_ruta_ordenes',
+                        'ordering': ['id'],
+                        'unique_together': {('ruta', 'orden')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='ruta',
+                    name='ordenes',
+                    field=models.ManyToManyField(blank=True, related_name='rutas', through='core.RutaOrden', to='core.orden'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rutaorden',
+            name='secuencia',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterModelOptions(
+            name='rutaorden',
+            options={
+                'ordering': [models.OrderBy(models.F('secuencia'), nulls_last=True), 'id'],
+                'verbose_name': 'Parada de Ruta',
+                'verbose_name_plural': 'Paradas de Ruta',
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_ruta_orden'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DireccionGeocodificada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direccion', models.CharField(max_length=300, unique=True)),
+                ('coordenadas_lat', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('coordenadas_lng', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('proveedor', models.CharField(max_length=50)),
+                ('aciertos', models.PositiveIntegerField(default=0)),
+                ('consultas', models.PositiveIntegerField(default=1)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_consulta', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Dirección Geocodificada',
+                'verbose_name_plural': 'Direcciones Geocodificadas',
+                'ordering': ['direccion'],
+            },
+        ),
+        migrations.AddField(
+            model_name='farmacia',
+            name='coordenadas_lat',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmacia',
+            name='coordenadas_lng',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmacia',
+            name='fecha_geocodificacion',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='coordenadas_lat',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='coordenadas_lng',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='fecha_geocodificacion',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='farmacia',
+            index=models.Index(condition=models.Q(('fecha_geocodificacion__isnull', True)), fields=['id'], name='farmacia_geocod_pend_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(condition=models.Q(('fecha_geocodificacion__isnull', True)), fields=['id'], name='orden_geocod_pend_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_geocodificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ruta',
+            name='generada',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
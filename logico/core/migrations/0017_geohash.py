@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:22
+
+from django.db import migrations, models
+
+# Copia del geohash de core.espacial al escribir esta migración: los cambios
+# posteriores del módulo no deben alterar lo que hace.
+PRECISION_GEOHASH = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def codificar(lat, lng, precision=PRECISION_GEOHASH):
+    lat, lng = float(lat), float(lng)
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    caracteres = []
+    bits = valor = 0
+    par = True  # los bits alternan longitud, latitud
+    while len(caracteres) < precision:
+        rango, coordenada = (rango_lng, lng) if par else (rango_lat, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            caracteres.append(BASE32[valor])
+            bits = valor = 0
+    return ''.join(caracteres)
+
+
+def poblar_geohash(apps, schema_editor):
+    for nombre in ('Orden', 'Farmacia', 'Despacho'):
+        modelo = apps.get_model('core', nombre)
+        filas = modelo.objects.filter(coordenadas_lat__isnull=False, coordenadas_lng__isnull=False)
+        lote = []
+        for fila in filas.only('id', 'coordenadas_lat', 'coordenadas_lng').iterator(chunk_size=2000):
+            fila.geohash = codificar(fila.coordenadas_lat, fila.coordenadas_lng)
+            lote.append(fila)
+            if len(lote) >= 2000:
+                modelo.objects.bulk_update(lote, ['geohash'])
+                lote = []
+        if lote:
+            modelo.objects.bulk_update(lote, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_ruta_generada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despacho',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='farmacia',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(poblar_geohash, migrations.RunPython.noop),
+    ]
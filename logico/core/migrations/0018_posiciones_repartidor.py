@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Índice por fecha para purgar el historial por rango. En PostgreSQL es BRIN:
+# ocupa unas pocas páginas porque las filas se insertan en orden de llegada.
+INDICE_FECHA = 'posicion_fecha_idx'
+TABLA = 'core_posicionrepartidor'
+
+
+def crear_indice_fecha(apps, schema_editor):
+    metodo = 'USING brin ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'CREATE INDEX {INDICE_FECHA} ON {TABLA} {metodo}(fecha)')
+
+
+def eliminar_indice_fecha(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {INDICE_FECHA} ON {TABLA}')
+    else:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDICE_FECHA}')
+
+
+def poblar_ultima_posicion(apps, schema_editor):
+    """Última posición de cada repartidor: la de su último despacho con coordenadas"""
+    Despacho = apps.get_model('core', 'Despacho')
+    UsuarioProfile = apps.get_model('core', 'UsuarioProfile')
+    despachos = Despacho.objects.filter(
+        repartidor__isnull=False, coordenadas_lat__isnull=False, coordenadas_lng__isnull=False,
+    ).order_by('repartidor_id', '-fecha', '-id').values_list('repartidor_id', 'coordenadas_lat', 'coordenadas_lng', 'fecha')
+    vistos = set()
+    lote = []
+    for repartidor_id, lat, lng, fecha in despachos.iterator(chunk_size=2000):
+        if repartidor_id in vistos:
+            continue
+        vistos.add(repartidor_id)
+        lote.append(UsuarioProfile(pk=repartidor_id, posicion_lat=lat, posicion_lng=lng, fecha_posicion=fecha))
+    UsuarioProfile.objects.bulk_update(lote, ['posicion_lat', 'posicion_lng', 'fecha_posicion'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuarioprofile',
+            name='fecha_posicion',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='usuarioprofile',
+            name='posicion_lat',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='usuarioprofile',
+            name='posicion_lng',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True),
+        ),
+        migrations.CreateModel(
+            name='PosicionRepartidor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('lat_e6', models.IntegerField()),
+                ('lng_e6', models.IntegerField()),
+                ('precision_m', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('repartidor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posiciones', to='core.usuarioprofile')),
+            ],
+            options={
+                'verbose_name': 'Posición de Repartidor',
+                'verbose_name_plural': 'Posiciones de Repartidores',
+                'indexes': [models.Index(fields=['repartidor', 'fecha'], name='posicion_rep_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(crear_indice_fecha, eliminar_indice_fecha),
+        migrations.RunPython(poblar_ultima_posicion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_posiciones_repartidor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvanceImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=500, unique=True)),
+                ('procesados', models.PositiveBigIntegerField(default=0)),
+                ('primer_dia', models.DateField(blank=True, null=True)),
+                ('ultimo_dia', models.DateField(blank=True, null=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Avance de Importación',
+                'verbose_name_plural': 'Avances de Importación',
+                'ordering': ['clave'],
+            },
+        ),
+    ]
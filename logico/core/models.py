@@ -1,9 +1,15 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from django.urls import reverse
 
+from .busqueda import normalizar_telefono
+
 
 class UsuarioProfile(models.Model):
     ROL_CHOICES = [
@@ -28,15 +34,41 @@ class UsuarioProfile(models.Model):
     fecha_inicio_descanso = models.DateTimeField(blank=True, null=True, help_text='Fecha y hora en que inició el descanso')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     activo = models.BooleanField(default=True)
+    # Última posición conocida del repartidor: la escribe core.posiciones con un UPDATE
+    posicion_lat = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True, editable=False)
+    posicion_lng = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True, editable=False)
+    fecha_posicion = models.DateTimeField(blank=True, null=True, editable=False)
+    
+    CAMPOS_POSICION = ('posicion_lat', 'posicion_lng', 'fecha_posicion')
     
     class Meta:
         verbose_name = 'Perfil de Usuario'
         verbose_name_plural = 'Perfiles de Usuario'
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Repartidores activos por estado de turno (dashboard, asignación)
+            models.Index(fields=['estado_turno'], name='perfil_repartidor_activo_idx', condition=models.Q(rol='repartidor', activo=True)),
+        ]
     
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} ({self.get_rol_display()})"
     
+    def save(self, *args, **kwargs):
+        # Una instancia cargada antes de la última posición recibida no debe
+        # pisarla: se escriben solo los campos cargados (sin cargar los diferidos)
+        if self._state.adding or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+            super().save(*args, **kwargs)
+            return
+        
+        diferidos = self.get_deferred_fields()
+        campos = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in diferidos and field.name not in self.CAMPOS_POSICION
+        ]
+        # Si otra petición eliminó el perfil, el error de save() llega al llamador
+        # (no se vuelve a crear)
+        super().save(*args, update_fields=campos, **kwargs)
+    
     def get_absolute_url(self):
         return reverse('usuario_detail', kwargs={'pk': self.pk})
 
@@ -73,8 +105,9 @@ class Moto(models.Model):
     
     @property
     def repartidor_asignado(self):
+        # Relación inversa: se puede precargar con select_related('usuario_asignado')
         try:
-            return UsuarioProfile.objects.get(moto=self)
+            return self.usuario_asignado
         except UsuarioProfile.DoesNotExist:
             return None
     
@@ -94,6 +127,13 @@ class Farmacia(models.Model):
     direccion = models.TextField()
     telefono = models.CharField(max_length=20)
     ciudad = models.CharField(max_length=100, default='Santiago')
+    # Desde la dirección y la ciudad (ver core.geocodificacion)
+    coordenadas_lat = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    coordenadas_lng = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # None: pendiente de geocodificar
+    fecha_geocodificacion = models.DateTimeField(blank=True, null=True, editable=False)
+    # De las coordenadas, para consultas de proximidad (ver core.espacial)
+    geohash = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
     activa = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     
@@ -101,6 +141,10 @@ class Farmacia(models.Model):
         verbose_name = 'Farmacia'
         verbose_name_plural = 'Farmacias'
         ordering = ['nombre']
+        indexes = [
+            # Pendientes de geocodificar (python manage.py geocodificar)
+            models.Index(fields=['id'], name='farmacia_geocod_pend_idx', condition=models.Q(fecha_geocodificacion__isnull=True)),
+        ]
     
     def __str__(self):
         return f"{self.nombre} - {self.ciudad}"
@@ -109,6 +153,27 @@ class Farmacia(models.Model):
         return reverse('farmacia_detail', kwargs={'pk': self.pk})
 
 
+class OrdenQuerySet(models.QuerySet):
+    def pendientes_redespacho(self):
+        """Órdenes cuyo último intento de despacho falló (búsqueda por el puntero ultimo_despacho)"""
+        return self.filter(ultimo_despacho__resultado__in=['no_disponible', 'error'])
+    
+    def abiertas(self):
+        """Órdenes que aún no se entregan (su último despacho no fue exitoso)"""
+        return self.exclude(ultimo_despacho__resultado='entregado')
+    
+    def sincronizar_despachos(self):
+        """Recalcula ultimo_despacho y total_despachos de las órdenes en un solo UPDATE"""
+        despachos = Despacho.objects.filter(orden=OuterRef('pk'))
+        ultimo = despachos.order_by('-numero_despacho').values('pk')[:1]
+        total = despachos.order_by().values('orden').annotate(total=Count('id')).values('total')
+        return self.update(
+            ultimo_despacho=Subquery(ultimo),
+            total_despachos=Coalesce(Subquery(total), Value(0)),
+            fecha_actualizacion=timezone.now(),
+        )
+
+
 class Orden(models.Model):
     PRIORIDAD_CHOICES = [
         ('alta', 'Alta'),
@@ -130,7 +195,16 @@ class Orden(models.Model):
     
     cliente = models.CharField(max_length=200)
     direccion = models.TextField()
+    # Desde la dirección (ver core.geocodificacion)
+    coordenadas_lat = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    coordenadas_lng = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # None: pendiente de geocodificar
+    fecha_geocodificacion = models.DateTimeField(blank=True, null=True, editable=False)
+    # De las coordenadas, para consultas de proximidad (ver core.espacial)
+    geohash = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
     telefono_cliente = models.CharField(max_length=20)
+    # Solo dígitos, para búsqueda por prefijo (ver core.busqueda)
+    telefono_normalizado = models.CharField(max_length=20, blank=True, editable=False, db_index=True)
     descripcion = models.TextField(blank=True)
     prioridad = models.CharField(max_length=10, choices=PRIORIDAD_CHOICES, default='media')
     tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, default='normal')
@@ -140,16 +214,34 @@ class Orden(models.Model):
     responsable = models.ForeignKey(UsuarioProfile, on_delete=models.SET_NULL, blank=True, null=True, related_name='ordenes_asignadas')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+    # Desnormalizados: los mantiene Despacho.save en la misma transacción del insert
+    ultimo_despacho = models.ForeignKey('Despacho', on_delete=models.SET_NULL, blank=True, null=True, related_name='+', editable=False)
+    total_despachos = models.PositiveIntegerField(default=0, editable=False)
+    
+    CAMPOS_DESNORMALIZADOS = ('ultimo_despacho', 'total_despachos')
+    
+    objects = OrdenQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Orden'
         verbose_name_plural = 'Órdenes'
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='orden_fecha_id_idx'),
+            # Listados del repartidor filtrados por estado (orden_list, OrdenViewSet)
+            models.Index(fields=['responsable', 'estado_actual', '-fecha_creacion'], name='orden_resp_estado_fecha_idx'),
+            # Sincronización por cambios (core.sincronizacion), global y por repartidor
+            models.Index(fields=['fecha_actualizacion', 'id'], name='orden_actualizacion_idx'),
+            models.Index(fields=['responsable', 'fecha_actualizacion', 'id'], name='orden_resp_actualizacion_idx'),
+            # Pendientes de geocodificar (python manage.py geocodificar)
+            models.Index(fields=['id'], name='orden_geocod_pend_idx', condition=models.Q(fecha_geocodificacion__isnull=True)),
+        ]
     
     def __str__(self):
         return f"Orden #{self.id} - {self.cliente}"
     
-    def save(self, *args, **kwargs):
+    def preparar_guardado(self):
+        """Reglas que save aplica antes de escribir (también las usa la carga masiva)"""
         # Prioridad automática según tipo
         if self.tipo == 'receta_detendida' and not self.prioridad:
             self.prioridad = 'alta'
@@ -157,10 +249,23 @@ class Orden(models.Model):
             self.prioridad = 'media'
         
         # Validar que farmacia_destino sea diferente de farmacia_origen
-        if self.farmacia_origen and self.farmacia_destino:
-            if self.farmacia_origen == self.farmacia_destino:
+        if self.farmacia_origen_id and self.farmacia_destino_id:
+            if self.farmacia_origen_id == self.farmacia_destino_id:
                 raise ValueError('La farmacia destino debe ser diferente de la farmacia origen')
         
+        self.telefono_normalizado = normalizar_telefono(self.telefono_cliente)
+    
+    def save(self, *args, **kwargs):
+        self.preparar_guardado()
+        
+        # Los campos desnormalizados solo se escriben desde Despacho.save; una
+        # instancia cargada antes de un despacho nuevo no debe pisarlos.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.CAMPOS_DESNORMALIZADOS
+            ]
+        
         super().save(*args, **kwargs)
     
     def get_absolute_url(self):
@@ -173,16 +278,50 @@ class Medicamento(models.Model):
     nombre = models.CharField(max_length=200)
     cantidad = models.IntegerField(validators=[MinValueValidator(1)])
     observaciones = models.TextField(blank=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Medicamento'
         verbose_name_plural = 'Medicamentos'
         ordering = ['nombre']
+        indexes = [
+            # Sincronización por cambios (core.sincronizacion)
+            models.Index(fields=['fecha_actualizacion', 'id'], name='medicamento_actualizacion_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} (x{self.cantidad}) - Orden #{self.orden.id}"
 
 
+class DespachoQuerySet(models.QuerySet):
+    def ultimos_por_orden(self):
+        """Último intento de cada orden, usando el puntero Orden.ultimo_despacho.
+        
+        Los filtros sobre el intento (estado, resultado) se aplican después y
+        filtran los últimos intentos, no eligen el último entre los filtrados.
+        """
+        return self.filter(pk=F('orden__ultimo_despacho'))
+    
+    def ultimos_por_orden_filtrados(self):
+        """Último intento de cada orden entre los despachos del queryset (p. ej. los de un repartidor).
+        
+        A diferencia de ultimos_por_orden, no usa el puntero de la orden: si
+        otro repartidor reintentó la orden, el intento propio sigue apareciendo.
+        """
+        ultimos = self.annotate(
+            _posicion=Window(
+                RowNumber(),
+                partition_by=[F('orden_id')],
+                order_by=F('numero_despacho').desc(),
+            )
+        ).filter(_posicion=1).values('pk')
+        return self.filter(pk__in=ultimos)
+    
+    def con_total_intentos(self):
+        """Anota total_intentos con el contador desnormalizado de la orden"""
+        return self.annotate(total_intentos=F('orden__total_despachos'))
+
+
 class Despacho(models.Model):
     ESTADO_CHOICES = [
         ('despacho', 'Despacho'),
@@ -201,29 +340,63 @@ class Despacho(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='despacho')
     resultado = models.CharField(max_length=20, choices=RESULTADO_CHOICES, blank=True, null=True)
     foto_entrega = models.ImageField(upload_to='fotos_entregas/', blank=True, null=True)
+    # La generan procesar_fotos (core.fotos) tras redimensionar foto_entrega
+    foto_miniatura = models.ImageField(upload_to='fotos_entregas/miniaturas/', blank=True, null=True, editable=False)
     observaciones = models.TextField(blank=True)
     coordenadas_lat = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     coordenadas_lng = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # De las coordenadas, para consultas de proximidad (ver core.espacial)
+    geohash = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
     fecha = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    objects = DespachoQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Despacho'
         verbose_name_plural = 'Despachos'
         ordering = ['-fecha']
         unique_together = ['orden', 'numero_despacho']
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='despacho_fecha_id_idx'),
+            models.Index(fields=['repartidor', 'resultado'], name='despacho_repartidor_res_idx'),
+            # Despachos en curso (sin resultado registrado)
+            models.Index(fields=['orden'], name='despacho_pendiente_idx', condition=models.Q(resultado__isnull=True)),
+            # Sincronización por cambios (core.sincronizacion), global y por repartidor
+            models.Index(fields=['fecha_actualizacion', 'id'], name='despacho_actualizacion_idx'),
+            models.Index(fields=['repartidor', 'fecha_actualizacion', 'id'], name='despacho_rep_actualizacion_idx'),
+        ]
     
     def __str__(self):
         return f"Despacho #{self.numero_despacho} - Orden #{self.orden.id}"
     
     def save(self, *args, **kwargs):
-        if not self.numero_despacho:
-            # Obtener el último número de despacho para esta orden
-            ultimo_despacho = Despacho.objects.filter(orden=self.orden).order_by('-numero_despacho').first()
-            if ultimo_despacho:
-                self.numero_despacho = ultimo_despacho.numero_despacho + 1
-            else:
-                self.numero_despacho = 1
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
+            # Bloquear la orden para numerar y mover el puntero sin carreras
+            orden = Orden.objects.select_for_update().only('id', 'total_despachos').get(pk=self.orden_id)
+            ultimo_numero = Despacho.objects.filter(orden_id=self.orden_id).order_by(
+                '-numero_despacho'
+            ).values_list('numero_despacho', flat=True).first() or 0
+            if not self.numero_despacho:
+                self.numero_despacho = ultimo_numero + 1
+            
+            super().save(*args, **kwargs)
+            
+            cambios = {'total_despachos': F('total_despachos') + 1, 'fecha_actualizacion': timezone.now()}
+            es_ultimo = self.numero_despacho > ultimo_numero
+            if es_ultimo:
+                cambios['ultimo_despacho'] = self
+            Orden.objects.filter(pk=self.orden_id).update(**cambios)
+        
+        # Mantener sincronizada la instancia de orden que ya esté en memoria
+        if Despacho.orden.is_cached(self):
+            self.orden.total_despachos = orden.total_despachos + 1
+            if es_ultimo:
+                self.orden.ultimo_despacho = self
     
     def get_absolute_url(self):
         return reverse('despacho_detail', kwargs={'pk': self.pk})
@@ -243,16 +416,28 @@ class OrdenMovimiento(models.Model):
     repartidor = models.ForeignKey(UsuarioProfile, on_delete=models.SET_NULL, blank=True, null=True, related_name='movimientos')
     despacho = models.ForeignKey(Despacho, on_delete=models.SET_NULL, blank=True, null=True, related_name='movimientos')
     timestamp = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Movimiento de Orden'
         verbose_name_plural = 'Movimientos de Órdenes'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='movimiento_timestamp_id_idx'),
+            # Historial de una orden (orden_detail, MovimientoViewSet?orden=)
+            models.Index(fields=['orden', '-timestamp'], name='movimiento_orden_ts_idx'),
+            # Sincronización por cambios (core.sincronizacion)
+            models.Index(fields=['fecha_actualizacion', 'id'], name='movimiento_actualizacion_idx'),
+        ]
     
     def __str__(self):
         return f"{self.orden} - {self.get_estado_display()} ({self.timestamp})"
 
 
+# Orden de las órdenes de una ruta según su parada (Ruta.ordenes.order_by(*ORDEN_PARADAS))
+ORDEN_PARADAS = (F('paradas__secuencia').asc(nulls_last=True), 'paradas__id')
+
+
 class Ruta(models.Model):
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True)
@@ -260,7 +445,9 @@ class Ruta(models.Model):
     vehiculo = models.CharField(max_length=100, blank=True)
     repartidor = models.ForeignKey(UsuarioProfile, on_delete=models.SET_NULL, blank=True, null=True, related_name='rutas')
     activa = models.BooleanField(default=True)
-    ordenes = models.ManyToManyField(Orden, related_name='rutas', blank=True)
+    # Creada por la agrupación en zonas (core.zonas), que la reutiliza al regenerar
+    generada = models.BooleanField(default=False, editable=False)
+    ordenes = models.ManyToManyField(Orden, through='RutaOrden', related_name='rutas', blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -271,12 +458,17 @@ class Ruta(models.Model):
     def __str__(self):
         return f"{self.nombre} - {self.zona}"
     
+    def ordenes_en_secuencia(self):
+        """Órdenes en el orden de visita (RutaOrden.secuencia); usa la precarga si existe"""
+        if 'ordenes' in getattr(self, '_prefetched_objects_cache', {}):
+            return list(self.ordenes.all())
+        return list(self.ordenes.order_by(*ORDEN_PARADAS))
+    
     def get_google_maps_url(self):
         """Genera URL de Google Maps con múltiples destinos"""
-        if not self.ordenes.exists():
+        ordenes_list = self.ordenes_en_secuencia()
+        if not ordenes_list:
             return None
-        
-        ordenes_list = list(self.ordenes.all())
         if len(ordenes_list) == 1:
             destino = ordenes_list[0].direccion.replace(' ', '+')
             return f"https://www.google.com/maps/dir/?api=1&destination={destino}"
@@ -290,6 +482,24 @@ class Ruta(models.Model):
         return reverse('ruta_detail', kwargs={'pk': self.pk})
 
 
+class RutaOrden(models.Model):
+    """Parada de una ruta: la orden y su posición en el recorrido (ver core.rutas)"""
+    ruta = models.ForeignKey(Ruta, on_delete=models.CASCADE, related_name='paradas')
+    orden = models.ForeignKey(Orden, on_delete=models.CASCADE, related_name='paradas')
+    # None hasta que se optimiza la ruta; las paradas sin secuencia van al final
+    secuencia = models.PositiveIntegerField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'core_ruta_ordenes'
+        verbose_name = 'Parada de Ruta'
+        verbose_name_plural = 'Paradas de Ruta'
+        ordering = [F('secuencia').asc(nulls_last=True), 'id']
+        unique_together = ['ruta', 'orden']
+    
+    def __str__(self):
+        return f"{self.ruta} - #{self.secuencia or '?'} {self.orden}"
+
+
 class Reporte(models.Model):
     fecha = models.DateField(unique=True)
     entregas_totales = models.IntegerField(default=0)
@@ -299,6 +509,9 @@ class Reporte(models.Model):
     ingresos_dia = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     observaciones = models.TextField(blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Acumuladores para recalcular tiempo_promedio incrementalmente (ver core.reportes)
+    tiempo_entrega_total = models.DurationField(default=timedelta(0), editable=False)
+    entregas_medidas = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name = 'Reporte'
@@ -317,3 +530,259 @@ class Reporte(models.Model):
     def get_absolute_url(self):
         return reverse('reporte_detail', kwargs={'pk': self.pk})
 
+
+
+class EstadisticaDashboard(models.Model):
+    """Contadores precalculados del dashboard: una fila global y una por repartidor"""
+    clave = models.CharField(max_length=30, unique=True)
+    repartidor = models.OneToOneField(UsuarioProfile, on_delete=models.CASCADE, blank=True, null=True, related_name='estadistica_dashboard')
+    total_ordenes = models.IntegerField(default=0)
+    ordenes_retiro_receta = models.IntegerField(default=0)
+    ordenes_traslado = models.IntegerField(default=0)
+    ordenes_despacho = models.IntegerField(default=0)
+    ordenes_re_despacho = models.IntegerField(default=0)
+    total_despachos = models.IntegerField(default=0)
+    despachos_entregado = models.IntegerField(default=0)
+    despachos_no_disponible = models.IntegerField(default=0)
+    despachos_error = models.IntegerField(default=0)
+    despachos_sin_resultado = models.IntegerField(default=0)
+    repartidores_activos = models.IntegerField(default=0)
+    motos_activas = models.IntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Estadística de Dashboard'
+        verbose_name_plural = 'Estadísticas de Dashboard'
+        ordering = ['clave']
+    
+    def __str__(self):
+        return f"Estadísticas {self.clave}"
+    
+    @property
+    def entregas_fallidas(self):
+        return self.despachos_no_disponible + self.despachos_error
+    
+    @property
+    def tasa_exito(self):
+        if self.total_despachos > 0:
+            return (self.despachos_entregado / self.total_despachos) * 100
+        return 0
+
+
+class VersionRecurso(models.Model):
+    """Contador de cambios de un recurso de la API, para los GET condicionales"""
+    clave = models.CharField(max_length=30, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Versión de Recurso'
+        verbose_name_plural = 'Versiones de Recursos'
+        ordering = ['clave']
+    
+    def __str__(self):
+        return f"{self.clave} v{self.version}"
+
+
+class AvanceImportacion(models.Model):
+    """Avance de importar_ordenes sobre un archivo.
+    
+    Se guarda en la misma transacción que cada lote: al reanudar no se
+    repiten ni se saltan registros.
+    """
+    clave = models.CharField(max_length=500, unique=True)
+    procesados = models.PositiveBigIntegerField(default=0)
+    # Días de los despachos importados hasta ahora (los reportes se regeneran al terminar)
+    primer_dia = models.DateField(blank=True, null=True)
+    ultimo_dia = models.DateField(blank=True, null=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Avance de Importación'
+        verbose_name_plural = 'Avances de Importación'
+        ordering = ['clave']
+    
+    def __str__(self):
+        return f"{self.clave} ({self.procesados} registros)"
+
+
+class ProcesamientoFoto(models.Model):
+    """Foto de entrega pendiente de procesar (cola de core.fotos)"""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+    
+    despacho = models.ForeignKey(Despacho, on_delete=models.CASCADE, related_name='procesamientos_foto')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Procesamiento de Foto'
+        verbose_name_plural = 'Procesamientos de Fotos'
+        ordering = ['proximo_intento', 'id']
+        indexes = [
+            # Trabajos listos para tomar (procesar_fotos)
+            models.Index(fields=['proximo_intento', 'id'], name='foto_pendiente_idx', condition=models.Q(estado__in=['pendiente', 'procesando'])),
+        ]
+    
+    def __str__(self):
+        return f"Foto del despacho #{self.despacho_id} ({self.get_estado_display()})"
+
+
+class RegistroEliminado(models.Model):
+    """Lápida de una fila eliminada (o que salió del alcance de un repartidor).
+    
+    La sincronización de los dispositivos (core.sincronizacion) la usa para
+    informar eliminaciones; purgar_eliminados borra las antiguas.
+    """
+    MODELO_CHOICES = [
+        ('orden', 'Orden'),
+        ('despacho', 'Despacho'),
+        ('medicamento', 'Medicamento'),
+        ('movimiento', 'Movimiento'),
+    ]
+    
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    # Repartidor que veía la fila (null si no tenía)
+    repartidor = models.ForeignKey(UsuarioProfile, on_delete=models.CASCADE, blank=True, null=True, related_name='+')
+    # True si la fila sigue existiendo pero se reasignó a otro repartidor
+    reasignado = models.BooleanField(default=False)
+    fecha = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Registro Eliminado'
+        verbose_name_plural = 'Registros Eliminados'
+        ordering = ['fecha', 'id']
+        indexes = [
+            models.Index(fields=['fecha', 'id'], name='eliminado_fecha_id_idx'),
+            models.Index(fields=['repartidor', 'fecha', 'id'], name='eliminado_rep_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_modelo_display()} #{self.objeto_id} ({self.fecha})"
+
+
+class DireccionGeocodificada(models.Model):
+    """Resultado del proveedor de geocodificación para una dirección normalizada.
+    
+    Caché persistente de core.geocodificacion: una dirección se consulta al
+    proveedor una vez y luego se resuelve desde aquí. Sin coordenadas, el
+    proveedor no la encontró (se vuelve a consultar pasado
+    settings.GEOCODIFICACION_REINTENTO_DIAS).
+    """
+    direccion = models.CharField(max_length=300, unique=True)
+    coordenadas_lat = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    coordenadas_lng = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    proveedor = models.CharField(max_length=50)
+    # Métricas: resoluciones desde la caché y consultas al proveedor
+    aciertos = models.PositiveIntegerField(default=0)
+    consultas = models.PositiveIntegerField(default=1)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Última consulta al proveedor
+    fecha_consulta = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Dirección Geocodificada'
+        verbose_name_plural = 'Direcciones Geocodificadas'
+        ordering = ['direccion']
+    
+    def __str__(self):
+        if self.coordenadas_lat is None:
+            return f"{self.direccion} (sin resultado)"
+        return f"{self.direccion} ({self.coordenadas_lat}, {self.coordenadas_lng})"
+
+
+GRANULARIDAD_CHOICES = [
+    ('hora', 'Hora'),
+    ('dia', 'Día'),
+]
+
+
+class AgregadoDespacho(models.Model):
+    """Despachos por hora o día local y por dimensión (ver core.agregados).
+    
+    Las FK no tienen restricción en la BD: los agregados conservan el id
+    aunque el repartidor o la farmacia se eliminen después.
+    """
+    clave = models.CharField(max_length=100, unique=True)
+    granularidad = models.CharField(max_length=4, choices=GRANULARIDAD_CHOICES)
+    inicio = models.DateTimeField()
+    repartidor = models.ForeignKey(UsuarioProfile, on_delete=models.DO_NOTHING, db_constraint=False, blank=True, null=True, related_name='+')
+    farmacia = models.ForeignKey('Farmacia', on_delete=models.DO_NOTHING, db_constraint=False, blank=True, null=True, related_name='+')
+    resultado = models.CharField(max_length=20, blank=True)
+    estado = models.CharField(max_length=20)
+    cantidad = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Agregado de Despachos'
+        verbose_name_plural = 'Agregados de Despachos'
+        ordering = ['granularidad', 'inicio']
+        indexes = [
+            models.Index(fields=['granularidad', 'inicio'], name='agregado_despacho_inicio_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularidad} {self.inicio}: {self.cantidad}"
+
+
+class AgregadoMovimiento(models.Model):
+    """Movimientos de órdenes por hora o día local, estado y repartidor (ver core.agregados)"""
+    clave = models.CharField(max_length=100, unique=True)
+    granularidad = models.CharField(max_length=4, choices=GRANULARIDAD_CHOICES)
+    inicio = models.DateTimeField()
+    repartidor = models.ForeignKey(UsuarioProfile, on_delete=models.DO_NOTHING, db_constraint=False, blank=True, null=True, related_name='+')
+    estado = models.CharField(max_length=20)
+    cantidad = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Agregado de Movimientos'
+        verbose_name_plural = 'Agregados de Movimientos'
+        ordering = ['granularidad', 'inicio']
+        indexes = [
+            models.Index(fields=['granularidad', 'inicio'], name='agregado_movimiento_inicio_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularidad} {self.inicio}: {self.cantidad}"
+
+
+class PosicionRepartidor(models.Model):
+    """Posición GPS enviada por el dispositivo de un repartidor (ver core.posiciones).
+    
+    Historial de solo inserción y compacto: coordenadas en millonésimas de
+    grado (enteros de 4 bytes) y un único índice por repartidor y fecha; la
+    migración agrega un índice sobre fecha (BRIN en PostgreSQL) para purgar
+    por rango.
+    """
+    repartidor = models.ForeignKey(UsuarioProfile, on_delete=models.CASCADE, related_name='posiciones', db_index=False)
+    fecha = models.DateTimeField()
+    lat_e6 = models.IntegerField()
+    lng_e6 = models.IntegerField()
+    # Precisión informada por el GPS, en metros
+    precision_m = models.PositiveSmallIntegerField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name = 'Posición de Repartidor'
+        verbose_name_plural = 'Posiciones de Repartidores'
+        indexes = [
+            models.Index(fields=['repartidor', 'fecha'], name='posicion_rep_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.repartidor_id} ({self.lat}, {self.lng}) {self.fecha:%Y-%m-%d %H:%M:%S}"
+    
+    @property
+    def lat(self):
+        return self.lat_e6 / 1_000_000
+    
+    @property
+    def lng(self):
+        return self.lng_e6 / 1_000_000
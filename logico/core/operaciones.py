@@ -0,0 +1,166 @@
+"""
+Varias operaciones de la API en una sola petición (POST /api/operaciones/).
+
+Pensado para la app de los repartidores en redes lentas: cerrar una entrega
+(registrar_resultado con foto, cambiar_estado y volver a leer la orden y sus
+movimientos) pasa de varias idas y vueltas a una. Cada operación indica
+método, URL de la API y datos, y se ejecuta contra la vista existente en el
+orden recibido: mismas validaciones, permisos y alcance que por separado.
+
+La autenticación (y el CSRF de la sesión) se validan una vez en la petición
+externa; las operaciones reciben el mismo usuario y el mismo request.profile,
+que se resuelve una sola vez. Todas corren en una transacción: si alguna
+responde con un error (status >= 400) se detiene la ejecución, se deshace lo
+anterior y se informa qué operación falló.
+
+Las operaciones con archivos llegan en multipart/form-data: el campo
+operaciones trae la lista en JSON y cada operación indica en archivos qué
+campo de la petición externa recibe como cuál de los suyos, p. ej.
+{"foto_entrega": "foto1"}. Esas operaciones envían datos planos (formulario).
+"""
+import io
+import json
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from django.utils.datastructures import MultiValueDict
+
+MAXIMO_OPERACIONES = 20
+METODOS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+PREFIJO_API = '/api/'
+
+
+class OperacionInvalida(Exception):
+    pass
+
+
+class _Deshacer(Exception):
+    pass
+
+
+def leer_operaciones(datos):
+    """Lista de operaciones del cuerpo (JSON o el campo operaciones de un formulario)"""
+    operaciones = datos.get('operaciones') if hasattr(datos, 'get') else None
+    if isinstance(operaciones, str):
+        try:
+            operaciones = json.loads(operaciones)
+        except ValueError:
+            raise OperacionInvalida('operaciones debe ser una lista JSON')
+    if not isinstance(operaciones, list) or not operaciones:
+        raise OperacionInvalida('operaciones debe ser una lista no vacía')
+    if len(operaciones) > MAXIMO_OPERACIONES:
+        raise OperacionInvalida(f'Máximo {MAXIMO_OPERACIONES} operaciones por petición')
+    return [_validar(numero, operacion) for numero, operacion in enumerate(operaciones)]
+
+
+def _validar(numero, operacion):
+    if not isinstance(operacion, dict):
+        raise OperacionInvalida(f'Operación {numero}: debe ser un objeto')
+    metodo = str(operacion.get('metodo', 'GET')).upper()
+    url = operacion.get('url')
+    datos = operacion.get('datos')
+    archivos = operacion.get('archivos') or {}
+    if metodo not in METODOS:
+        raise OperacionInvalida(f'Operación {numero}: método inválido')
+    if not isinstance(url, str) or not url.startswith(PREFIJO_API):
+        raise OperacionInvalida(f'Operación {numero}: la url debe comenzar con {PREFIJO_API}')
+    if not isinstance(archivos, dict) or not all(isinstance(valor, str) for valor in archivos.values()):
+        raise OperacionInvalida(f'Operación {numero}: archivos debe ser un objeto {{campo: archivo}}')
+    if archivos and datos is not None and (
+        not isinstance(datos, dict) or any(isinstance(valor, (dict, list)) for valor in datos.values())
+    ):
+        raise OperacionInvalida(f'Operación {numero}: con archivos, datos debe ser un objeto plano')
+
+    partes = urlsplit(url)
+    try:
+        coincidencia = resolve(partes.path)
+    except Resolver404:
+        raise OperacionInvalida(f'Operación {numero}: url desconocida {partes.path}')
+    vista = getattr(coincidencia.func, 'cls', None)
+    if vista is None or getattr(vista, 'operaciones_en_lote', True) is False:
+        raise OperacionInvalida(f'Operación {numero}: {partes.path} no se puede usar en lote')
+    return {
+        'metodo': metodo,
+        'ruta': partes.path,
+        'consulta': partes.query,
+        'datos': datos,
+        'archivos': archivos,
+        'coincidencia': coincidencia,
+    }
+
+
+def _subpeticion(request, operacion):
+    """HttpRequest de la operación con el usuario y el perfil de la petición externa"""
+    django_request = request._request
+    sub = HttpRequest()
+    sub.method = operacion['metodo']
+    sub.path = sub.path_info = operacion['ruta']
+    sub.META = {
+        clave: valor for clave, valor in django_request.META.items()
+        if not clave.startswith('HTTP_IF_') and clave not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT')
+    }
+    sub.META.update({
+        'REQUEST_METHOD': operacion['metodo'],
+        'PATH_INFO': operacion['ruta'],
+        'QUERY_STRING': operacion['consulta'],
+        'HTTP_ACCEPT': 'application/json',
+    })
+    sub.GET = QueryDict(operacion['consulta'])
+    sub.COOKIES = django_request.COOKIES
+    sub.resolver_match = operacion['coincidencia']
+    sub.user = request.user
+    sub.profile = django_request.profile
+    # DRF no vuelve a autenticar (ni a validar CSRF) la operación
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+
+    datos = operacion['datos']
+    if operacion['archivos']:
+        # Cuerpo ya "leído" (como cuando un middleware accede a request.POST):
+        # DRF usa request.POST y request.FILES tal cual
+        sub.META['CONTENT_TYPE'] = 'multipart/form-data; boundary=operacion'
+        sub.META['CONTENT_LENGTH'] = '1'
+        sub.POST = sub._post = QueryDict(mutable=True)
+        for campo, valor in (datos or {}).items():
+            sub.POST[campo] = '' if valor is None else str(valor)
+        sub.FILES = sub._files = MultiValueDict()
+        for campo, nombre in operacion['archivos'].items():
+            if nombre not in request.FILES:
+                raise OperacionInvalida(f'Falta el archivo {nombre}')
+            sub.FILES[campo] = request.FILES[nombre]
+        sub._read_started = True
+    elif datos is not None:
+        cuerpo = json.dumps(datos).encode('utf-8')
+        sub.META['CONTENT_TYPE'] = 'application/json'
+        sub.META['CONTENT_LENGTH'] = str(len(cuerpo))
+        sub._stream = io.BytesIO(cuerpo)
+        sub._read_started = False
+    return sub
+
+
+def _ejecutar(request, operacion):
+    coincidencia = operacion['coincidencia']
+    response = coincidencia.func(_subpeticion(request, operacion), *coincidencia.args, **coincidencia.kwargs)
+    if not hasattr(response, 'data'):
+        # Descargas (CSV, exportaciones en streaming): no tienen representación en la respuesta
+        return {'status': 400, 'datos': {'error': f'{operacion["ruta"]} no se puede usar en lote'}}
+    return {'status': response.status_code, 'datos': response.data}
+
+
+def ejecutar(request, operaciones):
+    """Ejecuta las operaciones en una transacción; devuelve (resultados, índice de la fallida o None)"""
+    resultados = []
+    fallida = None
+    try:
+        with transaction.atomic():
+            for numero, operacion in enumerate(operaciones):
+                resultado = _ejecutar(request, operacion)
+                resultados.append(resultado)
+                if resultado['status'] >= 400:
+                    fallida = numero
+                    raise _Deshacer
+    except _Deshacer:
+        pass
+    return resultados, fallida
@@ -0,0 +1,130 @@
+"""
+Paginación por keyset (cursor) para listados grandes.
+
+En vez de OFFSET + COUNT(*), cada página filtra a partir de la última fila de
+la anterior sobre un orden (fecha, id) respaldado por un índice compuesto, por
+lo que la página N cuesta lo mismo que la primera.
+"""
+import base64
+from urllib.parse import urlencode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import CursorPagination
+
+from .busqueda import CAMPO_RANGO
+from .espacial import CAMPO_DISTANCIA
+
+
+# ========== API (DRF) ==========
+
+class CercaniaCursorPagination(CursorPagination):
+    """Con ?near= (y sin ?ordering= explícito) se pagina por distancia (ver core.espacial)"""
+    
+    def get_ordering(self, request, queryset, view):
+        if CAMPO_DISTANCIA in queryset.query.annotations and not request.query_params.get('ordering'):
+            return (CAMPO_DISTANCIA, 'id')
+        return super().get_ordering(request, queryset, view)
+
+
+class OrdenCursorPagination(CercaniaCursorPagination):
+    ordering = ('-fecha_creacion', '-id')
+    
+    def get_ordering(self, request, queryset, view):
+        # Con búsqueda (y sin ?ordering= explícito) se pagina por relevancia
+        if CAMPO_RANGO in queryset.query.annotations and not request.query_params.get('ordering'):
+            return (f'-{CAMPO_RANGO}', '-id')
+        return super().get_ordering(request, queryset, view)
+
+
+class DespachoCursorPagination(CercaniaCursorPagination):
+    ordering = ('-fecha', '-id')
+
+
+class MovimientoCursorPagination(CursorPagination):
+    ordering = ('-timestamp', '-id')
+
+
+# ========== Vistas HTML ==========
+
+TAMANO_PAGINA = 50
+
+
+class PaginaKeyset:
+    def __init__(self, objetos, url_siguiente=None, url_anterior=None):
+        self.objetos = objetos
+        self.url_siguiente = url_siguiente
+        self.url_anterior = url_anterior
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    @property
+    def tiene_otras_paginas(self):
+        return bool(self.url_siguiente or self.url_anterior)
+
+
+def _codificar_cursor(valor, pk, direccion):
+    valor = valor if isinstance(valor, int) else valor.isoformat()
+    texto = f'{direccion}|{valor}|{pk}'
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    try:
+        direccion, valor, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        # Campos de fecha o enteros (p. ej. el rango de búsqueda)
+        valor = int(valor) if valor.lstrip('-').isdigit() else parse_datetime(valor)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if direccion not in ('n', 'p') or valor is None:
+        return None
+    return direccion, valor, pk
+
+
+def _url_con_cursor(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'?{urlencode(params, doseq=True)}'
+
+
+def paginar_keyset(request, queryset, campo, tamano=TAMANO_PAGINA):
+    """Pagina queryset en orden descendente por (campo, id) usando ?cursor=
+
+    campo puede ser una columna de fecha o una anotación entera.
+    """
+    cursor = _decodificar_cursor(request.GET.get('cursor', ''))
+
+    if cursor and cursor[0] == 'p':
+        # Página anterior: se recorre en orden ascendente y se invierte
+        _, valor, pk = cursor
+        filas = list(queryset.filter(
+            Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'id__gt': pk})
+        ).order_by(campo, 'id')[:tamano + 1])
+        hay_anterior = len(filas) > tamano
+        filas = filas[:tamano][::-1]
+        hay_siguiente = True
+    else:
+        if cursor:
+            _, valor, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'id__lt': pk})
+            )
+        filas = list(queryset.order_by(f'-{campo}', '-id')[:tamano + 1])
+        hay_siguiente = len(filas) > tamano
+        filas = filas[:tamano]
+        hay_anterior = cursor is not None
+
+    url_siguiente = url_anterior = None
+    if filas and hay_siguiente:
+        ultima = filas[-1]
+        url_siguiente = _url_con_cursor(request, _codificar_cursor(getattr(ultima, campo), ultima.pk, 'n'))
+    if filas and hay_anterior:
+        primera = filas[0]
+        url_anterior = _url_con_cursor(request, _codificar_cursor(getattr(primera, campo), primera.pk, 'p'))
+
+    return PaginaKeyset(filas, url_siguiente, url_anterior)
@@ -0,0 +1,194 @@
+"""
+Posiciones GPS de los repartidores.
+
+Los dispositivos envían lotes de posiciones (POST /api/posiciones/). El lote
+se valida sin serializer, se inserta con un bulk_create en
+PosicionRepartidor (historial de solo inserción) y la posición más reciente
+pasa a ser la última conocida del repartidor: un UPDATE de UsuarioProfile
+que solo la aplica si es más nueva que la guardada (los lotes pueden llegar
+desordenados) y la caché de Django. Los despachos con coordenadas nuevas
+también la actualizan (ver signals).
+
+Quien necesita posiciones (dashboard, core.asignacion) usa
+ultimas_posiciones(): lee la caché con get_many y, para los que faltan, las
+columnas de UsuarioProfile en una consulta; nunca el historial. Las entradas
+duran CACHE_TTL segundos, así que con la caché local por defecto y varios
+procesos una posición tarda a lo sumo eso en verse en todos; con una caché
+compartida (Redis, Memcached) se ve de inmediato.
+
+El historial se conserva settings.POSICIONES_RETENCION_DIAS días
+(purgar_posiciones).
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PosicionRepartidor, UsuarioProfile
+
+MAXIMO_POR_LOTE = 500
+TOLERANCIA_FUTURO = timedelta(minutes=5)
+PRECISION_MAXIMA_M = 32767
+CACHE_TTL = 60
+TAMANO_PURGA = 10000
+CLAVE_CACHE = 'posicion_repartidor:{}'
+PRECISION = Decimal('0.000001')
+
+
+class PosicionesInvalidas(Exception):
+    pass
+
+
+def retencion():
+    return timedelta(days=getattr(settings, 'POSICIONES_RETENCION_DIAS', 30))
+
+
+def clave_cache(repartidor_id):
+    return CLAVE_CACHE.format(repartidor_id)
+
+
+# ---------------------------------------------------------------------------
+# Ingesta
+# ---------------------------------------------------------------------------
+
+def _leer_fecha(valor, ahora):
+    if valor in (None, ''):
+        return ahora
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        # Segundos desde epoch (también en milisegundos)
+        segundos = valor / 1000 if valor > 1e11 else valor
+        return datetime.fromtimestamp(segundos, tz=dt_timezone.utc)
+    fecha = parse_datetime(valor) if isinstance(valor, str) else None
+    if fecha is None:
+        raise ValueError('fecha inválida')
+    return fecha if timezone.is_aware(fecha) else timezone.make_aware(fecha)
+
+
+def _leer_posicion(item, ahora):
+    """(fecha, lat, lng, precision) de {"lat", "lng", "fecha"?, "precision"?}; ValueError si no es válida"""
+    if not isinstance(item, dict):
+        raise ValueError('se esperaba un objeto con lat y lng')
+    try:
+        lat, lng = float(item['lat']), float(item['lng'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('lat y lng numéricos son obligatorios')
+    if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('coordenadas fuera de rango')
+    try:
+        fecha = _leer_fecha(item.get('fecha'), ahora)
+    except (OverflowError, OSError, TypeError, ValueError):
+        raise ValueError('fecha inválida')
+    if fecha > ahora + TOLERANCIA_FUTURO:
+        raise ValueError('fecha en el futuro')
+    precision = item.get('precision')
+    if precision is not None:
+        try:
+            precision = min(max(int(precision), 0), PRECISION_MAXIMA_M)
+        except (TypeError, ValueError):
+            raise ValueError('precision debe ser un número')
+    return fecha, lat, lng, precision
+
+
+def leer_lote(datos):
+    """([(fecha, lat, lng, precision)], [{'indice', 'error'}]) de {"posiciones": [...]} o de la lista"""
+    if isinstance(datos, dict):
+        datos = datos.get('posiciones')
+    if not isinstance(datos, list) or not datos:
+        raise PosicionesInvalidas('Se esperaba una lista de posiciones.')
+    if len(datos) > MAXIMO_POR_LOTE:
+        raise PosicionesInvalidas(f'Máximo {MAXIMO_POR_LOTE} posiciones por lote.')
+    ahora = timezone.now()
+    posiciones, errores = [], []
+    for indice, item in enumerate(datos):
+        try:
+            posiciones.append(_leer_posicion(item, ahora))
+        except ValueError as error:
+            errores.append({'indice': indice, 'error': str(error)})
+    return posiciones, errores
+
+
+def registrar(repartidor_id, posiciones):
+    """Agrega las posiciones al historial y actualiza la última conocida; devuelve cuántas se guardaron"""
+    if not posiciones:
+        return 0
+    with transaction.atomic():
+        PosicionRepartidor.objects.bulk_create([
+            PosicionRepartidor(
+                repartidor_id=repartidor_id,
+                fecha=fecha,
+                lat_e6=round(lat * 1_000_000),
+                lng_e6=round(lng * 1_000_000),
+                precision_m=precision,
+            )
+            for fecha, lat, lng, precision in posiciones
+        ])
+        fecha, lat, lng, _ = max(posiciones, key=lambda posicion: posicion[0])
+        actualizar_ultima(repartidor_id, lat, lng, fecha)
+    return len(posiciones)
+
+
+def actualizar_ultima(repartidor_id, lat, lng, fecha):
+    """Guarda (lat, lng) como última posición del repartidor si es más nueva que la actual"""
+    lat, lng = Decimal(str(lat)).quantize(PRECISION), Decimal(str(lng)).quantize(PRECISION)
+    actualizadas = UsuarioProfile.objects.filter(
+        Q(fecha_posicion__isnull=True) | Q(fecha_posicion__lt=fecha), pk=repartidor_id,
+    ).update(posicion_lat=lat, posicion_lng=lng, fecha_posicion=fecha)
+    if actualizadas:
+        # Después del commit: otra petición no debe leer de la caché una posición que se revierte
+        transaction.on_commit(
+            lambda: cache.set(clave_cache(repartidor_id), (float(lat), float(lng), fecha), CACHE_TTL)
+        )
+    return bool(actualizadas)
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def ultimas_posiciones(repartidor_ids):
+    """{repartidor_id: (lat, lng, fecha)} de la última posición conocida (los que no tienen, no aparecen)"""
+    repartidor_ids = list(repartidor_ids)
+    claves = {clave_cache(repartidor_id): repartidor_id for repartidor_id in repartidor_ids}
+    en_cache = cache.get_many(claves)
+    resultado = {claves[clave]: valor for clave, valor in en_cache.items() if valor}
+    faltantes = [repartidor_id for clave, repartidor_id in claves.items() if clave not in en_cache]
+    if faltantes:
+        leidas = {repartidor_id: () for repartidor_id in faltantes}
+        for repartidor_id, lat, lng, fecha in UsuarioProfile.objects.filter(
+            pk__in=faltantes, fecha_posicion__isnull=False
+        ).values_list('id', 'posicion_lat', 'posicion_lng', 'fecha_posicion'):
+            leidas[repartidor_id] = (float(lat), float(lng), fecha)
+        # También se recuerda que no tienen posición (tupla vacía)
+        cache.set_many({clave_cache(repartidor_id): valor for repartidor_id, valor in leidas.items()}, CACHE_TTL)
+        resultado.update((repartidor_id, valor) for repartidor_id, valor in leidas.items() if valor)
+    return resultado
+
+
+def en_turno():
+    """Repartidores activos que no están en descanso, con su última posición (o None)"""
+    repartidores = list(UsuarioProfile.objects.filter(
+        rol='repartidor', activo=True, estado_turno__in=['disponible', 'ocupado'], user__is_superuser=False,
+    ).select_related('user').order_by('user__first_name', 'user__username'))
+    ultimas = ultimas_posiciones(repartidor.pk for repartidor in repartidores)
+    return [(repartidor, ultimas.get(repartidor.pk)) for repartidor in repartidores]
+
+
+# ---------------------------------------------------------------------------
+# Retención
+# ---------------------------------------------------------------------------
+
+def purgar(antes_de=None, tamano=TAMANO_PURGA):
+    """Elimina el historial anterior a antes_de (por defecto, fuera de la retención), en tandas"""
+    antes_de = antes_de or timezone.now() - retencion()
+    eliminadas = 0
+    while True:
+        ids = list(PosicionRepartidor.objects.filter(fecha__lt=antes_de).values_list('id', flat=True)[:tamano])
+        if not ids:
+            return eliminadas
+        eliminadas += PosicionRepartidor.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,91 @@
+"""
+Renderers y parsers de la API.
+
+JSONRapidoRenderer y JSONRapidoParser usan orjson cuando está instalado y,
+si no, el JSONRenderer / JSONParser de DRF. Los tipos que orjson no conoce
+(Decimal, timedelta) y las fechas se convierten con el encoder de DRF, de
+modo que la salida es la misma que con el renderer estándar (fechas en
+ISO 8601 con Z, Decimal como texto, duraciones en segundos).
+
+MessagePackRenderer y MessagePackParser (application/msgpack) requieren el
+paquete msgpack; settings solo los registra si está instalado.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende del entorno
+    msgpack = None
+
+_encoder = encoders.JSONEncoder()
+
+# Separadores de línea que DRF escapa para poder incrustar el JSON en <script>
+_SEPARADORES = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def convertir(valor):
+    """Tipos no nativos de JSON/MessagePack, igual que el encoder de DRF"""
+    return _encoder.default(valor)
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """JSONRenderer que serializa con orjson (si está disponible)"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        contenido = orjson.dumps(
+            data,
+            default=convertir,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        if b'\xe2\x80' in contenido:
+            for separador, escapado in _SEPARADORES:
+                contenido = contenido.replace(separador, escapado)
+        return contenido
+
+
+class JSONRapidoParser(JSONParser):
+    """JSONParser que decodifica con orjson (si está disponible)"""
+    renderer_class = JSONRapidoRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=convertir, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc or type(exc).__name__}')
@@ -0,0 +1,333 @@
+"""
+Reportes diarios (rollups) de despachos.
+
+Cada Reporte resume un día local: despachos creados ese día por resultado,
+ingresos (entregas exitosas × settings.TARIFA_ENTREGA) y el tiempo promedio
+de entrega, medido en la línea de tiempo de OrdenMovimiento desde la última
+asignación de repartidor hasta el movimiento que registra el resultado del
+despacho.
+
+Las señales de Despacho y OrdenMovimiento actualizan el Reporte del día
+incrementalmente: los deltas por día se aplican al confirmar la
+transacción (transaction.on_commit) con un UPDATE atómico que también
+recalcula tiempo_promedio e ingresos_dia, sin bloquear la fila mientras
+dura la transacción que escribe. calcular_dias() recalcula un rango
+desde cero (los conteos salen de los agregados diarios de core.agregados
+y los tiempos de una consulta con función de ventana) y regenerar_rango()
+lo escribe de forma idempotente, en paralelo por tramos.
+"""
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import monotonic
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Case, DecimalField, DurationField, ExpressionWrapper, F, IntegerField, Max, Q, Value, When, Window,
+)
+from django.db.models.expressions import RowRange
+from django.utils import timezone
+
+from . import agregados
+from .models import OrdenMovimiento, Reporte
+
+PREFIJO_ASIGNACION = 'Repartidor asignado'
+RESULTADOS_FALLIDOS = ('no_disponible', 'error')
+
+
+def tarifa_entrega():
+    return Decimal(str(getattr(settings, 'TARIFA_ENTREGA', 0)))
+
+
+def _inicio_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def _dias(desde, hasta):
+    dia = desde
+    while dia <= hasta:
+        yield dia
+        dia += timedelta(days=1)
+
+
+# ---------------------------------------------------------------------------
+# Cálculo completo
+# ---------------------------------------------------------------------------
+
+def _conteos(desde, hasta):
+    """Despachos por día local y resultado, desde los agregados diarios"""
+    consulta = agregados.serie_despachos(_inicio_dia(desde), _inicio_dia(hasta + timedelta(days=1)))
+    return {
+        timezone.localdate(item['inicio']): {
+            'totales': item['total'],
+            'exitosas': item['exitosas'] or 0,
+            'fallidas': item['fallidas'] or 0,
+        }
+        for item in consulta
+    }
+
+
+def _tiempos(desde, hasta):
+    """Suma y cantidad de tiempos de entrega por día local del resultado.
+
+    Una sola consulta recorre la línea de tiempo de las órdenes con resultados
+    en el rango: la ventana por orden arrastra la última asignación vista
+    hasta cada fila y la ventana por despacho marca su último movimiento, que
+    es el que registra el resultado vigente.
+    """
+    inicio = _inicio_dia(desde)
+    fin = _inicio_dia(hasta + timedelta(days=1))
+    ordenes = OrdenMovimiento.objects.filter(
+        timestamp__gte=inicio, timestamp__lt=fin, despacho__isnull=False
+    ).values('orden_id')
+    es_asignacion = Q(descripcion__startswith=PREFIJO_ASIGNACION)
+
+    filas = OrdenMovimiento.objects.filter(
+        es_asignacion | Q(despacho__isnull=False),
+        orden_id__in=ordenes,
+    ).annotate(
+        ultima_asignacion=Window(
+            Max(Case(When(es_asignacion, then=F('timestamp')))),
+            partition_by=[F('orden_id')],
+            order_by=[F('timestamp').asc(), F('id').asc()],
+            frame=RowRange(start=None, end=0),
+        ),
+        ultimo_del_despacho=Window(Max('timestamp'), partition_by=[F('despacho_id')]),
+    ).values_list('timestamp', 'ultima_asignacion', 'ultimo_del_despacho', 'despacho__resultado')
+
+    tiempos = defaultdict(lambda: [timedelta(0), 0])
+    for timestamp, asignacion, ultimo_del_despacho, resultado in filas:
+        if (
+            resultado and asignacion and timestamp == ultimo_del_despacho
+            and inicio <= timestamp < fin and timestamp >= asignacion
+        ):
+            acumulado = tiempos[timezone.localdate(timestamp)]
+            acumulado[0] += timestamp - asignacion
+            acumulado[1] += 1
+    return tiempos
+
+
+def calcular_dias(desde, hasta):
+    """Valores de Reporte para cada día de [desde, hasta] (sin guardar)"""
+    conteos = _conteos(desde, hasta)
+    tiempos = _tiempos(desde, hasta)
+    tarifa = tarifa_entrega()
+
+    valores = {}
+    for dia in _dias(desde, hasta):
+        conteo = conteos.get(dia, {})
+        tiempo_total, medidas = tiempos.get(dia, (timedelta(0), 0))
+        exitosas = conteo.get('exitosas', 0)
+        valores[dia] = {
+            'entregas_totales': conteo.get('totales', 0),
+            'entregas_exitosas': exitosas,
+            'entregas_fallidas': conteo.get('fallidas', 0),
+            'ingresos_dia': exitosas * tarifa,
+            'tiempo_entrega_total': tiempo_total,
+            'entregas_medidas': medidas,
+            'tiempo_promedio': tiempo_total / medidas if medidas else None,
+        }
+    return valores
+
+
+def guardar_dias(valores):
+    """Escribe los valores calculados (idempotente); devuelve cuántos se crearon"""
+    creados = 0
+    for dia, defaults in valores.items():
+        _, creado = Reporte.objects.update_or_create(fecha=dia, defaults=defaults)
+        if creado:
+            Reporte.objects.filter(fecha=dia, observaciones='').update(
+                observaciones=f'Reporte automático generado el {timezone.localtime().strftime("%Y-%m-%d %H:%M:%S")}'
+            )
+            creados += 1
+    return creados
+
+
+def _calcular_tramo(desde, hasta):
+    try:
+        return calcular_dias(desde, hasta)
+    finally:
+        # Cada hilo usa su propia conexión
+        connection.close()
+
+
+def regenerar_rango(desde, hasta, workers=1, dias_por_tramo=7):
+    """Recalcula los reportes de [desde, hasta]; los tramos se calculan en paralelo"""
+    tramos = []
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + timedelta(days=dias_por_tramo - 1), hasta)
+        tramos.append((inicio, fin))
+        inicio = fin + timedelta(days=1)
+
+    if workers > 1 and len(tramos) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            resultados = list(executor.map(lambda tramo: _calcular_tramo(*tramo), tramos))
+    else:
+        resultados = [calcular_dias(*tramo) for tramo in tramos]
+
+    # Las escrituras quedan en el hilo principal
+    creados = 0
+    for valores in resultados:
+        with transaction.atomic():
+            creados += guardar_dias(valores)
+    return creados
+
+
+# ---------------------------------------------------------------------------
+# Actualización incremental (desde las señales)
+# ---------------------------------------------------------------------------
+
+# Filas creadas por los hooks de este hilo: {dia: momento en que se empezó a calcular}
+_creadas = threading.local()
+
+
+def _diferir(cambios):
+    """Aplica {dia: {campo: delta}} al confirmar la transacción actual"""
+    cambios = {
+        dia: {campo: delta for campo, delta in campos.items() if delta}
+        for dia, campos in cambios.items()
+    }
+    cambios = {dia: campos for dia, campos in cambios.items() if campos}
+    if cambios:
+        registrado = monotonic()
+        transaction.on_commit(lambda: _aplicar_cambios(cambios, registrado))
+
+
+def _incrementos(campos):
+    """Valores del UPDATE: incrementos atómicos y los derivados calculados sobre el resultado"""
+    valores = {campo: F(campo) + delta for campo, delta in campos.items()}
+    total = valores.get('tiempo_entrega_total', F('tiempo_entrega_total'))
+    medidas = valores.get('entregas_medidas', F('entregas_medidas'))
+    exitosas = valores.get('entregas_exitosas', F('entregas_exitosas'))
+    valores['tiempo_promedio'] = Case(
+        When(
+            entregas_medidas__gt=-campos.get('entregas_medidas', 0),
+            then=ExpressionWrapper(
+                total / ExpressionWrapper(medidas, output_field=IntegerField()), output_field=DurationField()
+            ),
+        ),
+        default=None,
+    )
+    valores['ingresos_dia'] = ExpressionWrapper(
+        exitosas * Value(tarifa_entrega()), output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+    return valores
+
+
+def _aplicar_cambios(cambios, registrado):
+    creadas = _creadas.__dict__.setdefault('dias', {})
+    for dia, campos in cambios.items():
+        if creadas.get(dia, 0) > registrado:
+            # Otro hook de este mismo commit creó la fila completa, que ya incluye el cambio
+            continue
+        if not Reporte.objects.filter(fecha=dia).update(**_incrementos(campos)):
+            # Primera vez que se toca el día: se calcula completo desde la BD,
+            # que ya incluye el cambio que originó el delta.
+            creadas[dia] = monotonic()
+            _crear_dia(dia)
+
+
+def _crear_dia(dia):
+    try:
+        with transaction.atomic():
+            guardar_dias(calcular_dias(dia, dia))
+    except IntegrityError:
+        # Otra transacción la creó en paralelo; su cálculo ya incluye este cambio
+        pass
+
+
+def aplicar_despacho(despacho, resultado_anterior, resultado_nuevo, creado):
+    """Ajusta los conteos del día del despacho tras crearlo o cambiar su resultado"""
+    if not creado and resultado_anterior == resultado_nuevo:
+        return
+
+    campos = defaultdict(int)
+    if creado:
+        campos['entregas_totales'] += 1
+    for resultado, signo in ((resultado_anterior, -1), (resultado_nuevo, 1)):
+        if creado and signo < 0:
+            continue
+        if resultado == 'entregado':
+            campos['entregas_exitosas'] += signo
+        elif resultado in RESULTADOS_FALLIDOS:
+            campos['entregas_fallidas'] += signo
+    _diferir({timezone.localdate(despacho.fecha): campos})
+
+
+def descontar_despacho(despacho, resultado):
+    """Descuenta un despacho eliminado del reporte de su día"""
+    campos = {'entregas_totales': -1}
+    if resultado == 'entregado':
+        campos['entregas_exitosas'] = -1
+    elif resultado in RESULTADOS_FALLIDOS:
+        campos['entregas_fallidas'] = -1
+    _diferir({timezone.localdate(despacho.fecha): campos})
+
+
+def _ultima_asignacion(orden_id, timestamp):
+    return OrdenMovimiento.objects.filter(
+        orden_id=orden_id,
+        timestamp__lte=timestamp,
+        descripcion__startswith=PREFIJO_ASIGNACION,
+    ).order_by('-timestamp', '-id').values_list('timestamp', flat=True).first()
+
+
+def _ultimo_movimiento(despacho_id, excluir=None):
+    return OrdenMovimiento.objects.filter(despacho_id=despacho_id).exclude(pk=excluir).order_by(
+        '-timestamp', '-id'
+    ).values_list('orden_id', 'timestamp').first()
+
+
+def _medir(orden_id, timestamp):
+    asignacion = _ultima_asignacion(orden_id, timestamp)
+    return None if asignacion is None else (timestamp, timestamp - asignacion)
+
+
+def medicion_despacho(despacho_id):
+    """(timestamp, tiempo) del último movimiento del despacho, el único que cuenta en _tiempos.
+
+    None si no tiene movimientos o asignación previa.
+    """
+    ultimo = _ultimo_movimiento(despacho_id)
+    return _medir(*ultimo) if ultimo else None
+
+
+def _sumar_mediciones(cambios):
+    """Aplica [(medicion, signo)] a los días de cada medición"""
+    por_dia = defaultdict(lambda: {'tiempo_entrega_total': timedelta(0), 'entregas_medidas': 0})
+    for (timestamp, tiempo), signo in cambios:
+        campos = por_dia[timezone.localdate(timestamp)]
+        campos['tiempo_entrega_total'] += tiempo * signo
+        campos['entregas_medidas'] += signo
+    _diferir(por_dia)
+
+
+def aplicar_movimiento_resultado(movimiento):
+    """Suma el tiempo de entrega de un movimiento que registra un resultado.
+
+    Cada despacho mide solo su último movimiento: la medición de un resultado
+    anterior del mismo despacho se reemplaza.
+    """
+    cambios = []
+    ultimo = _ultimo_movimiento(movimiento.despacho_id, excluir=movimiento.pk)
+    if ultimo is not None:
+        if ultimo[1] > movimiento.timestamp:
+            # Llegó fuera de orden: el movimiento vigente es otro
+            return
+        anterior = _medir(*ultimo)
+        if anterior is not None:
+            cambios.append((anterior, -1))
+    nueva = _medir(movimiento.orden_id, movimiento.timestamp)
+    if nueva is not None:
+        cambios.append((nueva, 1))
+    _sumar_mediciones(cambios)
+
+
+def descontar_medicion(medicion):
+    """Descuenta el tiempo de entrega de un despacho eliminado (ver medicion_despacho)"""
+    if medicion is not None:
+        _sumar_mediciones([(medicion, -1)])
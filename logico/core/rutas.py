@@ -0,0 +1,217 @@
+"""
+Secuenciación de las paradas de una Ruta.
+
+Ordena las órdenes de la ruta para minimizar la distancia recorrida: vecino
+más cercano como solución inicial y luego 2-opt y Or-opt (mover tramos de
+1 a 3 paradas, también invertidos) hasta que ninguna mejora acorta el
+recorrido. Ambas búsquedas evalúan con NumPy todas las posiciones de
+destino de una vez sobre una matriz de distancias precalculada (haversine
+vectorizado si solo se tienen coordenadas).
+
+El recorrido es abierto (no vuelve al inicio) y parte de un origen opcional,
+p. ej. la posición del repartidor. Las órdenes de prioridad alta se visitan
+primero; el resto continúa desde la última de ellas. Las órdenes sin
+coordenadas quedan al final de su grupo, en su orden actual. La secuencia
+se guarda en RutaOrden.secuencia.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import Despacho, RutaOrden
+
+RADIO_TIERRA_KM = 6371.0088
+LARGO_MAXIMO_TRAMO = 3
+MAXIMO_ITERACIONES = 1000
+TOLERANCIA = 1e-9
+
+
+# ---------------------------------------------------------------------------
+# Distancias
+# ---------------------------------------------------------------------------
+
+def matriz_distancias(coordenadas, destinos=None):
+    """Distancias haversine en km entre [(lat, lng), ...] y destinos (por defecto, los mismos puntos)"""
+    origen = np.radians(np.asarray(coordenadas, dtype=float).reshape(-1, 2))
+    destino = origen if destinos is None else np.radians(np.asarray(destinos, dtype=float).reshape(-1, 2))
+    lat, lng = origen[:, 0][:, None], origen[:, 1][:, None]
+    lat_destino, lng_destino = destino[:, 0][None, :], destino[:, 1][None, :]
+    a = (
+        np.sin((lat - lat_destino) / 2) ** 2
+        + np.cos(lat) * np.cos(lat_destino) * np.sin((lng - lng_destino) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def largo_recorrido(matriz, recorrido):
+    recorrido = np.asarray(recorrido)
+    if len(recorrido) < 2:
+        return 0.0
+    return float(matriz[recorrido[:-1], recorrido[1:]].sum())
+
+
+# ---------------------------------------------------------------------------
+# Heurísticas
+#
+# Trabajan sobre un camino [inicio, paradas..., fin] cuyos extremos no se
+# mueven. Un nodo ficticio a distancia 0 de todos hace de fin (recorrido
+# abierto) y, si no hay origen, también de inicio (se empieza donde convenga).
+# ---------------------------------------------------------------------------
+
+def _vecino_mas_cercano(matriz, inicio, paradas):
+    pendientes = list(paradas)
+    camino = [inicio]
+    while pendientes:
+        distancias = matriz[camino[-1], pendientes]
+        camino.append(pendientes.pop(int(np.argmin(distancias))))
+    return camino
+
+
+def _dos_opt(matriz, camino):
+    """Invierte el tramo camino[i..j] cuando acorta el recorrido; True si mejoró"""
+    mejoro = False
+    for i in range(1, len(camino) - 2):
+        j = np.arange(i + 1, len(camino) - 1)
+        anterior, primero = camino[i - 1], camino[i]
+        ultimos, siguientes = camino[j], camino[j + 1]
+        deltas = (
+            matriz[anterior, ultimos] + matriz[primero, siguientes]
+            - matriz[anterior, primero] - matriz[ultimos, siguientes]
+        )
+        mejor = int(np.argmin(deltas))
+        if deltas[mejor] < -TOLERANCIA:
+            fin = j[mejor]
+            camino[i:fin + 1] = camino[i:fin + 1][::-1].copy()
+            mejoro = True
+    return mejoro
+
+
+def _or_opt(matriz, camino):
+    """Mueve tramos de 1 a LARGO_MAXIMO_TRAMO paradas (o su inverso) a otra posición"""
+    mejoro = False
+    for largo in range(1, LARGO_MAXIMO_TRAMO + 1):
+        i = 1
+        while i + largo < len(camino):
+            tramo = camino[i:i + largo]
+            anterior, siguiente = camino[i - 1], camino[i + largo]
+            ganancia = (
+                matriz[anterior, tramo[0]] + matriz[tramo[-1], siguiente] - matriz[anterior, siguiente]
+            )
+            resto = np.concatenate([camino[:i], camino[i + largo:]])
+            # Insertar entre resto[k] y resto[k + 1]
+            izquierda, derecha = resto[:-1], resto[1:]
+            base = matriz[izquierda, derecha]
+            directo = matriz[izquierda, tramo[0]] + matriz[tramo[-1], derecha] - base
+            invertido = matriz[izquierda, tramo[-1]] + matriz[tramo[0], derecha] - base
+            costos = np.minimum(directo, invertido)
+            costos[i - 1] = np.inf  # posición original
+            k = int(np.argmin(costos))
+            if costos[k] - ganancia < -TOLERANCIA:
+                insertar = tramo if directo[k] <= invertido[k] else tramo[::-1]
+                camino[:] = np.concatenate([resto[:k + 1], insertar, resto[k + 1:]])
+                mejoro = True
+            else:
+                i += 1
+    return mejoro
+
+
+def secuenciar(matriz, paradas, inicio=None):
+    """Orden de visita de paradas (índices de matriz) partiendo de inicio (índice o None)"""
+    paradas = list(paradas)
+    if len(paradas) < 2:
+        return paradas
+    # Matriz con el nodo ficticio al final
+    n = len(matriz)
+    extendida = np.zeros((n + 1, n + 1))
+    extendida[:n, :n] = matriz
+    ficticio = n
+    origen = ficticio if inicio is None else inicio
+
+    camino = np.array(_vecino_mas_cercano(extendida, origen, paradas) + [ficticio])
+    for _ in range(MAXIMO_ITERACIONES):
+        mejoro = _dos_opt(extendida, camino)
+        mejoro = _or_opt(extendida, camino) or mejoro
+        if not mejoro:
+            break
+    return [int(nodo) for nodo in camino[1:-1]]
+
+
+# ---------------------------------------------------------------------------
+# Ruta
+# ---------------------------------------------------------------------------
+
+def coordenadas_ordenes(ordenes):
+    """{orden_id: (lat, lng)} de las órdenes (objetos con coordenadas_lat y coordenadas_lng).
+
+    Se usan las coordenadas geocodificadas de la dirección (core.geocodificacion);
+    si no las tiene, la última posición registrada al despacharla (p. ej. un
+    intento fallido en la misma dirección).
+    """
+    coordenadas = {
+        orden.pk: (float(orden.coordenadas_lat), float(orden.coordenadas_lng))
+        for orden in ordenes if orden.coordenadas_lat is not None and orden.coordenadas_lng is not None
+    }
+    sin_coordenadas = [orden.pk for orden in ordenes if orden.pk not in coordenadas]
+    if sin_coordenadas:
+        despachos = Despacho.objects.filter(
+            orden__in=sin_coordenadas, coordenadas_lat__isnull=False, coordenadas_lng__isnull=False
+        ).order_by('orden_id', '-fecha', '-id').values_list('orden_id', 'coordenadas_lat', 'coordenadas_lng')
+        for orden_id, lat, lng in despachos:
+            coordenadas.setdefault(orden_id, (float(lat), float(lng)))
+    return coordenadas
+
+
+def secuenciar_ordenes(ordenes, coordenadas, origen=None):
+    """(órdenes en orden de visita, km del recorrido) a partir de {orden_id: (lat, lng)}.
+
+    Alta primero; dentro de cada grupo, las ubicadas y luego las que no
+    tienen coordenadas (en el orden recibido).
+    """
+    ubicadas = [orden for orden in ordenes if orden.pk in coordenadas]
+    puntos = [coordenadas[orden.pk] for orden in ubicadas]
+    if origen is not None:
+        puntos.append(origen)
+    matriz = matriz_distancias(puntos) if puntos else np.zeros((0, 0))
+    inicio = len(ubicadas) if origen is not None else None
+
+    secuencia = []
+    for alta in (True, False):
+        indices = [i for i, orden in enumerate(ubicadas) if (orden.prioridad == 'alta') == alta]
+        desde = secuencia[-1] if secuencia else inicio
+        secuencia += secuenciar(matriz, indices, desde)
+    recorrido = ([inicio] if inicio is not None else []) + secuencia
+
+    sin_coordenadas = [orden for orden in ordenes if orden.pk not in coordenadas]
+    ordenadas = [ubicadas[i] for i in secuencia]
+    ordenadas = (
+        [orden for orden in ordenadas if orden.prioridad == 'alta']
+        + [orden for orden in sin_coordenadas if orden.prioridad == 'alta']
+        + [orden for orden in ordenadas if orden.prioridad != 'alta']
+        + [orden for orden in sin_coordenadas if orden.prioridad != 'alta']
+    )
+    return ordenadas, largo_recorrido(matriz, recorrido)
+
+
+def optimizar(ruta, origen=None):
+    """Calcula y guarda la secuencia de la ruta; devuelve un resumen.
+
+    origen es (lat, lng) o None (se empieza por la parada que deja el
+    recorrido más corto).
+    """
+    paradas = list(ruta.paradas.select_related('orden').only(
+        'id', 'ruta', 'secuencia', 'orden__id', 'orden__prioridad', 'orden__coordenadas_lat', 'orden__coordenadas_lng'
+    ))
+    por_orden = {parada.orden_id: parada for parada in paradas}
+    ordenes = [parada.orden for parada in paradas]
+    coordenadas = coordenadas_ordenes(ordenes)
+    ordenadas, distancia = secuenciar_ordenes(ordenes, coordenadas, origen)
+
+    for numero, orden in enumerate(ordenadas, start=1):
+        por_orden[orden.pk].secuencia = numero
+    with transaction.atomic():
+        RutaOrden.objects.bulk_update(paradas, ['secuencia'])
+
+    return {
+        'ordenes': [orden.pk for orden in ordenadas],
+        'sin_coordenadas': [orden.pk for orden in ordenes if orden.pk not in coordenadas],
+        'distancia_km': round(distancia, 3),
+    }
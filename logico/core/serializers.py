@@ -1,18 +1,125 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from .models import (
     UsuarioProfile, Moto, Orden, Medicamento, 
-    Despacho, OrdenMovimiento, Ruta, Reporte, Farmacia
+    Despacho, OrdenMovimiento, Ruta, Reporte, Farmacia, ORDEN_PARADAS
 )
 
 
+def _como_lista(valor):
+    return list(valor) if isinstance(valor, (list, tuple)) else [valor]
+
+
+def _parametro_lista(valor):
+    return [nombre.strip() for nombre in (valor or '').split(',') if nombre.strip()]
+
+
+class RelacionesMixin:
+    """Declara qué consultas necesita cada campo del serializer.
+    
+    select_related, prefetch_related y anotaciones asocian un campo con las
+    relaciones (o la expresión) que usa; columnas_por_campo indica las
+    columnas del modelo de los campos cuyo source no es una columna (métodos,
+    propiedades). Los viewsets (ver api_views.RelacionesViewSetMixin) pasan a
+    preparar_queryset() los campos pedidos, de modo que listar una página
+    cuesta un número fijo de consultas y solo se leen las columnas y uniones
+    que se van a serializar.
+    
+    campos_lista es la representación compacta de los listados (None: todos
+    los campos) y campos_expandibles los campos anidados que un listado solo
+    incluye con ?expand=.
+    """
+    select_related = {}
+    prefetch_related = {}
+    anotaciones = {}
+    columnas_por_campo = {}
+    campos_lista = None
+    campos_expandibles = ()
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = self.context.get('campos')
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+    
+    @classmethod
+    def campos_pedidos(cls, parametros, es_lista):
+        """Campos a serializar según ?fields= y ?expand=; None si son todos"""
+        disponibles = list(cls().fields)
+        campos = _parametro_lista(parametros.get('fields'))
+        expandir = _parametro_lista(parametros.get('expand'))
+        
+        errores = {}
+        desconocidos = [nombre for nombre in campos if nombre not in disponibles]
+        if desconocidos:
+            errores['fields'] = f'Campos desconocidos: {", ".join(desconocidos)}'
+        desconocidos = [nombre for nombre in expandir if nombre not in cls.campos_expandibles]
+        if desconocidos:
+            errores['expand'] = f'Campos no expandibles: {", ".join(desconocidos)}'
+        if errores:
+            raise serializers.ValidationError(errores)
+        
+        if not campos:
+            if not es_lista or cls.campos_lista is None:
+                return None
+            campos = cls.campos_lista
+        return [nombre for nombre in disponibles if nombre in campos or nombre in expandir]
+    
+    @classmethod
+    def columnas(cls, campos):
+        """Columnas del modelo que leen los campos"""
+        serializer = cls()
+        columnas = set()
+        for nombre in campos:
+            if nombre in cls.columnas_por_campo:
+                columnas.update(cls.columnas_por_campo[nombre])
+            elif serializer.fields[nombre].source != '*':
+                columnas.add(serializer.fields[nombre].source.split('.')[0])
+        return columnas
+    
+    @classmethod
+    def preparar_queryset(cls, queryset, campos=None, columnas_extra=()):
+        """Aplica las relaciones y anotaciones de los campos (todos si campos es None).
+        
+        Con campos, además restringe el SELECT con only() a sus columnas, la
+        clave primaria y columnas_extra (p. ej. las del orden de la paginación).
+        """
+        def incluido(nombre):
+            return campos is None or nombre in campos
+        
+        select, prefetch = [], []
+        for declaradas, relaciones in ((cls.select_related, select), (cls.prefetch_related, prefetch)):
+            for nombre, valor in declaradas.items():
+                if incluido(nombre):
+                    # Prefetch compara por ruta: una misma relación se precarga una vez
+                    relaciones.extend(relacion for relacion in _como_lista(valor) if relacion not in relaciones)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        anotaciones = {nombre: expresion for nombre, expresion in cls.anotaciones.items() if incluido(nombre)}
+        if anotaciones:
+            queryset = queryset.annotate(**anotaciones)
+        
+        if campos is not None:
+            concretas = {campo.name for campo in queryset.model._meta.concrete_fields}
+            columnas = (cls.columnas(campos) | set(columnas_extra)) & concretas
+            queryset = queryset.only(queryset.model._meta.pk.name, *columnas)
+        return queryset
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
-class UsuarioProfileSerializer(serializers.ModelSerializer):
+class UsuarioProfileSerializer(RelacionesMixin, serializers.ModelSerializer):
+    select_related = {'user': 'user', 'moto_patente': 'moto'}
+    campos_lista = ['id', 'user', 'rol', 'moto', 'moto_patente', 'estado_turno', 'activo']
     user = UserSerializer(read_only=True)
     moto_patente = serializers.CharField(source='moto.patente', read_only=True)
     
@@ -26,7 +133,10 @@ class UsuarioProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['fecha_creacion']
 
 
-class MotoSerializer(serializers.ModelSerializer):
+class MotoSerializer(RelacionesMixin, serializers.ModelSerializer):
+    select_related = {'repartidor_nombre': 'usuario_asignado__user'}
+    columnas_por_campo = {'dias_sin_mantenimiento': ['fecha_ultimo_mantenimiento']}
+    campos_lista = ['id', 'patente', 'marca', 'modelo', 'estado', 'activa', 'repartidor_nombre']
     repartidor_nombre = serializers.CharField(source='repartidor_asignado.user.get_full_name', read_only=True)
     dias_sin_mantenimiento = serializers.IntegerField(read_only=True)
     
@@ -42,55 +152,118 @@ class MotoSerializer(serializers.ModelSerializer):
         read_only_fields = ['fecha_ingreso']
 
 
-class FarmaciaSerializer(serializers.ModelSerializer):
+class FarmaciaSerializer(RelacionesMixin, serializers.ModelSerializer):
+    # Solo presente con ?near= (ver core.espacial)
+    distancia_km = serializers.FloatField(read_only=True)
+    
     class Meta:
         model = Farmacia
-        fields = ['id', 'nombre', 'direccion', 'telefono', 'ciudad', 'activa']
+        fields = ['id', 'nombre', 'direccion', 'telefono', 'ciudad', 'coordenadas_lat', 'coordenadas_lng', 'activa', 'distancia_km']
 
 
-class MedicamentoSerializer(serializers.ModelSerializer):
+class MedicamentoSerializer(RelacionesMixin, serializers.ModelSerializer):
     class Meta:
         model = Medicamento
         fields = ['id', 'orden', 'codigo', 'nombre', 'cantidad', 'observaciones']
 
 
-class OrdenSerializer(serializers.ModelSerializer):
+class OrdenSerializer(RelacionesMixin, serializers.ModelSerializer):
+    select_related = {
+        'responsable_nombre': 'responsable__user',
+        'farmacia_origen_nombre': 'farmacia_origen',
+        'farmacia_destino_nombre': 'farmacia_destino',
+    }
+    prefetch_related = {'medicamentos': 'medicamentos'}
+    columnas_por_campo = {'estado_display': ['estado_actual']}
+    campos_lista = [
+        'id', 'cliente', 'direccion', 'telefono_cliente', 'prioridad', 'tipo',
+        'estado_actual', 'estado_display', 'responsable', 'responsable_nombre',
+        'fecha_creacion', 'total_despachos', 'distancia_km'
+    ]
+    campos_expandibles = ('medicamentos',)
     medicamentos = MedicamentoSerializer(many=True, read_only=True)
     responsable_nombre = serializers.CharField(source='responsable.user.get_full_name', read_only=True)
     estado_display = serializers.CharField(source='get_estado_actual_display', read_only=True)
     farmacia_origen_nombre = serializers.CharField(source='farmacia_origen.nombre', read_only=True)
     farmacia_destino_nombre = serializers.CharField(source='farmacia_destino.nombre', read_only=True)
+    # Solo presente con ?near= (ver core.espacial)
+    distancia_km = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Orden
         fields = [
-            'id', 'cliente', 'direccion', 'telefono_cliente', 'descripcion',
+            'id', 'cliente', 'direccion', 'coordenadas_lat', 'coordenadas_lng',
+            'telefono_cliente', 'descripcion',
             'prioridad', 'tipo', 'estado_actual', 'estado_display',
             'farmacia_origen', 'farmacia_origen_nombre',
             'farmacia_destino', 'farmacia_destino_nombre',
             'responsable', 'responsable_nombre', 'fecha_creacion',
-            'fecha_actualizacion', 'medicamentos'
+            'fecha_actualizacion', 'ultimo_despacho', 'total_despachos',
+            'medicamentos', 'distancia_km'
         ]
-        read_only_fields = ['fecha_creacion', 'fecha_actualizacion']
+        read_only_fields = ['fecha_creacion', 'fecha_actualizacion', 'ultimo_despacho', 'total_despachos']
 
 
-class DespachoSerializer(serializers.ModelSerializer):
+class MedicamentoLoteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Medicamento
+        fields = ['codigo', 'nombre', 'cantidad', 'observaciones']
+
+
+class OrdenLoteSerializer(serializers.ModelSerializer):
+    """Orden con medicamentos anidados para la carga masiva (ver core.ingesta).
+    
+    Las FK se reciben como ids y se validan para todo el lote con una consulta
+    por tabla, en vez de una por orden.
+    """
+    medicamentos = MedicamentoLoteSerializer(many=True, required=False)
+    farmacia_origen = serializers.IntegerField(required=False, allow_null=True)
+    farmacia_destino = serializers.IntegerField(required=False, allow_null=True)
+    responsable = serializers.IntegerField(required=False, allow_null=True)
+    
+    class Meta:
+        model = Orden
+        fields = [
+            'cliente', 'direccion', 'telefono_cliente', 'descripcion',
+            'prioridad', 'tipo', 'estado_actual',
+            'farmacia_origen', 'farmacia_destino', 'responsable',
+            'medicamentos'
+        ]
+
+
+class DespachoSerializer(RelacionesMixin, serializers.ModelSerializer):
+    select_related = {
+        'orden_cliente': 'orden',
+        'orden_direccion': 'orden',
+        'repartidor_nombre': 'repartidor__user',
+    }
+    campos_lista = [
+        'id', 'orden', 'orden_cliente', 'numero_despacho', 'repartidor',
+        'repartidor_nombre', 'estado', 'resultado', 'foto_miniatura', 'fecha', 'total_intentos', 'distancia_km'
+    ]
     orden_cliente = serializers.CharField(source='orden.cliente', read_only=True)
     orden_direccion = serializers.CharField(source='orden.direccion', read_only=True)
     repartidor_nombre = serializers.CharField(source='repartidor.user.get_full_name', read_only=True)
+    # Solo presente cuando el queryset viene anotado (p. ej. /api/despachos/ultimos/)
+    total_intentos = serializers.IntegerField(read_only=True)
+    # Solo presente con ?near= (ver core.espacial)
+    distancia_km = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Despacho
         fields = [
             'id', 'orden', 'orden_cliente', 'orden_direccion',
             'numero_despacho', 'repartidor', 'repartidor_nombre',
-            'estado', 'resultado', 'foto_entrega', 'observaciones',
-            'coordenadas_lat', 'coordenadas_lng', 'fecha'
+            'estado', 'resultado', 'foto_entrega', 'foto_miniatura', 'observaciones',
+            'coordenadas_lat', 'coordenadas_lng', 'fecha', 'total_intentos', 'distancia_km'
         ]
-        read_only_fields = ['fecha', 'numero_despacho']
+        read_only_fields = ['fecha', 'numero_despacho', 'foto_miniatura']
 
 
-class OrdenMovimientoSerializer(serializers.ModelSerializer):
+class OrdenMovimientoSerializer(RelacionesMixin, serializers.ModelSerializer):
+    select_related = {'orden_cliente': 'orden', 'repartidor_nombre': 'repartidor__user'}
+    columnas_por_campo = {'estado_display': ['estado']}
+    campos_lista = ['id', 'orden', 'estado', 'estado_display', 'descripcion', 'repartidor', 'timestamp']
     orden_cliente = serializers.CharField(source='orden.cliente', read_only=True)
     repartidor_nombre = serializers.CharField(source='repartidor.user.get_full_name', read_only=True)
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
@@ -105,9 +278,22 @@ class OrdenMovimientoSerializer(serializers.ModelSerializer):
         read_only_fields = ['timestamp']
 
 
-class RutaSerializer(serializers.ModelSerializer):
+class RutaSerializer(RelacionesMixin, serializers.ModelSerializer):
+    select_related = {'repartidor_nombre': 'repartidor__user'}
+    # get_google_maps_url lee las órdenes ya precargadas, en el orden de visita (core.rutas)
+    _ordenes = Prefetch(
+        'ordenes', queryset=OrdenSerializer.preparar_queryset(Orden.objects.all()).order_by(*ORDEN_PARADAS)
+    )
+    prefetch_related = {'ordenes': _ordenes, 'google_maps_url': _ordenes}
+    # Subconsulta en vez de Count('ordenes'): con GROUP BY se pierde el Meta.ordering
+    anotaciones = {'ordenes_count': Coalesce(Subquery(
+        Ruta.ordenes.through.objects.filter(ruta=OuterRef('pk')).order_by()
+        .values('ruta').annotate(total=Count('id')).values('total')
+    ), 0)}
+    campos_lista = ['id', 'nombre', 'zona', 'repartidor', 'repartidor_nombre', 'activa', 'generada', 'ordenes_count', 'fecha_creacion']
+    campos_expandibles = ('ordenes',)
     repartidor_nombre = serializers.CharField(source='repartidor.user.get_full_name', read_only=True)
-    ordenes_count = serializers.IntegerField(source='ordenes.count', read_only=True)
+    ordenes_count = serializers.SerializerMethodField()
     google_maps_url = serializers.CharField(source='get_google_maps_url', read_only=True)
     ordenes = OrdenSerializer(many=True, read_only=True)
     
@@ -115,13 +301,20 @@ class RutaSerializer(serializers.ModelSerializer):
         model = Ruta
         fields = [
             'id', 'nombre', 'descripcion', 'zona', 'vehiculo',
-            'repartidor', 'repartidor_nombre', 'activa',
+            'repartidor', 'repartidor_nombre', 'activa', 'generada',
             'ordenes', 'ordenes_count', 'google_maps_url', 'fecha_creacion'
         ]
-        read_only_fields = ['fecha_creacion']
+        read_only_fields = ['generada', 'fecha_creacion']
+    
+    def get_ordenes_count(self, ruta):
+        # Anotado por preparar_queryset; si no, se cuenta (con las órdenes precargadas si las hay)
+        if hasattr(ruta, 'ordenes_count'):
+            return ruta.ordenes_count
+        return ruta.ordenes.count()
 
 
-class ReporteSerializer(serializers.ModelSerializer):
+class ReporteSerializer(RelacionesMixin, serializers.ModelSerializer):
+    columnas_por_campo = {'tasa_exito': ['entregas_totales', 'entregas_exitosas']}
     tasa_exito = serializers.FloatField(read_only=True)
     
     class Meta:
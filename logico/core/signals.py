@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import UsuarioProfile
+from .models import UsuarioProfile, Orden, Despacho, Moto, OrdenMovimiento, Medicamento, Farmacia
+from . import agregados, condicional, espacial, estadisticas, fotos, geocodificacion, posiciones, reportes, sincronizacion
+from .middleware import invalidar_perfil
+
+# Cada inicio de sesión guarda last_login del usuario, que no aparece en el perfil ni en la API
+SOLO_INICIO_SESION = {'last_login'}
 
 
 @receiver(post_save, sender=User)
@@ -20,8 +27,314 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
     """Guarda el perfil cuando se guarda el usuario"""
+    if update_fields and set(update_fields) <= SOLO_INICIO_SESION:
+        return
     if hasattr(instance, 'profile'):
         instance.profile.save()
 
+
+@receiver(post_save, sender=UsuarioProfile)
+@receiver(post_delete, sender=UsuarioProfile)
+def invalidar_cache_perfil(sender, instance, **kwargs):
+    """Invalida el perfil cacheado por UsuarioProfileMiddleware"""
+    invalidar_perfil(instance.user_id)
+
+
+@receiver(post_save, sender=Moto)
+@receiver(pre_delete, sender=Moto)
+def invalidar_cache_perfil_moto(sender, instance, **kwargs):
+    """El perfil cacheado incluye la moto asignada (pre_delete: antes de que se desasigne)"""
+    for user_id in UsuarioProfile.objects.filter(moto=instance).values_list('user_id', flat=True):
+        invalidar_perfil(user_id)
+
+
+@receiver(pre_delete, sender=Despacho)
+def cargar_fecha_despacho(sender, instance, **kwargs):
+    """Carga la fecha si está diferida y la medición del tiempo de entrega: se descuentan del reporte"""
+    if 'fecha' not in instance.__dict__:
+        instance.fecha = sender.objects.filter(pk=instance.pk).values_list('fecha', flat=True).first()
+    # Antes de que los movimientos queden sin despacho (SET_NULL)
+    instance._medicion_entrega = reportes.medicion_despacho(instance.pk)
+
+
+@receiver(post_save, sender=OrdenMovimiento)
+def agregar_movimiento(sender, instance, created, raw=False, **kwargs):
+    """Suma el movimiento a sus agregados y, si registra un resultado, al reporte del día"""
+    if not created or raw:
+        return
+    agregados.aplicar_movimiento(instance, 1)
+    if instance.despacho_id and instance.despacho.resultado:
+        reportes.aplicar_movimiento_resultado(instance)
+
+
+@receiver(post_delete, sender=OrdenMovimiento)
+def descontar_movimiento(sender, instance, **kwargs):
+    if 'timestamp' in instance.__dict__:
+        agregados.aplicar_movimiento(instance, -1)
+
+
+@receiver(pre_save, sender=Despacho)
+def detectar_foto_nueva(sender, instance, raw=False, **kwargs):
+    """Una foto recién subida todavía no está guardada en el storage"""
+    if not raw and 'foto_entrega' in instance.__dict__:
+        foto = instance.foto_entrega
+        instance._foto_nueva = bool(foto) and not foto._committed
+
+
+@receiver(post_save, sender=Despacho)
+def encolar_foto_nueva(sender, instance, **kwargs):
+    """La foto se redimensiona y recomprime en segundo plano (ver core.fotos)"""
+    if instance.__dict__.pop('_foto_nueva', False):
+        fotos.encolar(instance)
+
+
+@receiver(post_delete, sender=Despacho)
+def sincronizar_orden_despacho_eliminado(sender, instance, **kwargs):
+    """Recalcula el último despacho y el total de intentos de la orden"""
+    Orden.objects.filter(pk=instance.orden_id).sincronizar_despachos()
+
+
+# ========== AGREGADOS POR TRAMO ==========
+
+# Se conectan antes que las estadísticas: sus incrementos se aplican al
+# confirmar, en orden de registro, y un reporte diario que se crea completo
+# (core.reportes) lee los agregados ya actualizados.
+
+def agregados_guardar_estado(sender, instance, **kwargs):
+    """Recuerda las dimensiones cargadas desde la BD (farmacia de origen en las órdenes)"""
+    if instance.pk is None:
+        return
+    if sender is Despacho:
+        instance._agregados_previos = agregados.estado_despacho(instance)
+    elif 'farmacia_origen_id' in instance.__dict__:
+        instance._farmacia_origen_previa = instance.farmacia_origen_id
+
+
+def agregados_completar_estado(sender, instance, raw=False, **kwargs):
+    """Si las dimensiones previas no se conocen (campos diferidos), se leen de la BD"""
+    if raw or instance.pk is None or instance._state.adding:
+        return
+    if sender is Despacho:
+        if getattr(instance, '_agregados_previos', None) is None:
+            previo = sender.objects.filter(pk=instance.pk).values_list(*agregados.CAMPOS_DESPACHO).first()
+            instance._agregados_previos = tuple(previo) if previo else None
+    elif not hasattr(instance, '_farmacia_origen_previa'):
+        instance._farmacia_origen_previa = sender.objects.filter(pk=instance.pk).values_list(
+            'farmacia_origen_id', flat=True
+        ).first()
+
+
+def agregados_aplicar_guardado(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if sender is Despacho:
+        nuevo = agregados.estado_despacho(instance)
+        if nuevo is None:
+            nuevo = tuple(sender.objects.filter(pk=instance.pk).values_list(*agregados.CAMPOS_DESPACHO).get())
+        anterior = None if created else getattr(instance, '_agregados_previos', None)
+        if anterior != nuevo:
+            agregados.aplicar_despacho(instance, anterior, nuevo)
+        instance._agregados_previos = nuevo
+    elif 'farmacia_origen_id' in instance.__dict__:
+        if not created and instance._farmacia_origen_previa != instance.farmacia_origen_id:
+            agregados.mover_farmacia(instance.pk, instance._farmacia_origen_previa, instance.farmacia_origen_id)
+        instance._farmacia_origen_previa = instance.farmacia_origen_id
+
+
+def agregados_aplicar_eliminacion(sender, instance, **kwargs):
+    """Las órdenes eliminadas ya descontaron sus despachos (se eliminan antes, en cascada)"""
+    anterior = getattr(instance, '_agregados_previos', None)
+    if anterior is not None and instance.__dict__.get('fecha'):
+        agregados.aplicar_despacho(instance, anterior, None)
+
+
+post_init.connect(agregados_guardar_estado, sender=Orden)
+pre_save.connect(agregados_completar_estado, sender=Orden)
+post_save.connect(agregados_aplicar_guardado, sender=Orden)
+post_init.connect(agregados_guardar_estado, sender=Despacho)
+pre_save.connect(agregados_completar_estado, sender=Despacho)
+pre_delete.connect(agregados_completar_estado, sender=Despacho)
+post_save.connect(agregados_aplicar_guardado, sender=Despacho)
+post_delete.connect(agregados_aplicar_eliminacion, sender=Despacho)
+
+
+# ========== ESTADÍSTICAS DEL DASHBOARD ==========
+
+MODELOS_CON_ESTADISTICAS = (Orden, Despacho, UsuarioProfile, Moto)
+
+
+def estadisticas_guardar_estado(sender, instance, **kwargs):
+    """Recuerda el estado cargado desde la BD para calcular deltas al guardar"""
+    if instance.pk is not None:
+        instance._estadisticas_previas = estadisticas.FUNCIONES_ESTADO[sender](instance)
+
+
+def estadisticas_completar_estado(sender, instance, raw=False, **kwargs):
+    """Si el estado previo no se conoce (campos diferidos), se lee de la BD"""
+    if raw or instance.pk is None or instance._state.adding:
+        return
+    if getattr(instance, '_estadisticas_previas', None) is None:
+        previa = sender.objects.filter(pk=instance.pk).first()
+        if previa is not None:
+            instance._estadisticas_previas = estadisticas.FUNCIONES_ESTADO[sender](previa)
+
+
+def estadisticas_aplicar_guardado(sender, instance, created, raw=False, **kwargs):
+    """Aplica el delta entre el estado previo y el guardado"""
+    if raw:
+        return
+    funcion_estado = estadisticas.FUNCIONES_ESTADO[sender]
+    nuevo = funcion_estado(instance)
+    if nuevo is None:
+        # Guardado parcial (update_fields sobre una instancia diferida)
+        nuevo = funcion_estado(sender.objects.get(pk=instance.pk))
+    anterior = None if created else getattr(instance, '_estadisticas_previas', None)
+    if anterior != nuevo:
+        estadisticas.aplicar_deltas(estadisticas.calcular_deltas(sender, anterior, nuevo))
+        if sender is Despacho:
+            cache.delete(estadisticas.CACHE_ENTREGAS_POR_DIA)
+            reportes.aplicar_despacho(instance, anterior[0] if anterior else None, nuevo[0], created)
+    instance._estadisticas_previas = nuevo
+
+
+def estadisticas_aplicar_eliminacion(sender, instance, **kwargs):
+    """Descuenta la instancia eliminada de los contadores"""
+    anterior = getattr(instance, '_estadisticas_previas', None)
+    if anterior is not None:
+        estadisticas.aplicar_deltas(estadisticas.calcular_deltas(sender, anterior, None))
+        if sender is Despacho:
+            cache.delete(estadisticas.CACHE_ENTREGAS_POR_DIA)
+            if instance.__dict__.get('fecha'):
+                reportes.descontar_despacho(instance, anterior[0])
+            if anterior[0]:
+                reportes.descontar_medicion(instance.__dict__.get('_medicion_entrega'))
+
+
+for modelo in MODELOS_CON_ESTADISTICAS:
+    post_init.connect(estadisticas_guardar_estado, sender=modelo)
+    pre_save.connect(estadisticas_completar_estado, sender=modelo)
+    pre_delete.connect(estadisticas_completar_estado, sender=modelo)
+    post_save.connect(estadisticas_aplicar_guardado, sender=modelo)
+    post_delete.connect(estadisticas_aplicar_eliminacion, sender=modelo)
+
+
+# ========== VERSIONES PARA GET CONDICIONAL ==========
+
+def incrementar_versiones(sender, raw=False, update_fields=None, **kwargs):
+    """Invalida los ETag de los recursos de la API que muestran el modelo"""
+    if raw:
+        return
+    if sender is User and update_fields and set(update_fields) <= SOLO_INICIO_SESION:
+        return
+    condicional.incrementar(*condicional.recursos_de(sender))
+
+
+for modelo in (Orden, Medicamento, Despacho, Farmacia, UsuarioProfile, Moto, User):
+    post_save.connect(incrementar_versiones, sender=modelo)
+    post_delete.connect(incrementar_versiones, sender=modelo)
+
+
+# ========== LÁPIDAS PARA LA SINCRONIZACIÓN DE DISPOSITIVOS ==========
+
+MODELOS_SINCRONIZADOS = (Orden, Despacho, Medicamento, OrdenMovimiento)
+
+
+def sincronizacion_recordar_repartidor(sender, instance, **kwargs):
+    """Antes de eliminar: la orden de los hijos todavía existe aunque se borre en cascada"""
+    instance._repartidor_sincronizacion = sincronizacion.repartidor_de(instance)
+
+
+def sincronizacion_registrar_eliminacion(sender, instance, **kwargs):
+    sincronizacion.registrar_eliminacion(instance, getattr(instance, '_repartidor_sincronizacion', None))
+
+
+def sincronizacion_guardar_repartidor(sender, instance, raw=False, **kwargs):
+    """Repartidor anterior de una orden o despacho, del estado que completan las estadísticas"""
+    previas = getattr(instance, '_estadisticas_previas', None)
+    if not raw and not instance._state.adding and previas is not None:
+        # (estado, repartidor) en estadisticas.estado_orden y estado_despacho
+        instance._repartidor_previo = previas[1]
+
+
+def sincronizacion_aplicar_reasignacion(sender, instance, created, raw=False, **kwargs):
+    if created or raw or not hasattr(instance, '_repartidor_previo'):
+        return
+    anterior = instance.__dict__.pop('_repartidor_previo')
+    nuevo = sincronizacion.repartidor_de(instance)
+    if anterior != nuevo:
+        sincronizacion.registrar_reasignacion(instance, anterior, nuevo)
+
+
+for modelo in MODELOS_SINCRONIZADOS:
+    pre_delete.connect(sincronizacion_recordar_repartidor, sender=modelo)
+    post_delete.connect(sincronizacion_registrar_eliminacion, sender=modelo)
+
+for modelo in (Orden, Despacho):
+    pre_save.connect(sincronizacion_guardar_repartidor, sender=modelo)
+    post_save.connect(sincronizacion_aplicar_reasignacion, sender=modelo)
+
+
+# ========== GEOCODIFICACIÓN ==========
+
+def _datos_geocodificacion(instance):
+    return (
+        (instance.direccion, getattr(instance, 'ciudad', None)),
+        (instance.coordenadas_lat, instance.coordenadas_lng),
+    )
+
+
+def geocodificacion_recordar_direccion(sender, instance, **kwargs):
+    """Dirección y coordenadas cargadas desde la BD, para detectar cambios al guardar"""
+    campos = ('direccion', 'coordenadas_lat') + (('ciudad',) if sender is Farmacia else ())
+    if instance.pk is not None and all(campo in instance.__dict__ for campo in campos):
+        instance._geocodificacion_previa = _datos_geocodificacion(instance)
+
+
+def geocodificacion_aplicar_cache(sender, instance, raw=False, **kwargs):
+    """Dirección nueva: coordenadas desde la caché o pendiente; coordenadas manuales: se respetan"""
+    if raw:
+        return
+    previa = getattr(instance, '_geocodificacion_previa', None)
+    if not instance._state.adding and previa is None:
+        return
+    direccion, coordenadas = _datos_geocodificacion(instance)
+    direccion_previa, coordenadas_previas = previa or (None, (None, None))
+    if coordenadas != coordenadas_previas and None not in coordenadas:
+        instance.fecha_geocodificacion = timezone.now()
+    elif direccion != direccion_previa:
+        geocodificacion.desde_cache(instance)
+    instance._geocodificacion_previa = _datos_geocodificacion(instance)
+
+
+for modelo in (Orden, Farmacia):
+    post_init.connect(geocodificacion_recordar_direccion, sender=modelo)
+    pre_save.connect(geocodificacion_aplicar_cache, sender=modelo)
+
+
+# ========== GEOHASH PARA CONSULTAS DE PROXIMIDAD ==========
+
+def espacial_actualizar_geohash(sender, instance, raw=False, **kwargs):
+    """Después de geocodificacion_aplicar_cache, que puede cambiar las coordenadas"""
+    if not raw:
+        anterior = instance.__dict__.get('geohash')
+        espacial.asignar_geohash(instance)
+        instance._coordenadas_cambiadas = instance.geohash != anterior
+
+
+for modelo in (Orden, Farmacia, Despacho):
+    pre_save.connect(espacial_actualizar_geohash, sender=modelo)
+
+
+# ========== ÚLTIMA POSICIÓN DE LOS REPARTIDORES ==========
+
+@receiver(post_save, sender=Despacho)
+def posiciones_desde_despacho(sender, instance, raw=False, **kwargs):
+    """Un despacho con coordenadas nuevas es también una posición del repartidor"""
+    if raw or not instance.repartidor_id or not instance.geohash:
+        return
+    if getattr(instance, '_coordenadas_cambiadas', False):
+        posiciones.actualizar_ultima(
+            instance.repartidor_id, instance.coordenadas_lat, instance.coordenadas_lng, timezone.now()
+        )
@@ -0,0 +1,282 @@
+"""
+Sincronización por cambios para los dispositivos de los repartidores.
+
+GET /api/sync/?cursor=... devuelve las órdenes, despachos, medicamentos y
+movimientos creados o modificados desde el cursor, y los ids eliminados.
+Cada modelo se lee con una sola consulta por rango sobre
+(fecha_actualizacion, id), respaldada por un índice compuesto; a los
+repartidores se les aplica además su alcance (órdenes de las que son
+responsables y sus medicamentos y movimientos, despachos que hicieron).
+
+Órdenes y despachos tienen índices (repartidor, fecha_actualizacion, id).
+Medicamentos y movimientos no guardan el repartidor: el alcance se aplica
+con el join a orden__responsable sobre el rango del índice
+(fecha_actualizacion, id), que recorre los cambios de todos los
+repartidores desde el cursor. Son pocos por sincronización porque solo
+cambian con su orden; si crecieran, habría que desnormalizar el
+responsable en ellos (y mantenerlo al reasignar la orden) con su índice.
+
+Las eliminaciones quedan en RegistroEliminado (lápidas), que las señales
+crean al borrar una fila y también cuando una orden o un despacho pasa a
+otro repartidor: para el anterior la fila "desaparece". La lápida de una
+orden implica la de sus medicamentos y movimientos, que el dispositivo
+descarta junto con ella. Las lápidas se conservan
+settings.SINCRONIZACION_RETENCION_DIAS días (purgar_eliminados); un cursor
+más antiguo obliga a sincronizar desde cero (reiniciar).
+
+El dispositivo aplica primero los eliminados y después inserta o reemplaza
+las filas recibidas (las filas pueden repetirse entre respuestas), guarda
+el cursor nuevo y repite mientras hay_mas sea verdadero.
+
+El cursor no avanza más allá de ahora - MARGEN: una transacción lenta puede
+confirmar filas con fecha_actualizacion anterior a la de otras ya leídas, y
+así se vuelven a consultar en la siguiente sincronización.
+"""
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Despacho, Medicamento, Orden, OrdenMovimiento, RegistroEliminado
+from .serializers import (
+    DespachoSerializer, MedicamentoSerializer, OrdenMovimientoSerializer, OrdenSerializer
+)
+
+LIMITE_POR_DEFECTO = 200
+LIMITE_MAXIMO = 1000
+MARGEN = timedelta(seconds=60)
+VERSION_CURSOR = 1
+INICIO = (datetime(1970, 1, 1, tzinfo=dt_timezone.utc), 0)
+
+# Solo columnas propias: los nombres relacionados se resuelven en el dispositivo
+TIPOS = {
+    'ordenes': {
+        'modelo': Orden,
+        'lapida': 'orden',
+        'serializer': OrdenSerializer,
+        'campo_repartidor': 'responsable',
+        'campos': [
+            'id', 'cliente', 'direccion', 'coordenadas_lat', 'coordenadas_lng', 'telefono_cliente', 'descripcion',
+            'prioridad', 'tipo', 'estado_actual', 'farmacia_origen', 'farmacia_destino',
+            'responsable', 'fecha_creacion', 'fecha_actualizacion', 'ultimo_despacho', 'total_despachos',
+        ],
+    },
+    'despachos': {
+        'modelo': Despacho,
+        'lapida': 'despacho',
+        'serializer': DespachoSerializer,
+        'campo_repartidor': 'repartidor',
+        'campos': [
+            'id', 'orden', 'numero_despacho', 'repartidor', 'estado', 'resultado',
+            'foto_entrega', 'foto_miniatura', 'observaciones', 'coordenadas_lat', 'coordenadas_lng', 'fecha',
+        ],
+    },
+    'medicamentos': {
+        'modelo': Medicamento,
+        'lapida': 'medicamento',
+        'serializer': MedicamentoSerializer,
+        'campo_repartidor': 'orden__responsable',
+        'campos': ['id', 'orden', 'codigo', 'nombre', 'cantidad', 'observaciones'],
+    },
+    'movimientos': {
+        'modelo': OrdenMovimiento,
+        'lapida': 'movimiento',
+        'serializer': OrdenMovimientoSerializer,
+        'campo_repartidor': 'orden__responsable',
+        'campos': ['id', 'orden', 'estado', 'descripcion', 'repartidor', 'despacho', 'timestamp'],
+    },
+}
+TIPO_POR_LAPIDA = {tipo['lapida']: nombre for nombre, tipo in TIPOS.items()}
+
+
+class SincronizacionInvalida(Exception):
+    pass
+
+
+def retencion():
+    return timedelta(days=getattr(settings, 'SINCRONIZACION_RETENCION_DIAS', 30))
+
+
+def es_repartidor(profile):
+    return profile.rol == 'repartidor'
+
+
+# ---------------------------------------------------------------------------
+# Cursor
+# ---------------------------------------------------------------------------
+
+def codificar_cursor(profile, posiciones):
+    datos = {
+        'v': VERSION_CURSOR,
+        'u': profile.pk,
+        'r': profile.rol,
+        'p': {clave: [fecha.isoformat(), pk] for clave, (fecha, pk) in posiciones.items()},
+    }
+    return base64.urlsafe_b64encode(json.dumps(datos, separators=(',', ':')).encode()).decode()
+
+
+def decodificar_cursor(cursor, profile):
+    """Posiciones {tipo o 'eliminados': (fecha, id)}, o None si el cursor es de otro alcance"""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if datos['v'] != VERSION_CURSOR:
+            raise ValueError
+        posiciones = {clave: (parse_datetime(fecha), int(pk)) for clave, (fecha, pk) in datos['p'].items()}
+    except (ValueError, TypeError, KeyError, UnicodeError, AttributeError):
+        raise SincronizacionInvalida('Cursor inválido')
+    if set(posiciones) != set(TIPOS) | {'eliminados'} or any(fecha is None for fecha, _ in posiciones.values()):
+        raise SincronizacionInvalida('Cursor inválido')
+    if datos['u'] != profile.pk or datos['r'] != profile.rol:
+        return None
+    return posiciones
+
+
+def _desde(posicion, campo):
+    fecha, pk = posicion
+    return Q(**{f'{campo}__gt': fecha}) | Q(**{campo: fecha, 'id__gt': pk})
+
+
+def _siguiente(filas, limite, tope, campo):
+    """Posición desde la que seguir: la última fila si quedan más, si no ahora - MARGEN.
+    
+    Al quedar al día se vuelve a tope aunque ya se hayan entregado filas
+    posteriores: se reenvían en la siguiente sincronización.
+    """
+    if len(filas) > limite:
+        ultima = filas[limite - 1]
+        return (_valor(ultima, campo), _valor(ultima, 'id')), True
+    return (tope, 0), False
+
+
+def _valor(fila, campo):
+    return fila[campo] if isinstance(fila, dict) else getattr(fila, campo)
+
+
+# ---------------------------------------------------------------------------
+# Consulta
+# ---------------------------------------------------------------------------
+
+def cambios(profile, cursor=None, limite=LIMITE_POR_DEFECTO, request=None):
+    """Cambios visibles para profile desde cursor (None: sincronización completa)"""
+    ahora = timezone.now()
+    tope = ahora - MARGEN
+    reiniciar = False
+
+    posiciones = decodificar_cursor(cursor, profile) if cursor else None
+    if posiciones is not None and posiciones['eliminados'][0] < ahora - retencion():
+        # Pueden haberse purgado lápidas posteriores al cursor
+        posiciones = None
+    if cursor and posiciones is None:
+        reiniciar = True
+    if posiciones is None:
+        # Un dispositivo vacío no necesita lápidas anteriores a su primera lectura
+        posiciones = {nombre: INICIO for nombre in TIPOS}
+        posiciones['eliminados'] = (tope, 0)
+
+    respuesta = {'reiniciar': reiniciar}
+    nuevas = {}
+    hay_mas = False
+    for nombre, tipo in TIPOS.items():
+        serializer_class = tipo['serializer']
+        queryset = tipo['modelo'].objects.filter(_desde(posiciones[nombre], 'fecha_actualizacion'))
+        if es_repartidor(profile):
+            queryset = queryset.filter(**{tipo['campo_repartidor']: profile})
+        queryset = serializer_class.preparar_queryset(
+            queryset, tipo['campos'], columnas_extra=('fecha_actualizacion',)
+        ).order_by('fecha_actualizacion', 'id')
+        filas = list(queryset[:limite + 1])
+        nuevas[nombre], mas = _siguiente(filas, limite, tope, 'fecha_actualizacion')
+        hay_mas = hay_mas or mas
+        respuesta[nombre] = serializer_class(
+            filas[:limite], many=True, context={'request': request, 'campos': tipo['campos']}
+        ).data
+
+    lapidas = RegistroEliminado.objects.filter(_desde(posiciones['eliminados'], 'fecha'))
+    if es_repartidor(profile):
+        lapidas = lapidas.filter(repartidor=profile)
+    else:
+        # Las reasignaciones solo cambian el alcance de los repartidores
+        lapidas = lapidas.filter(reasignado=False)
+    lapidas = list(lapidas.order_by('fecha', 'id').values('modelo', 'objeto_id', 'fecha', 'id')[:limite + 1])
+    nuevas['eliminados'], mas = _siguiente(lapidas, limite, tope, 'fecha')
+    hay_mas = hay_mas or mas
+    eliminados = {nombre: [] for nombre in TIPOS}
+    for lapida in lapidas[:limite]:
+        eliminados[TIPO_POR_LAPIDA[lapida['modelo']]].append(lapida['objeto_id'])
+    respuesta['eliminados'] = eliminados
+
+    respuesta['cursor'] = codificar_cursor(profile, nuevas)
+    respuesta['hay_mas'] = hay_mas
+    return respuesta
+
+
+# ---------------------------------------------------------------------------
+# Lápidas (desde las señales)
+# ---------------------------------------------------------------------------
+
+def repartidor_de(instance):
+    """Repartidor en cuyo alcance está la fila (None si en el de ninguno).
+    
+    Se llama antes de eliminar: la orden de un medicamento o movimiento
+    todavía existe aunque se esté borrando en cascada.
+    """
+    if isinstance(instance, Orden):
+        return instance.responsable_id
+    if isinstance(instance, Despacho):
+        return instance.repartidor_id
+    return Orden.objects.filter(pk=instance.orden_id).values_list('responsable_id', flat=True).first()
+
+
+def registrar_eliminacion(instance, repartidor_id):
+    RegistroEliminado.objects.create(
+        modelo=TIPOS[_tipo_de(instance)]['lapida'],
+        objeto_id=instance.pk,
+        repartidor_id=repartidor_id,
+    )
+
+
+def registrar_reasignacion(instance, anterior, nuevo):
+    """La fila sale del alcance de anterior y entra (de nuevo) en el de nuevo"""
+    lapida = TIPOS[_tipo_de(instance)]['lapida']
+    if anterior is not None:
+        RegistroEliminado.objects.create(
+            modelo=lapida, objeto_id=instance.pk, repartidor_id=anterior, reasignado=True
+        )
+    if nuevo is not None:
+        # Una lápida previa haría que el dispositivo borrara la fila que vuelve
+        RegistroEliminado.objects.filter(modelo=lapida, objeto_id=instance.pk, repartidor_id=nuevo).delete()
+    if isinstance(instance, Orden):
+        # Sus medicamentos y movimientos también entran en el alcance del nuevo responsable
+        ahora = timezone.now()
+        Medicamento.objects.filter(orden_id=instance.pk).update(fecha_actualizacion=ahora)
+        OrdenMovimiento.objects.filter(orden_id=instance.pk).update(fecha_actualizacion=ahora)
+
+
+def registrar_asignaciones(asignaciones):
+    """registrar_reasignacion para órdenes sin responsable asignadas en lote ({orden_id: repartidor_id})"""
+    por_repartidor = {}
+    for orden_id, repartidor_id in asignaciones.items():
+        por_repartidor.setdefault(repartidor_id, []).append(orden_id)
+    for repartidor_id, ordenes in por_repartidor.items():
+        RegistroEliminado.objects.filter(modelo='orden', objeto_id__in=ordenes, repartidor_id=repartidor_id).delete()
+    ahora = timezone.now()
+    Medicamento.objects.filter(orden_id__in=asignaciones).update(fecha_actualizacion=ahora)
+    OrdenMovimiento.objects.filter(orden_id__in=asignaciones).update(fecha_actualizacion=ahora)
+
+
+def _tipo_de(instance):
+    for nombre, tipo in TIPOS.items():
+        if isinstance(instance, tipo['modelo']):
+            return nombre
+    raise ValueError(f'{type(instance).__name__} no se sincroniza')
+
+
+def purgar(antes_de=None):
+    """Elimina las lápidas anteriores a antes_de (por defecto, fuera de la retención)"""
+    antes_de = antes_de or timezone.now() - retencion()
+    eliminadas, _ = RegistroEliminado.objects.filter(fecha__lt=antes_de).delete()
+    return eliminadas
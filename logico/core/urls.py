@@ -34,6 +34,7 @@ urlpatterns = [
     # Reportes
     path('reportes/', views.reporte_list, name='reporte_list'),
     path('reportes/<int:pk>/export-csv/', views.reporte_export_csv, name='reporte_export_csv'),
+    path('reportes/exportar/', views.exportar_datos, name='exportar_datos'),
     
     # Usuarios
     path('usuarios/', views.usuario_list, name='usuario_list'),
@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.db.models import Q, Count, Avg
+from django.db.models import Q, Avg
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
 from datetime import timedelta
@@ -12,6 +12,8 @@ from .models import (
     Despacho, OrdenMovimiento, Ruta, Reporte, Farmacia
 )
 from .forms import OrdenForm, DespachoForm, MotoForm, RutaForm, UsuarioForm, UsuarioProfileForm
+from . import busqueda, espacial, estadisticas, exportacion, posiciones
+from .paginacion import paginar_keyset
 from django.contrib.auth.models import User
 import csv
 
@@ -19,102 +21,60 @@ import csv
 @login_required
 def dashboard(request):
     """Dashboard principal con estadísticas"""
-    # Asegurar que el usuario tenga un perfil
-    user_profile, created = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
-    # Filtros según rol
-    if user_profile.rol == 'repartidor':
-        ordenes = Orden.objects.filter(responsable=user_profile)
-        despachos = Despacho.objects.filter(repartidor=user_profile)
-    else:
-        ordenes = Orden.objects.all()
-        despachos = Despacho.objects.all()
+    # Contadores precalculados (fila del repartidor o fila global)
+    stats, stats_global = estadisticas.obtener_estadisticas(user_profile)
     
-    # Estadísticas generales
-    total_ordenes = ordenes.count()
-    ordenes_por_estado = ordenes.values('estado_actual').annotate(count=Count('id'))
-    
-    # Despachos
-    total_despachos = despachos.count()
-    entregas_exitosas = despachos.filter(resultado='entregado').count()
-    entregas_fallidas = despachos.filter(resultado__in=['no_disponible', 'error']).count()
-    tasa_exito = (entregas_exitosas / total_despachos * 100) if total_despachos > 0 else 0
-    
-    # Repartidores activos
-    repartidores_activos = UsuarioProfile.objects.filter(
-        rol='repartidor', 
-        activo=True,
-        estado_turno='disponible'
-    ).count()
-    
-    # Motos activas
-    motos_activas = Moto.objects.filter(activa=True, estado='disponible').count()
-    
-    # Gráfico de entregas por día (últimos 7 días)
-    fecha_inicio = timezone.now().date() - timedelta(days=7)
-    entregas_por_dia = Despacho.objects.filter(
-        fecha__date__gte=fecha_inicio
-    ).extra(
-        select={'day': 'date(fecha)'}
-    ).values('day').annotate(
-        total=Count('id'),
-        exitosas=Count('id', filter=Q(resultado='entregado'))
-    ).order_by('day')
-    
-    # Convertir a lista de diccionarios para JSON
-    entregas_por_dia_list = []
-    for item in entregas_por_dia:
-        entregas_por_dia_list.append({
-            'day': str(item['day']),
-            'total': item['total'],
-            'exitosas': item['exitosas']
-        })
+    ordenes_por_estado = []
+    for estado, estado_display in Orden.ESTADO_CHOICES:
+        count = getattr(stats, estadisticas.campo_estado_orden(estado))
+        if count:
+            ordenes_por_estado.append({'estado_actual': estado, 'estado': estado_display, 'count': count})
     
     # Resultados de despacho
-    resultados_despacho = despachos.values('resultado').annotate(count=Count('id'))
     resultados_despacho_list = []
-    for item in resultados_despacho:
-        resultados_despacho_list.append({
-            'resultado': item['resultado'] or 'Sin resultado',
-            'count': item['count']
-        })
+    for resultado in [r for r, _ in Despacho.RESULTADO_CHOICES] + [None]:
+        count = getattr(stats, estadisticas.campo_resultado_despacho(resultado))
+        if count:
+            resultados_despacho_list.append({
+                'resultado': resultado or 'Sin resultado',
+                'count': count
+            })
     
     context = {
-        'total_ordenes': total_ordenes,
-        'ordenes_por_estado': list(ordenes_por_estado),
-        'total_despachos': total_despachos,
-        'entregas_exitosas': entregas_exitosas,
-        'entregas_fallidas': entregas_fallidas,
-        'tasa_exito': round(tasa_exito, 2),
-        'repartidores_activos': repartidores_activos,
-        'motos_activas': motos_activas,
-        'entregas_por_dia': json.dumps(entregas_por_dia_list),
+        'total_ordenes': stats.total_ordenes,
+        'ordenes_por_estado': ordenes_por_estado,
+        'total_despachos': stats.total_despachos,
+        'entregas_exitosas': stats.despachos_entregado,
+        'entregas_fallidas': stats.entregas_fallidas,
+        'tasa_exito': round(stats.tasa_exito, 2),
+        'repartidores_activos': stats_global.repartidores_activos,
+        'motos_activas': stats_global.motos_activas,
+        # Gráfico de entregas por día (últimos 7 días)
+        'entregas_por_dia': json.dumps(estadisticas.entregas_por_dia(dias=7)),
         'resultados_despacho': json.dumps(resultados_despacho_list),
     }
     
+    # Última posición de los repartidores en turno (de la caché, ver core.posiciones)
+    if user_profile.rol != 'repartidor':
+        context['repartidores_en_turno'] = [
+            {
+                'repartidor': repartidor,
+                'lat': ultima[0] if ultima else None,
+                'lng': ultima[1] if ultima else None,
+                'fecha': ultima[2] if ultima else None,
+            }
+            for repartidor, ultima in posiciones.en_turno()
+        ]
+    
     return render(request, 'core/dashboard.html', context)
 
 
 @login_required
 def orden_list(request):
     """Lista de órdenes"""
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     ordenes = Orden.objects.all()
     
@@ -131,14 +91,12 @@ def orden_list(request):
         ordenes = ordenes.filter(estado_actual=estado)
     if prioridad:
         ordenes = ordenes.filter(prioridad=prioridad)
-    if search:
-        ordenes = ordenes.filter(
-            Q(cliente__icontains=search) |
-            Q(direccion__icontains=search) |
-            Q(telefono_cliente__icontains=search)
-        )
-    
-    ordenes = ordenes.order_by('-fecha_creacion')
+    ordenes = ordenes.select_related('responsable__user')
+    if search and search.strip():
+        # Resultados ordenados por relevancia
+        ordenes = paginar_keyset(request, busqueda.buscar_ordenes(ordenes, search), busqueda.CAMPO_RANGO)
+    else:
+        ordenes = paginar_keyset(request, ordenes, 'fecha_creacion')
     
     context = {
         'ordenes': ordenes,
@@ -162,18 +120,16 @@ def orden_detail(request, pk):
         activo=True
     ).exclude(user__is_superuser=True)
     
-    # Obtener farmacias activas
-    farmacias = Farmacia.objects.filter(activa=True)
+    # Obtener farmacias activas, las más cercanas a la orden primero (ver core.espacial)
+    farmacias = list(Farmacia.objects.filter(activa=True))
+    if orden.coordenadas_lat is not None and orden.coordenadas_lng is not None:
+        distancias = espacial.distancias_farmacias(orden.coordenadas_lat, orden.coordenadas_lng)
+        for farmacia in farmacias:
+            distancia = distancias.get(farmacia.pk)
+            farmacia.distancia_km = None if distancia is None else round(distancia, 1)
+        farmacias.sort(key=lambda farmacia: (farmacia.distancia_km is None, farmacia.distancia_km or 0))
     
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     context = {
         'orden': orden,
@@ -190,15 +146,7 @@ def orden_detail(request, pk):
 @login_required
 def orden_create(request):
     """Crear nueva orden"""
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     if request.method == 'POST':
         form = OrdenForm(request.POST, user=request.user)
@@ -225,15 +173,7 @@ def orden_create(request):
 def orden_edit(request, pk):
     """Editar orden - Solo coordinador o admin"""
     orden = get_object_or_404(Orden, pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Solo coordinador o admin pueden editar órdenes
     if user_profile.rol == 'repartidor':
@@ -254,7 +194,7 @@ def orden_edit(request, pk):
                     orden=orden,
                     estado=orden.estado_actual,
                     descripcion=f'Estado cambiado de {orden_anterior.get_estado_actual_display()} a {orden.get_estado_actual_display()}',
-                    repartidor=UsuarioProfile.objects.filter(user=request.user).first(),
+                    repartidor=user_profile,
                 )
             
             messages.success(request, 'Orden actualizada exitosamente.')
@@ -291,6 +231,20 @@ def cambiar_estado_orden(request, pk):
                 if farmacia_destino_id:
                     orden.farmacia_destino = get_object_or_404(Farmacia, pk=farmacia_destino_id, activa=True)
                 
+                # Sin destino: la farmacia activa más cercana a la orden; sin origen: la más cercana al destino
+                if not orden.farmacia_destino and orden.coordenadas_lat is not None and orden.coordenadas_lng is not None:
+                    excluir = [orden.farmacia_origen_id] if orden.farmacia_origen_id else []
+                    cercanas = espacial.farmacias_cercanas(orden.coordenadas_lat, orden.coordenadas_lng, 1, excluir)
+                    if cercanas:
+                        orden.farmacia_destino = cercanas[0]
+                        messages.info(request, f'Farmacia destino más cercana a la orden: {cercanas[0].nombre} ({cercanas[0].distancia_km} km).')
+                destino = orden.farmacia_destino
+                if not orden.farmacia_origen and destino and destino.coordenadas_lat is not None and destino.coordenadas_lng is not None:
+                    cercanas = espacial.farmacias_cercanas(destino.coordenadas_lat, destino.coordenadas_lng, 1, [destino.pk])
+                    if cercanas:
+                        orden.farmacia_origen = cercanas[0]
+                        messages.info(request, f'Farmacia origen más cercana al destino: {cercanas[0].nombre} ({cercanas[0].distancia_km} km).')
+                
                 # Validar que sean diferentes
                 if orden.farmacia_origen and orden.farmacia_destino:
                     if orden.farmacia_origen == orden.farmacia_destino:
@@ -309,7 +263,7 @@ def cambiar_estado_orden(request, pk):
                 orden=orden,
                 estado=nuevo_estado,
                 descripcion=descripcion or f'Estado cambiado a {orden.get_estado_actual_display()}',
-                repartidor=request.user.profile if hasattr(request.user, 'profile') else None,
+                repartidor=request.profile,
             )
             
             messages.success(request, f'Estado cambiado a {orden.get_estado_actual_display()}.')
@@ -323,15 +277,7 @@ def cambiar_estado_orden(request, pk):
 def asignar_repartidor(request, pk):
     """Asignar repartidor a orden - Solo coordinador o admin"""
     orden = get_object_or_404(Orden, pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Solo coordinador o admin pueden asignar repartidores
     if user_profile.rol == 'repartidor':
@@ -341,7 +287,7 @@ def asignar_repartidor(request, pk):
     if request.method == 'POST':
         repartidor_id = request.POST.get('repartidor')
         repartidor = get_object_or_404(
-            UsuarioProfile, 
+            UsuarioProfile.objects.select_related('user', 'moto'),
             pk=repartidor_id, 
             rol='repartidor'
         )
@@ -375,37 +321,17 @@ def asignar_repartidor(request, pk):
 @login_required
 def despacho_list(request):
     """Lista de despachos - Solo muestra el último intento por orden"""
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
-    
-    # Obtener todos los despachos base (sin filtros de estado/resultado para obtener el último de cada orden)
-    despachos_todos = Despacho.objects.select_related('orden', 'repartidor__user').all()
+    user_profile = request.profile
     
-    if user_profile.rol == 'repartidor':
-        despachos_todos = despachos_todos.filter(repartidor=user_profile)
-    
-    # Obtener el último despacho de cada orden (el que tiene el numero_despacho más alto)
-    from django.db.models import Max, Count
-    
-    # Primero, obtener los IDs de las órdenes que tienen despachos
-    ordenes_con_despachos = despachos_todos.values_list('orden_id', flat=True).distinct()
+    # Despachos base (sin filtros de estado/resultado para obtener el último de cada orden)
+    despachos = Despacho.objects.select_related('orden', 'repartidor__user').all()
     
-    # Para cada orden, obtener el último despacho (mayor numero_despacho)
-    ultimos_despachos_ids = []
-    for orden_id in ordenes_con_despachos:
-        ultimo_despacho = despachos_todos.filter(orden_id=orden_id).order_by('-numero_despacho').first()
-        if ultimo_despacho:
-            ultimos_despachos_ids.append(ultimo_despacho.id)
-    
-    # Filtrar solo los últimos despachos
-    despachos = despachos_todos.filter(id__in=ultimos_despachos_ids)
+    # Último despacho de cada orden (mayor numero_despacho) en una sola consulta;
+    # para un repartidor, el último de los suyos aunque otro haya reintentado la orden
+    if user_profile.rol == 'repartidor':
+        despachos = despachos.filter(repartidor=user_profile).ultimos_por_orden_filtrados()
+    else:
+        despachos = despachos.ultimos_por_orden()
     
     # Aplicar filtros de estado y resultado después de obtener los últimos despachos
     estado = request.GET.get('estado')
@@ -417,11 +343,9 @@ def despacho_list(request):
         despachos = despachos.filter(resultado=resultado)
     
     # Anotar con el total de intentos por orden (contando todos los despachos de la orden)
-    despachos = despachos.annotate(
-        total_intentos=Count('orden__despachos')
-    )
+    despachos = despachos.con_total_intentos()
     
-    despachos = despachos.order_by('-fecha')
+    despachos = paginar_keyset(request, despachos, 'fecha')
     
     context = {
         'despachos': despachos,
@@ -455,14 +379,9 @@ def despacho_create(request, orden_id):
             despacho = form.save(commit=False)
             despacho.orden = orden
             
-            # Calcular número de despacho
-            ultimo_despacho = Despacho.objects.filter(orden=orden).order_by('-numero_despacho').first()
-            if ultimo_despacho:
-                despacho.numero_despacho = ultimo_despacho.numero_despacho + 1
-                despacho.estado = 're_despacho'
-            else:
-                despacho.numero_despacho = 1
-                despacho.estado = 'despacho'
+            # El número de despacho lo asigna Despacho.save bloqueando la orden
+            despacho.numero_despacho = None
+            despacho.estado = 're_despacho' if orden.total_despachos else 'despacho'
             
             despacho.save()
             
@@ -513,15 +432,7 @@ def moto_list(request):
 def moto_detail(request, pk):
     """Detalle de moto"""
     moto = get_object_or_404(Moto, pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     # Excluir admin de la lista de repartidores
     repartidores = UsuarioProfile.objects.filter(
         rol='repartidor', 
@@ -556,15 +467,7 @@ def moto_create(request):
 def moto_edit(request, pk):
     """Editar moto - Solo coordinador o admin"""
     moto = get_object_or_404(Moto, pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Solo coordinador o admin pueden editar motos
     if user_profile.rol == 'repartidor':
@@ -587,15 +490,7 @@ def moto_edit(request, pk):
 def asignar_moto_repartidor(request, moto_id):
     """Asignar moto a repartidor - Solo coordinador o admin"""
     moto = get_object_or_404(Moto, pk=moto_id)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Solo coordinador o admin pueden asignar motos
     if user_profile.rol == 'repartidor':
@@ -682,20 +577,23 @@ def reporte_export_csv(request, pk):
     return response
 
 
+@login_required
+def exportar_datos(request):
+    """Exportar despachos, órdenes, movimientos o reportes de un rango de fechas"""
+    tipo = request.GET.get('tipo', 'despachos')
+    try:
+        return exportacion.respuesta_exportacion(tipo, request.profile, request.GET)
+    except exportacion.ExportacionInvalida as error:
+        messages.error(request, str(error))
+        return redirect('reporte_list')
+
+
 # ========== VISTAS DE USUARIOS ==========
 
 @login_required
 def usuario_list(request):
     """Lista de usuarios - Permisos según rol"""
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Filtros según rol
     if user_profile.rol == 'repartidor':
@@ -731,15 +629,7 @@ def usuario_list(request):
 @login_required
 def usuario_create(request):
     """Crear nuevo usuario - Solo admin"""
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Solo admin puede crear usuarios
     if user_profile.rol != 'admin':
@@ -798,15 +688,7 @@ def usuario_create(request):
 def usuario_edit(request, pk):
     """Editar usuario - Admin puede editar todo, coordinador solo puede cambiar moto"""
     usuario = get_object_or_404(UsuarioProfile, pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Repartidor solo puede verse a sí mismo
     if user_profile.rol == 'repartidor' and usuario.pk != user_profile.pk:
@@ -874,15 +756,7 @@ def usuario_edit(request, pk):
 def usuario_detail(request, pk):
     """Detalle de usuario"""
     usuario = get_object_or_404(UsuarioProfile.objects.select_related('user', 'moto'), pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Repartidor solo puede verse a sí mismo
     if user_profile.rol == 'repartidor' and usuario.pk != user_profile.pk:
@@ -911,15 +785,7 @@ def usuario_detail(request, pk):
 def cambiar_estado_turno(request, pk):
     """Cambiar estado de turno - Solo repartidor puede cambiar su propio estado"""
     usuario = get_object_or_404(UsuarioProfile, pk=pk)
-    user_profile, _ = UsuarioProfile.objects.get_or_create(
-        user=request.user,
-        defaults={
-            'telefono': '',
-            'rol': 'repartidor',
-            'estado_turno': 'disponible',
-            'activo': True,
-        }
-    )
+    user_profile = request.profile
     
     # Solo repartidor puede cambiar su propio estado
     if user_profile.rol != 'repartidor' or usuario.pk != user_profile.pk:
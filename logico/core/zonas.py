@@ -0,0 +1,242 @@
+"""
+Agrupación de las órdenes pendientes en zonas y generación de sus rutas.
+
+Las órdenes abiertas con coordenadas (ver core.geocodificacion) que no están
+en una ruta manual activa se agrupan con k-means sobre un plano local en km
+(inicio k-means++ con semilla fija, de modo que los mismos datos dan las
+mismas zonas). Luego las zonas se balancean: ninguna supera
+ceil(órdenes / zonas) órdenes; primero se ubican las órdenes que más se
+alejarían si no fueran a su zona más cercana, y se recalculan los centros
+durante algunas rondas. Todo el cálculo es vectorizado con NumPy.
+
+Cada zona queda en una Ruta generada (Ruta.generada). Al regenerar, cada
+zona reutiliza la ruta generada activa de centro más cercano, que conserva
+nombre y repartidor; se crean las que faltan y las que sobran se desactivan.
+Las paradas se reemplazan con un bulk_create, ya secuenciadas con
+core.rutas.
+"""
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg, Q
+from django.utils import timezone
+
+from .models import Orden, Ruta, RutaOrden
+from .rutas import matriz_distancias, secuenciar_ordenes
+
+TAMANO_ZONA = 25
+MAXIMO_ITERACIONES = 50
+RONDAS_BALANCEO = 10
+PREFERENCIAS = 8
+KM_POR_GRADO = 111.32
+SEMILLA = 0
+
+
+def ordenes_pendientes():
+    """Órdenes abiertas que no están en una ruta manual activa"""
+    manuales = RutaOrden.objects.filter(ruta__activa=True, ruta__generada=False).values('orden')
+    return Orden.objects.abiertas().exclude(pk__in=manuales)
+
+
+# ---------------------------------------------------------------------------
+# k-means balanceado
+# ---------------------------------------------------------------------------
+
+def _proyectar(coordenadas):
+    """(lat, lng) -> km en un plano tangente al centro (suficiente a escala de ciudad)"""
+    lat0, lng0 = coordenadas.mean(axis=0)
+    return np.column_stack((
+        (coordenadas[:, 1] - lng0) * KM_POR_GRADO * math.cos(math.radians(lat0)),
+        (coordenadas[:, 0] - lat0) * KM_POR_GRADO,
+    ))
+
+
+def _distancias2(puntos, centros):
+    """Distancias al cuadrado de cada punto a cada centro (|p|² - 2p·c + |c|², sin el arreglo n×k×2)"""
+    distancias = (puntos ** 2).sum(axis=1)[:, None] - 2 * puntos @ centros.T + (centros ** 2).sum(axis=1)
+    return np.maximum(distancias, 0, out=distancias)
+
+
+def _iniciar(puntos, zonas, rng):
+    """Centros iniciales k-means++"""
+    centros = np.empty((zonas, 2))
+    centros[0] = puntos[rng.integers(len(puntos))]
+    cercania = ((puntos - centros[0]) ** 2).sum(axis=1)
+    for zona in range(1, zonas):
+        total = cercania.sum()
+        elegido = rng.choice(len(puntos), p=cercania / total) if total > 0 else rng.integers(len(puntos))
+        centros[zona] = puntos[elegido]
+        cercania = np.minimum(cercania, ((puntos - centros[zona]) ** 2).sum(axis=1))
+    return centros
+
+
+def _centros(puntos, etiquetas, anteriores):
+    """Promedio de cada zona (una zona vacía conserva su centro)"""
+    zonas = len(anteriores)
+    cantidad = np.bincount(etiquetas, minlength=zonas)
+    centros = anteriores.copy()
+    con_puntos = cantidad > 0
+    for eje in range(2):
+        sumas = np.bincount(etiquetas, weights=puntos[:, eje], minlength=zonas)
+        centros[con_puntos, eje] = sumas[con_puntos] / cantidad[con_puntos]
+    return centros
+
+
+def _balancear(puntos, centros, capacidad):
+    """Zona de cada punto con a lo sumo capacidad puntos por zona"""
+    distancias = _distancias2(puntos, centros)
+    zonas = len(centros)
+    cercanas = np.argsort(distancias, axis=1)[:, :PREFERENCIAS]
+    filas = np.arange(len(puntos))
+    mejor = distancias[filas, cercanas[:, 0]]
+    segunda = distancias[filas, cercanas[:, 1]] if zonas > 1 else mejor
+    # Primero los puntos que más pierden si no van a su zona más cercana
+    prioridad = np.argsort(mejor - segunda, kind='stable')
+
+    cupos = [capacidad] * zonas
+    etiquetas = [0] * len(puntos)
+    cercanas = cercanas.tolist()
+    for punto in prioridad.tolist():
+        for zona in cercanas[punto]:
+            if cupos[zona]:
+                break
+        else:
+            # Las zonas cercanas están completas: la más cercana con cupo
+            zona = int(np.argmin(np.where(np.array(cupos) > 0, distancias[punto], np.inf)))
+        etiquetas[punto] = zona
+        cupos[zona] -= 1
+    return np.array(etiquetas)
+
+
+def agrupar(coordenadas, zonas, semilla=SEMILLA):
+    """Zona (0..zonas-1) de cada (lat, lng), con zonas de tamaño parejo"""
+    coordenadas = np.asarray(coordenadas, dtype=float).reshape(-1, 2)
+    if not len(coordenadas):
+        return np.empty(0, dtype=int)
+    zonas = max(1, min(zonas, len(coordenadas)))
+    puntos = _proyectar(coordenadas)
+    centros = _iniciar(puntos, zonas, np.random.default_rng(semilla))
+
+    etiquetas = None
+    for _ in range(MAXIMO_ITERACIONES):
+        nuevas = _distancias2(puntos, centros).argmin(axis=1)
+        if etiquetas is not None and np.array_equal(nuevas, etiquetas):
+            break
+        etiquetas = nuevas
+        centros = _centros(puntos, etiquetas, centros)
+
+    # El balanceo puede oscilar entre asignaciones parecidas: se queda la de menor dispersión
+    capacidad = math.ceil(len(puntos) / zonas)
+    mejor, costo_mejor = None, np.inf
+    for _ in range(RONDAS_BALANCEO):
+        nuevas = _balancear(puntos, centros, capacidad)
+        if np.array_equal(nuevas, etiquetas):
+            break
+        etiquetas = nuevas
+        centros = _centros(puntos, etiquetas, centros)
+        costo = ((puntos - centros[etiquetas]) ** 2).sum()
+        if costo < costo_mejor:
+            mejor, costo_mejor = etiquetas, costo
+    return etiquetas if mejor is None else mejor
+
+
+# ---------------------------------------------------------------------------
+# Rutas
+# ---------------------------------------------------------------------------
+
+def _emparejar(centros, existentes):
+    """{zona: ruta} uniendo cada zona con la ruta existente de centro más cercano"""
+    if not existentes or not len(centros):
+        return {}
+    centros_rutas = np.array([
+        (float(ruta.centro_lat), float(ruta.centro_lng)) if ruta.centro_lat is not None else (np.nan, np.nan)
+        for ruta in existentes
+    ])
+    distancias = matriz_distancias(centros, np.nan_to_num(centros_rutas))
+    # Las rutas sin órdenes se reutilizan al final, en cualquier zona
+    distancias[:, np.isnan(centros_rutas[:, 0])] = np.inf
+    pares = np.dstack(np.unravel_index(np.argsort(distancias, axis=None), distancias.shape))[0]
+    emparejadas = {}
+    usadas = set()
+    for zona, columna in pares.tolist():
+        if zona not in emparejadas and columna not in usadas:
+            emparejadas[zona] = existentes[columna]
+            usadas.add(columna)
+    return emparejadas
+
+
+def generar(tamano=TAMANO_ZONA, zonas=None, optimizar=True):
+    """Agrupa las órdenes pendientes y crea o actualiza una ruta por zona; devuelve un resumen"""
+    pendientes = ordenes_pendientes()
+    with transaction.atomic():
+        ordenes = list(pendientes.filter(
+            coordenadas_lat__isnull=False, coordenadas_lng__isnull=False
+        ).order_by('id').only('id', 'prioridad', 'coordenadas_lat', 'coordenadas_lng'))
+        sin_coordenadas = pendientes.filter(Q(coordenadas_lat__isnull=True) | Q(coordenadas_lng__isnull=True)).count()
+
+        coordenadas = np.array([
+            (float(orden.coordenadas_lat), float(orden.coordenadas_lng)) for orden in ordenes
+        ]).reshape(-1, 2)
+        cantidad_zonas = min(zonas or math.ceil(len(ordenes) / tamano), len(ordenes))
+        etiquetas = agrupar(coordenadas, cantidad_zonas)
+        grupos = [[] for _ in range(cantidad_zonas)]
+        for orden, zona in zip(ordenes, etiquetas.tolist()):
+            grupos[zona].append(orden)
+        centros = np.array([
+            coordenadas[etiquetas == zona].mean(axis=0) for zona in range(cantidad_zonas)
+        ]).reshape(-1, 2)
+
+        existentes = list(Ruta.objects.filter(generada=True, activa=True).annotate(
+            centro_lat=Avg('ordenes__coordenadas_lat'), centro_lng=Avg('ordenes__coordenadas_lng')
+        ).order_by('id'))
+        emparejadas = _emparejar(centros, existentes)
+
+        fecha = timezone.localtime().strftime('%d/%m/%Y %H:%M')
+        siguiente = Ruta.objects.filter(generada=True).count() + 1
+        rutas = []
+        nuevas = []
+        for zona, grupo in enumerate(grupos):
+            ruta = emparejadas.get(zona)
+            if ruta is None:
+                ruta = Ruta(nombre=f'Ruta Zona {siguiente}', zona=f'Zona {siguiente}', generada=True)
+                siguiente += 1
+                nuevas.append(ruta)
+            ruta.descripcion = f'{len(grupo)} órdenes, agrupadas automáticamente el {fecha}'
+            rutas.append(ruta)
+        Ruta.objects.bulk_create(nuevas)
+        reutilizadas = list(emparejadas.values())
+        Ruta.objects.bulk_update(reutilizadas, ['descripcion'])
+        sobrantes = [ruta.pk for ruta in existentes if ruta not in reutilizadas]
+        Ruta.objects.filter(pk__in=sobrantes).update(activa=False)
+
+        RutaOrden.objects.filter(ruta__in=reutilizadas).delete()
+        paradas = []
+        resumen_rutas = []
+        for ruta, grupo in zip(rutas, grupos):
+            distancia = None
+            if optimizar:
+                coordenadas_grupo = {
+                    orden.pk: (float(orden.coordenadas_lat), float(orden.coordenadas_lng)) for orden in grupo
+                }
+                grupo, distancia = secuenciar_ordenes(grupo, coordenadas_grupo)
+            paradas.extend(
+                RutaOrden(ruta=ruta, orden=orden, secuencia=numero if optimizar else None)
+                for numero, orden in enumerate(grupo, start=1)
+            )
+            resumen_rutas.append({
+                'id': ruta.pk,
+                'zona': ruta.zona,
+                'ordenes': len(grupo),
+                'distancia_km': None if distancia is None else round(distancia, 3),
+            })
+        RutaOrden.objects.bulk_create(paradas, batch_size=1000)
+
+    return {
+        'ordenes': len(ordenes),
+        'sin_coordenadas': sin_coordenadas,
+        'rutas_creadas': len(nuevas),
+        'rutas_actualizadas': len(reutilizadas),
+        'rutas_desactivadas': len(sobrantes),
+        'rutas': resumen_rutas,
+    }
@@ -3,6 +3,7 @@ Django settings for logico project.
 """
 
 from pathlib import Path
+import importlib.util
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -43,6 +45,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.UsuarioProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -144,8 +147,23 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # orjson si está instalado (ver core/renderers.py); si no, el json de la biblioteca estándar
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.JSONRapidoParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# MessagePack (Accept / Content-Type: application/msgpack) para la app móvil, si msgpack está instalado
+if importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'core.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].insert(1, 'core.renderers.MessagePackParser')
+
 # Swagger/Redoc settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -170,3 +188,29 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 
+
+# Reportes diarios: ingreso por entrega exitosa (ver core.reportes)
+TARIFA_ENTREGA = os.environ.get('TARIFA_ENTREGA', '0')
+
+# Sincronización de dispositivos: días que se conservan las lápidas (ver core.sincronizacion)
+SINCRONIZACION_RETENCION_DIAS = int(os.environ.get('SINCRONIZACION_RETENCION_DIAS', '30'))
+
+# Geocodificación de direcciones (ver core.geocodificacion). El proveedor por defecto lee
+# un CSV local (direccion,lat,lng[,ciudad]); en producción: core.geocodificacion.ProveedorNominatim
+GEOCODIFICACION_PROVEEDOR = os.environ.get('GEOCODIFICACION_PROVEEDOR', 'core.geocodificacion.ProveedorArchivo')
+GEOCODIFICACION_ARCHIVO = os.environ.get('GEOCODIFICACION_ARCHIVO', str(BASE_DIR / 'geocodificacion.csv'))
+GEOCODIFICACION_CIUDAD = os.environ.get('GEOCODIFICACION_CIUDAD', 'Santiago')
+GEOCODIFICACION_REINTENTO_DIAS = int(os.environ.get('GEOCODIFICACION_REINTENTO_DIAS', '7'))
+
+# Posiciones GPS de los repartidores: días que se conserva el historial (ver core.posiciones)
+POSICIONES_RETENCION_DIAS = int(os.environ.get('POSICIONES_RETENCION_DIAS', '30'))
+
+# Caché compartida entre procesos (perfil del request, posiciones, índices). Sin REDIS_URL
+# cada proceso usa su propia caché local y las invalidaciones no llegan a los demás
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
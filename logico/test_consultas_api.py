@@ -0,0 +1,146 @@
+"""
+Pruebas de Consultas por Página de la API para LogiCo
+Ejecutar: python test_consultas_api.py
+
+Verifica que cada listado de la API haga un número constante de consultas:
+agrega unas pocas órdenes con medicamentos, despachos, movimientos y rutas,
+cuenta las consultas de una página, agrega muchas más y vuelve a contar. Si
+la cuenta crece, algún serializer recorre una relación que no declara en
+select_related / prefetch_related. Los datos agregados se descartan al final.
+"""
+
+import os
+import sys
+import django
+
+# Configurar Django
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logico.settings')
+django.setup()
+
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.db import connection, transaction
+from core.models import UsuarioProfile, Orden, Medicamento, Despacho, OrdenMovimiento, Ruta, Farmacia
+
+ENDPOINTS = [
+    '/api/ordenes/',
+    '/api/ordenes/?search=cliente',
+    '/api/ordenes/?expand=medicamentos',
+    '/api/ordenes/?fields=id,cliente,responsable_nombre',
+    '/api/ordenes/pendientes_redespacho/',
+    '/api/despachos/',
+    '/api/despachos/ultimos/',
+    '/api/movimientos/',
+    '/api/rutas/',
+    '/api/rutas/?expand=ordenes',
+    '/api/motos/',
+    '/api/usuarios/',
+    '/api/medicamentos/',
+    '/api/farmacias/',
+    '/api/reportes/',
+]
+FILAS_INICIALES = 3
+FILAS_EXTRA = 30
+
+
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    BLUE = '\033[94m'
+    END = '\033[0m'
+
+
+class Descartar(Exception):
+    pass
+
+
+def contar_consultas(cliente, url):
+    with CaptureQueriesContext(connection) as contexto:
+        respuesta = cliente.get(url)
+    return respuesta.status_code, len(contexto.captured_queries)
+
+
+def agregar_datos(repartidor, desde, cantidad):
+    """Órdenes con medicamentos, despachos, movimientos y una ruta por cada diez"""
+    farmacias = list(Farmacia.objects.all()[:2])
+    ruta = None
+    for i in range(desde, desde + cantidad):
+        orden = Orden.objects.create(
+            cliente=f'Cliente Consultas {i}',
+            direccion=f'Calle Prueba {i}',
+            telefono_cliente=f'+5691234{i:04d}',
+            responsable=repartidor,
+            farmacia_origen=farmacias[0] if farmacias else None,
+        )
+        for j in range(3):
+            Medicamento.objects.create(orden=orden, codigo=f'CQ{i}-{j}', nombre=f'Medicamento {j}', cantidad=1)
+        despacho = Despacho.objects.create(orden=orden, repartidor=repartidor, resultado='no_disponible')
+        OrdenMovimiento.objects.create(
+            orden=orden, estado=orden.estado_actual, descripcion='Prueba de consultas',
+            repartidor=repartidor, despacho=despacho,
+        )
+        if ruta is None or i % 10 == 0:
+            ruta = Ruta.objects.create(nombre=f'Ruta Consultas {i}', zona='Centro', repartidor=repartidor)
+        ruta.ordenes.add(orden)
+
+
+def medir(usuarios):
+    """{(usuario, url): (status, consultas)} para todos los endpoints"""
+    resultado = {}
+    for profile in usuarios:
+        cliente = Client()
+        cliente.force_login(profile.user)
+        for url in ENDPOINTS:
+            resultado[(profile.user.username, url)] = contar_consultas(cliente, url)
+    return resultado
+
+
+def main():
+    print(f"\n{Colors.BLUE}{'='*70}")
+    print("PRUEBAS DE CONSULTAS POR PÁGINA - API LOGICO")
+    print(f"{'='*70}{Colors.END}\n")
+
+    setup_test_environment()
+    repartidor = UsuarioProfile.objects.filter(rol='repartidor').select_related('user').first()
+    usuarios = [
+        profile for profile in [
+            UsuarioProfile.objects.filter(rol__in=['admin', 'coordinador']).select_related('user').first(),
+            repartidor,
+        ] if profile
+    ]
+    if not repartidor or len(usuarios) < 2:
+        print(f"{Colors.RED}✗ Se necesita un repartidor y un coordinador o admin (python manage.py seed_data){Colors.END}")
+        sys.exit(1)
+
+    try:
+        with transaction.atomic():
+            agregar_datos(repartidor, 0, FILAS_INICIALES)
+            antes = medir(usuarios)
+            agregar_datos(repartidor, FILAS_INICIALES, FILAS_EXTRA)
+            despues = medir(usuarios)
+            raise Descartar
+    except Descartar:
+        pass
+
+    fallidos = 0
+    print(f"{'Usuario':<14} {'Endpoint':<40} {'Antes':>6} {'Después':>8}")
+    print("-" * 70)
+    for (usuario, url), (status_antes, consultas_antes) in antes.items():
+        status_despues, consultas_despues = despues[(usuario, url)]
+        ok = status_antes == status_despues == 200 and consultas_despues <= consultas_antes
+        fallidos += not ok
+        color = Colors.GREEN if ok else Colors.RED
+        print(f"{usuario:<14} {url:<40} {consultas_antes:>6} {color}{consultas_despues:>8}{Colors.END}"
+              + ('' if status_despues == 200 else f"  (HTTP {status_despues})"))
+
+    print()
+    if fallidos:
+        print(f"{Colors.RED}✗ {fallidos} listados con consultas por fila (N+1){Colors.END}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ Todos los listados hacen un número constante de consultas{Colors.END}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark de Renderers de la API para LogiCo
+Ejecutar: python test_renderers.py
+
+Serializa páginas de órdenes (representación completa, con medicamentos) y
+mide cada renderer y parser: tiempo por página, bytes por página y bytes por
+segundo. Compara el JSONRenderer de DRF (json de la biblioteca estándar) con
+JSONRapidoRenderer (orjson) y MessagePackRenderer, y verifica que el JSON
+rápido sea equivalente al de DRF.
+"""
+
+import io
+import json
+import os
+import sys
+import time
+import django
+
+# Configurar Django
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logico.settings')
+django.setup()
+
+from itertools import cycle, islice
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from core import renderers
+from core.models import Orden
+from core.serializers import OrdenSerializer
+
+TAMANOS_PAGINA = [20, 100, 500]
+DURACION_MINIMA = 0.5  # segundos por medición
+
+
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    BLUE = '\033[94m'
+    END = '\033[0m'
+
+
+def pagina_ordenes(tamano):
+    """Datos serializados de una página de órdenes (se repiten si hay pocas)"""
+    queryset = OrdenSerializer.preparar_queryset(Orden.objects.all())[:tamano]
+    filas = OrdenSerializer(queryset, many=True).data
+    return {'next': None, 'previous': None, 'results': list(islice(cycle(filas), tamano))}
+
+
+def medir(funcion):
+    """Segundos promedio por llamada, repitiendo hasta DURACION_MINIMA"""
+    repeticiones = 0
+    inicio = time.perf_counter()
+    while True:
+        funcion()
+        repeticiones += 1
+        transcurrido = time.perf_counter() - inicio
+        if transcurrido >= DURACION_MINIMA:
+            return transcurrido / repeticiones
+
+
+def candidatos():
+    lista = [
+        ('DRF JSONRenderer (json)', JSONRenderer(), JSONParser()),
+        ('JSONRapidoRenderer' + (' (orjson)' if renderers.orjson else ' (sin orjson)'),
+         renderers.JSONRapidoRenderer(), renderers.JSONRapidoParser()),
+    ]
+    if renderers.msgpack:
+        lista.append(('MessagePackRenderer', renderers.MessagePackRenderer(), renderers.MessagePackParser()))
+    return lista
+
+
+def main():
+    print(f"\n{Colors.BLUE}{'='*78}")
+    print("BENCHMARK DE RENDERERS - API LOGICO")
+    print(f"{'='*78}{Colors.END}\n")
+
+    if not Orden.objects.exists():
+        print(f"{Colors.RED}✗ No hay órdenes (python manage.py seed_data){Colors.END}")
+        sys.exit(1)
+    if not renderers.orjson:
+        print(f"{Colors.YELLOW}⚠ orjson no está instalado: JSONRapidoRenderer usa json{Colors.END}")
+    if not renderers.msgpack:
+        print(f"{Colors.YELLOW}⚠ msgpack no está instalado: se omite MessagePack{Colors.END}")
+
+    for tamano in TAMANOS_PAGINA:
+        datos = pagina_ordenes(tamano)
+        referencia = json.loads(JSONRenderer().render(datos))
+
+        print(f"{Colors.YELLOW}Página de {tamano} órdenes{Colors.END}")
+        print(f"  {'Renderer':<32} {'Bytes':>9} {'Render ms':>10} {'MB/s':>8} {'Parse ms':>9} {'MB/s':>8}")
+        for nombre, renderer, parser in candidatos():
+            contenido = renderer.render(datos, renderer.media_type, {})
+            if isinstance(renderer, JSONRenderer) and json.loads(contenido) != referencia:
+                print(f"  {Colors.RED}✗ {nombre}: la salida no coincide con la de DRF{Colors.END}")
+                continue
+            segundos_render = medir(lambda: renderer.render(datos, renderer.media_type, {}))
+            segundos_parse = medir(lambda: parser.parse(io.BytesIO(contenido), parser.media_type, {}))
+            megas = len(contenido) / 1_000_000
+            print(
+                f"  {nombre:<32} {len(contenido):>9} {segundos_render * 1000:>10.2f} "
+                f"{Colors.GREEN}{megas / segundos_render:>8.1f}{Colors.END} "
+                f"{segundos_parse * 1000:>9.2f} {megas / segundos_parse:>8.1f}"
+            )
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -106,6 +106,12 @@ def test_consulta_despachos_agrupados():
     )[:20]
     return list(despachos)
 
+@medir_tiempo
+def test_consulta_despachos_puntero():
+    """Test: Último intento por orden usando el puntero Orden.ultimo_despacho"""
+    despachos = Despacho.objects.ultimos_por_orden().con_total_intentos()[:20]
+    return list(despachos)
+
 @medir_tiempo
 def test_dashboard_stats():
     """Test: Calcular estadísticas del dashboard"""
@@ -123,6 +129,21 @@ def test_dashboard_stats():
         'entregas_exitosas': entregas_exitosas
     }
 
+@medir_tiempo
+def test_dashboard_stats_precalculadas():
+    """Test: Leer estadísticas precalculadas del dashboard"""
+    from core.estadisticas import obtener_estadisticas
+    
+    user_profile = UsuarioProfile.objects.filter(rol='coordinador').first()
+    if not user_profile:
+        return None
+    stats, stats_global = obtener_estadisticas(user_profile)
+    return {
+        'total_ordenes': stats.total_ordenes,
+        'total_despachos': stats.total_despachos,
+        'entregas_exitosas': stats.despachos_entregado,
+    }
+
 def ejecutar_multiple_veces(func, veces=10):
     """Ejecutar una función múltiples veces y calcular estadísticas"""
     tiempos = []
@@ -187,7 +208,9 @@ def main():
         ("Crear Orden", test_crear_orden, 10),
         ("Actualizar Orden", test_actualizar_orden, 10),
         ("Consulta Despachos Agrupados", test_consulta_despachos_agrupados, 10),
+        ("Consulta Despachos (puntero)", test_consulta_despachos_puntero, 10),
         ("Dashboard Stats", test_dashboard_stats, 10),
+        ("Dashboard Stats (precalculadas)", test_dashboard_stats_precalculadas, 10),
     ]
     
     resultados = []
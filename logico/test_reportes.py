@@ -0,0 +1,138 @@
+"""
+Pruebas de los Reportes Diarios Incrementales de LogiCo
+Ejecutar: python test_reportes.py
+
+Las señales de Despacho y OrdenMovimiento actualizan el Reporte del día al
+confirmar cada transacción (core.reportes). Estas pruebas hacen cambios sobre
+un día fijo del pasado y, después de cada uno, comparan la fila del Reporte
+con reportes.calcular_dias() para el mismo día: crear la fila en el mismo
+commit que el cambio, reemplazar la medición anterior de un despacho,
+ignorar un movimiento que llega fuera de orden y descontar un despacho
+eliminado. Los datos agregados se eliminan al final.
+"""
+
+import os
+import sys
+import django
+
+# Configurar Django
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logico.settings')
+django.setup()
+
+from datetime import date, datetime, time
+from django.db import transaction
+from django.utils import timezone
+from core import reportes
+from core.management.commands.importar_ordenes import fechas_historicas
+from core.models import UsuarioProfile, Orden, Despacho, OrdenMovimiento, Reporte
+
+DIA = date(2021, 3, 10)
+CLIENTE = 'Cliente Prueba Reportes'
+CAMPOS = [
+    'entregas_totales', 'entregas_exitosas', 'entregas_fallidas', 'tiempo_entrega_total',
+    'entregas_medidas', 'tiempo_promedio', 'ingresos_dia',
+]
+
+
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    BLUE = '\033[94m'
+    END = '\033[0m'
+
+
+def a_las(hora, minuto=0):
+    return timezone.make_aware(datetime.combine(DIA, time(hora, minuto)))
+
+
+def historicas():
+    """Crea filas con las fechas indicadas en lugar de la actual"""
+    return fechas_historicas(Despacho._meta.get_field('fecha'), OrdenMovimiento._meta.get_field('timestamp'))
+
+
+def movimiento(orden, repartidor, descripcion, timestamp, despacho=None):
+    with historicas():
+        return OrdenMovimiento.objects.create(
+            orden=orden, estado=orden.estado_actual, descripcion=descripcion,
+            repartidor=repartidor, despacho=despacho, timestamp=timestamp,
+        )
+
+
+def comparar(nombre):
+    """True si el Reporte del día coincide con el cálculo completo"""
+    reporte = Reporte.objects.filter(fecha=DIA).first()
+    esperado = reportes.calcular_dias(DIA, DIA)[DIA]
+    diferencias = {
+        campo: (getattr(reporte, campo, None), esperado[campo])
+        for campo in CAMPOS if reporte is None or getattr(reporte, campo) != esperado[campo]
+    }
+    if diferencias:
+        print(f"{Colors.RED}✗ FAIL: {nombre}{Colors.END}")
+        for campo, (incremental, completo) in diferencias.items():
+            print(f"    {campo}: incremental={incremental} completo={completo}")
+        return False
+    print(f"{Colors.GREEN}✓ PASS: {nombre} ({esperado['entregas_medidas']} medidas, "
+          f"promedio {esperado['tiempo_promedio']}){Colors.END}")
+    return True
+
+
+def main():
+    print(f"\n{Colors.BLUE}{'='*70}")
+    print("PRUEBAS DE REPORTES DIARIOS INCREMENTALES - LOGICO")
+    print(f"{'='*70}{Colors.END}\n")
+
+    repartidor = UsuarioProfile.objects.filter(rol='repartidor').first()
+    if not repartidor:
+        print(f"{Colors.RED}✗ Se necesita un repartidor (python manage.py seed_data){Colors.END}")
+        sys.exit(1)
+
+    resultados = []
+    try:
+        Reporte.objects.filter(fecha=DIA).delete()
+        with transaction.atomic():
+            # Sin fila del día: la crea el primer hook y los demás del mismo commit no la tocan
+            orden = Orden.objects.create(
+                cliente=CLIENTE, direccion='Calle Prueba 1', telefono_cliente='+56912345678',
+                responsable=repartidor,
+            )
+            movimiento(orden, repartidor, f'{reportes.PREFIJO_ASIGNACION}: prueba', a_las(10))
+            with historicas():
+                despacho = Despacho.objects.create(
+                    orden=orden, repartidor=repartidor, resultado='error', fecha=a_las(10, 5),
+                )
+            movimiento(orden, repartidor, 'Resultado: error', a_las(10, 30), despacho)
+        resultados.append(comparar('Fila creada en el mismo commit que el cambio'))
+
+        despacho.resultado = 'entregado'
+        despacho.save()
+        movimiento(orden, repartidor, 'Resultado: entregado', a_las(11), despacho)
+        resultados.append(comparar('Un segundo resultado reemplaza la medición anterior'))
+
+        movimiento(orden, repartidor, 'Resultado tardío', a_las(10, 45), despacho)
+        resultados.append(comparar('Un movimiento fuera de orden no cambia la medición'))
+
+        with historicas():
+            otro = Despacho.objects.create(
+                orden=orden, numero_despacho=None, repartidor=repartidor, resultado='no_disponible',
+                fecha=a_las(12),
+            )
+        movimiento(orden, repartidor, 'Resultado: no disponible', a_las(12, 20), otro)
+        resultados.append(comparar('Otro despacho de la misma orden suma su medición'))
+
+        despacho.delete()
+        resultados.append(comparar('Eliminar un despacho descuenta su conteo y su medición'))
+    finally:
+        Orden.objects.filter(cliente=CLIENTE).delete()
+        Reporte.objects.filter(fecha=DIA).delete()
+
+    print()
+    if not all(resultados):
+        print(f"{Colors.RED}✗ {resultados.count(False)} reportes no coinciden con el cálculo completo{Colors.END}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ Los reportes incrementales coinciden con el cálculo completo{Colors.END}")
+
+
+if __name__ == '__main__':
+    main()